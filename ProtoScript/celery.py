@@ -1,5 +1,6 @@
 import os
-from celery import Celery
+import time
+from celery import Celery, signals
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ProtoScript.settings')
@@ -15,6 +16,126 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django apps.
 app.autodiscover_tasks()
 
+
+def size_class_queues():
+    # One queue per size class and one for fanned-out segments. A worker
+    # started without -Q consumes all of them; separate pools use e.g.
+    # `-Q short,segments` and `-Q long,segments`.
+    from django.conf import settings
+    from kombu import Exchange, Queue
+    from protocols.core.queue.routing import get_size_classes
+    default = app.conf.task_default_queue
+    queues = [Queue(default, Exchange(default), routing_key=default)]
+    names = [size_class.name for size_class in get_size_classes()]
+    names.append(getattr(settings, 'FANOUT_QUEUE', 'segments'))
+    for name in dict.fromkeys(names):
+        if name != default:
+            queues.append(Queue(name, Exchange(name), routing_key=name, queue_arguments={'x-max-priority': 10}))
+    return queues
+
+
+app.conf.task_queues = size_class_queues()
+
+
+# Engine preloading / warm start. Weights are loaded in the main worker
+# process before the pool forks; the dummy inference runs in each pool
+# process (running torch kernels before a fork is not fork-safe).
+
+@signals.worker_init.connect
+def preload_stt_engine(**kwargs):
+    from django.conf import settings
+    from protocols.core.templates import get_template_registry
+    from protocols.worker import warmup
+    warmup.clear_ready()
+    get_template_registry().preload()
+    if getattr(settings, 'STT_PRELOAD', True):
+        warmup.preload_engine()
+    from protocols.worker import prefetch
+    if prefetch.prefetch_enabled():
+        prefetch.get_prefetcher().clear()
+    port = getattr(settings, 'WORKER_METRICS_PORT', None)
+    if port:
+        # Served by the main process; pool processes share theirs via METRICS_DIR
+        from protocols.core import metrics
+        metrics.serve(port, getattr(settings, 'METRICS_DIR', '') or None)
+
+
+@signals.worker_process_init.connect
+def warm_up_stt_engine(**kwargs):
+    from django.conf import settings
+    from protocols.core import metrics
+    from protocols.worker import warmup
+    # The counts copied from the main process are still reported by it
+    metrics.reset()
+    if getattr(settings, 'METRICS_DIR', ''):
+        metrics.start_snapshot_writer(settings.METRICS_DIR, getattr(settings, 'METRICS_SNAPSHOT_INTERVAL', 15.0))
+    if getattr(settings, 'STT_PRELOAD', True):
+        warmup.warm_up_engine()
+    warmup.mark_ready()
+
+
+@signals.worker_ready.connect
+def mark_worker_ready(sender=None, **kwargs):
+    # Pools without worker_process_init (e.g. threads) run jobs in this process
+    from django.conf import settings
+    from protocols.worker import warmup
+    if not warmup.is_warm() and getattr(settings, 'STT_PRELOAD', True):
+        from celery.concurrency.prefork import TaskPool
+        if isinstance(getattr(sender, 'pool', None), TaskPool):
+            return
+        warmup.warm_up_engine()
+        warmup.mark_ready()
+
+
+_job_started = {}
+
+
+@signals.task_prerun.connect
+def record_job_start(task_id=None, **kwargs):
+    _job_started[task_id] = time.perf_counter()
+
+
+@signals.task_postrun.connect
+def record_job_end(task_id=None, **kwargs):
+    from protocols.worker import warmup
+    started = _job_started.pop(task_id, None)
+    if started is not None:
+        warmup.record_job_duration(time.perf_counter() - started)
+    from django.conf import settings
+    if getattr(settings, 'METRICS_DIR', ''):
+        # Up to date as soon as the task is done, not only on the next tick
+        from protocols.core import metrics
+        metrics.write_snapshot(settings.METRICS_DIR)
+
+
+@signals.task_received.connect
+def prefetch_job_inputs(request=None, **kwargs):
+    # Runs in the main process as soon as a job is reserved, which with a
+    # prefetch multiplier above one is while the previous job still runs
+    from protocols.worker import prefetch
+    if request is not None and request.name == 'protocols.worker.tasks.process_protocol_task' \
+            and prefetch.prefetch_enabled() and request.args:
+        prefetch.get_prefetcher().schedule(request.args[0])
+
+
+@signals.worker_process_shutdown.connect
+@signals.worker_shutdown.connect
+def finish_uploads(**kwargs):
+    # Results still uploading in the background (JOB_ASYNC_UPLOAD)
+    from protocols.worker.uploader import drain_uploads
+    drain_uploads()
+
+
+@signals.worker_process_shutdown.connect
+def retire_process_metrics(**kwargs):
+    # After finish_uploads, which still counts jobs. Pool processes leave
+    # with os._exit, which skips the atexit hook.
+    from django.conf import settings
+    if getattr(settings, 'METRICS_DIR', ''):
+        from protocols.core import metrics
+        metrics.retire_process(settings.METRICS_DIR)
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -119,6 +119,44 @@ SPECTACULAR_SETTINGS = {
 # STT Settings
 STT_ENGINE = os.environ.get('STT_ENGINE', 'whisper')
 STT_MODEL = os.environ.get('STT_MODEL', 'openai/whisper-tiny')
+# Channel segments run through the model per batch (1 = one at a time)
+STT_BATCH_SIZE = int(os.environ.get('STT_BATCH_SIZE', '1'))
+# Transcribe channel segments on a local process pool of this size (0/1 = off)
+STT_WORKERS = int(os.environ.get('STT_WORKERS', '0'))
+# Artificial latency of the mock engine, in seconds per audio second
+STT_MOCK_LATENCY = float(os.environ.get('STT_MOCK_LATENCY', '0'))
+# Shared inference server (`manage.py run_inference_server`): workers with
+# STT_ENGINE=remote send their segments to the server on STT_SERVER_SOCKET,
+# which runs STT_SERVER_ENGINE and batches up to STT_SERVER_MAX_BATCH_SIZE
+# segments from all of them, waiting up to STT_SERVER_MAX_WAIT_MS for a
+# batch to fill
+STT_SERVER_SOCKET = os.environ.get('STT_SERVER_SOCKET', '/tmp/protoscript-stt.sock')
+STT_SERVER_ENGINE = os.environ.get('STT_SERVER_ENGINE', 'whisper')
+STT_SERVER_MAX_BATCH_SIZE = int(os.environ.get('STT_SERVER_MAX_BATCH_SIZE', '8'))
+STT_SERVER_MAX_WAIT_MS = float(os.environ.get('STT_SERVER_MAX_WAIT_MS', '10'))
+STT_SERVER_TIMEOUT = float(os.environ.get('STT_SERVER_TIMEOUT', '600'))
+
+# Audio decoding
+# Audio is decoded in windows of this many seconds per channel, which bounds
+# worker memory independently of the session length.
+AUDIO_WINDOW_SECONDS = float(os.environ.get('AUDIO_WINDOW_SECONDS', '120'))
+# Every window also decodes this many seconds of the next one, so a word cut
+# at a seam is heard whole; what both windows heard is kept once
+AUDIO_WINDOW_OVERLAP_SECONDS = float(os.environ.get('AUDIO_WINDOW_OVERLAP_SECONDS', '2'))
+# 'float32' or 'int16'
+AUDIO_DECODE_DTYPE = os.environ.get('AUDIO_DECODE_DTYPE', 'float32')
+
+# Voice activity detection ('none' or 'energy')
+VAD_ENGINE = os.environ.get('VAD_ENGINE', 'none')
+VAD_THRESHOLD_DB = float(os.environ.get('VAD_THRESHOLD_DB', '-45'))
+VAD_PADDING_MS = int(os.environ.get('VAD_PADDING_MS', '300'))
+VAD_MIN_SPEECH_MS = int(os.environ.get('VAD_MIN_SPEECH_MS', '250'))
+VAD_MIN_SILENCE_MS = int(os.environ.get('VAD_MIN_SILENCE_MS', '500'))
+
+# Protocol templates
+PROTOCOL_TEMPLATE_DIR = BASE_DIR / 'templates' / 'protocols'
+# Compiled template bytecode survives restarts here (empty to disable)
+TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR', '/tmp/protoscript-jinja-cache')
 
 # Celery Settings
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
@@ -127,8 +165,117 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Pool processes run a warm-up inference before reporting up; allow for it
+CELERY_WORKER_PROC_ALIVE_TIMEOUT = float(os.environ.get('CELERY_WORKER_PROC_ALIVE_TIMEOUT', '300'))
+# Jobs are acknowledged when they finish (acks_late), so their message stays
+# reserved while they run; Redis hands it out again after the visibility
+# timeout, which must exceed the longest job
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': int(os.environ.get('CELERY_VISIBILITY_TIMEOUT', '43200'))}
+# Job prefetch: workers download the inputs of jobs they have reserved into
+# JOB_PREFETCH_DIR while the current job runs, up to JOB_PREFETCH_MAX_BYTES
+# (0 disables it). A task waits up to JOB_PREFETCH_WAIT_SECONDS for a
+# prefetch that is still downloading.
+JOB_PREFETCH_DIR = os.environ.get('JOB_PREFETCH_DIR', '/tmp/protoscript-prefetch')
+JOB_PREFETCH_MAX_BYTES = int(os.environ.get('JOB_PREFETCH_MAX_BYTES', '0'))
+JOB_PREFETCH_WAIT_SECONDS = float(os.environ.get('JOB_PREFETCH_WAIT_SECONDS', '600'))
+# One reserved job per worker process, so a lost worker only returns that one;
+# with prefetch on, two, so the next job is known while one runs
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get(
+    'CELERY_WORKER_PREFETCH_MULTIPLIER', '2' if JOB_PREFETCH_MAX_BYTES > 0 else '1'
+))
+# Render and upload results on a background thread while the next job starts.
+# The task is acknowledged before the upload finishes, so a worker killed in
+# between is not redelivered and leaves the job 'processing'; at most
+# JOB_ASYNC_UPLOAD_MAX_PENDING uploads wait per process.
+JOB_ASYNC_UPLOAD = os.environ.get('JOB_ASYNC_UPLOAD', 'false').lower() in ('1', 'true', 'yes')
+JOB_ASYNC_UPLOAD_MAX_PENDING = int(os.environ.get('JOB_ASYNC_UPLOAD_MAX_PENDING', '1'))
+
+# Transcript cache ('none', 'disk' or 's3')
+# Keyed by channel audio hash and engine options; 's3' stores entries under
+# the cache/ prefix of S3_BUCKET_NAME.
+TRANSCRIPT_CACHE = os.environ.get('TRANSCRIPT_CACHE', 'none')
+TRANSCRIPT_CACHE_DIR = os.environ.get('TRANSCRIPT_CACHE_DIR', '/tmp/protoscript-cache')
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.environ.get('TRANSCRIPT_CACHE_MAX_BYTES', str(1024 ** 3)))
+
+# Worker warm start
+# Load and warm up the STT engine when the worker starts instead of on the first job
+STT_PRELOAD = os.environ.get('STT_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+# Written once the worker is warm; used by the k8s readiness probe
+WORKER_READY_FILE = os.environ.get('WORKER_READY_FILE', '/tmp/protoscript-worker-ready')
+
+# Metrics (Prometheus text format at /api/protocols/metrics/ and, on workers,
+# on WORKER_METRICS_PORT). Processes write their metrics to METRICS_DIR every
+# METRICS_SNAPSHOT_INTERVAL seconds so the scraped one reports them all; it
+# must be local to the host, as processes are told apart by pid. Leave it
+# empty to only report the scraped process.
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_SNAPSHOT_INTERVAL = float(os.environ.get('METRICS_SNAPSHOT_INTERVAL', '15'))
+WORKER_METRICS_PORT = int(os.environ['WORKER_METRICS_PORT']) if os.environ.get('WORKER_METRICS_PORT') else None
 
 # Queue Settings
 QUEUE_BACKEND = os.environ.get('QUEUE_BACKEND', 'celery')
+# 'local' backend: process pool size, SQLite journal, queue depth before
+# requests get 429, how long shutdown waits for running jobs, and how long
+# finished jobs stay in the journal
+LOCAL_QUEUE_WORKERS = int(os.environ.get('LOCAL_QUEUE_WORKERS', '2'))
+LOCAL_QUEUE_JOURNAL = os.environ.get('LOCAL_QUEUE_JOURNAL', '/tmp/protoscript-queue.sqlite3')
+LOCAL_QUEUE_MAX_DEPTH = int(os.environ.get('LOCAL_QUEUE_MAX_DEPTH', '100'))
+LOCAL_QUEUE_DRAIN_TIMEOUT = float(os.environ.get('LOCAL_QUEUE_DRAIN_TIMEOUT', '300'))
+LOCAL_QUEUE_RETENTION_SECONDS = float(os.environ.get('LOCAL_QUEUE_RETENTION_SECONDS', '86400'))
+QUEUE_RETRY_AFTER_SECONDS = int(os.environ.get('QUEUE_RETRY_AFTER_SECONDS', '30'))
+
+# Duration-aware routing
+# Estimated compute seconds per second of one audio channel
+JOB_COST_PER_AUDIO_SECOND = float(os.environ.get('JOB_COST_PER_AUDIO_SECOND', '0.1'))
+# Celery queue per size class, first match by estimated cost; the last one
+# takes the rest. Priority is passed on to the broker (RabbitMQ: higher runs
+# first), workers is the number of worker processes consuming the class.
+JOB_SIZE_CLASSES = [
+    {
+        'name': 'short',
+        'max_cost_seconds': float(os.environ.get('JOB_SHORT_MAX_COST_SECONDS', '120')),
+        'priority': 9,
+        'workers': int(os.environ.get('JOB_SHORT_WORKERS', '1')),
+    },
+    {
+        'name': 'long',
+        'max_cost_seconds': None,
+        'priority': 0,
+        'workers': int(os.environ.get('JOB_LONG_WORKERS', '1')),
+    },
+]
+
+# Backlog estimate (/api/protocols/backlog/ and the protoscript_backlog_*
+# metrics): weight of each finished job in the moving average of the
+# observed real-time factor, which replaces JOB_COST_PER_AUDIO_SECOND
+# once jobs have finished
+BACKLOG_RTF_SMOOTHING = float(os.environ.get('BACKLOG_RTF_SMOOTHING', '0.2'))
+
+# Segment fan-out
+# Recordings of at least this many seconds are transcribed as segment x
+# channel subtasks on any free worker and merged by a final task (Celery
+# queue backend only; 0 to disable)
+FANOUT_MIN_SECONDS = float(os.environ.get('FANOUT_MIN_SECONDS', '1800'))
+FANOUT_SEGMENT_SECONDS = float(os.environ.get('FANOUT_SEGMENT_SECONDS', '300'))
+# Audio shared by neighbouring segments on each side of a seam
+FANOUT_OVERLAP_SECONDS = float(os.environ.get('FANOUT_OVERLAP_SECONDS', '5'))
+# Celery queue of the subtasks and the merge; every worker pool must consume it
+FANOUT_QUEUE = os.environ.get('FANOUT_QUEUE', 'segments')
+
+# Job status store ('redis', 'memory' or 's3')
+# Live job status is kept here; S3 only receives the final status.json snapshot.
+STATUS_BACKEND = os.environ.get('STATUS_BACKEND', 'redis')
+STATUS_REDIS_URL = os.environ.get('STATUS_REDIS_URL', 'redis://localhost:6379/1')
+STATUS_TTL_SECONDS = int(os.environ.get('STATUS_TTL_SECONDS', str(7 * 24 * 3600)))
+# Upper bound for ?wait= long-polls and the keep-alive interval of the SSE stream
+RESULT_MAX_WAIT_SECONDS = float(os.environ.get('RESULT_MAX_WAIT_SECONDS', '60'))
+STATUS_STREAM_HEARTBEAT = float(os.environ.get('STATUS_STREAM_HEARTBEAT', '15'))
+
+# Uploads
+# Parallel S3 part uploads per streamed request
+S3_UPLOAD_CONCURRENCY = int(os.environ.get('S3_UPLOAD_CONCURRENCY', '4'))
+# Lifetime of presigned upload URLs and part size for presigned multipart uploads
+PRESIGNED_URL_EXPIRES = int(os.environ.get('PRESIGNED_URL_EXPIRES', '3600'))
+PRESIGNED_PART_SIZE = int(os.environ.get('PRESIGNED_PART_SIZE', str(64 * 1024 * 1024)))
 
 # S3 Settings are handled in protocols/s3_storage.py via environment variables
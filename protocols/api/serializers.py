@@ -1,4 +1,26 @@
 from rest_framework import serializers
+from protocols.core.templates import get_template_registry
+from protocols.core.tracks import track_name
+
+def validate_template_names(names):
+    registry = get_template_registry()
+    unknown = [name for name in names if not registry.exists(name)]
+    if unknown:
+        raise serializers.ValidationError(
+            f"Unknown template(s): {', '.join(unknown)}. Available: {', '.join(registry.names())}"
+        )
+
+def validate_track_names(file_names):
+    """
+    :return: The tracks' normalized ``<user_id>.<ext>`` names.
+    """
+    try:
+        names = [track_name(file_name) for file_name in file_names]
+    except ValueError as e:
+        raise serializers.ValidationError(str(e))
+    if len(set(names)) != len(names):
+        raise serializers.ValidationError("Every user can only have one audio track.")
+    return names
 
 class ProtocolRequestSerializer(serializers.Serializer):
     meta = serializers.FileField(
@@ -6,19 +28,119 @@ class ProtocolRequestSerializer(serializers.Serializer):
         help_text="The meta.json file containing user information and events."
     )
     audio = serializers.FileField(
-        required=True, 
-        help_text="The audio FLAC file to be transcribed."
+        required=False,
+        help_text="The audio FLAC file to be transcribed, one channel per user."
+    )
+    tracks = serializers.ListField(
+        child=serializers.FileField(),
+        required=False,
+        help_text="Instead of 'audio': one Ogg Opus/Vorbis (.ogg, .opus) or FLAC file per user, named "
+                  "'<user_id>.ogg' or '<name>_<user_id>.ogg'. Only the first channel of each is used."
     )
     template = serializers.CharField(
         required=False, 
         default='default.md.j2', 
         help_text="Name of the Jinja2 template to use for rendering (e.g., 'default.md.j2' or 'discord.md.j2')."
     )
+    templates = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        help_text="Several templates to render from the same transcription. The first one is the primary result; overrides 'template'."
+    )
+
+    def validate_template(self, value):
+        validate_template_names([value])
+        return value
+
+    def validate_templates(self, value):
+        validate_template_names(value)
+        return value
+
+    def validate_tracks(self, value):
+        validate_track_names(f.name for f in value)
+        return value
+
+    def validate(self, attrs):
+        if bool(attrs.get('audio')) == bool(attrs.get('tracks')):
+            raise serializers.ValidationError("Provide either 'audio' or 'tracks'.")
+        return attrs
+
+class ProtocolUploadRequestSerializer(serializers.Serializer):
+    template = serializers.CharField(
+        required=False,
+        default='default.md.j2',
+        help_text="Name of the Jinja2 template to use for rendering."
+    )
+    templates = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        help_text="Several templates to render from the same transcription; overrides 'template'."
+    )
+    audio_size = serializers.IntegerField(
+        required=False,
+        min_value=0,
+        help_text="Size of the audio file in bytes. Large files get presigned multipart part URLs."
+    )
+    tracks = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        help_text="Upload one file per user instead of audio.flac: their file names, e.g. '<user_id>.ogg'."
+    )
+
+    def validate_template(self, value):
+        validate_template_names([value])
+        return value
+
+    def validate_templates(self, value):
+        validate_template_names(value)
+        return value
+
+    def validate_tracks(self, value):
+        return validate_track_names(value)
+
+    def validate(self, attrs):
+        if attrs.get('tracks') and attrs.get('audio_size') is not None:
+            raise serializers.ValidationError("'audio_size' is for a single audio file, not 'tracks'.")
+        return attrs
+
+class PresignedUploadSerializer(serializers.Serializer):
+    key = serializers.CharField(help_text="Object key in the bucket.")
+    method = serializers.CharField(help_text="HTTP method to use with the URL(s).")
+    url = serializers.URLField(required=False, help_text="Presigned URL for a single PUT.")
+    upload_id = serializers.CharField(required=False, help_text="Multipart upload ID, if the file is uploaded in parts.")
+    part_size = serializers.IntegerField(required=False, help_text="Bytes per part (the last part may be smaller).")
+    parts = serializers.ListField(
+        child=serializers.DictField(),
+        required=False,
+        help_text="Presigned URL per part: {'part_number', 'url'}."
+    )
+
+class ProtocolUploadSerializer(serializers.Serializer):
+    id = serializers.UUIDField(help_text="Unique identifier for the protocol job.")
+    expires_in = serializers.IntegerField(help_text="Seconds until the URLs expire.")
+    meta = PresignedUploadSerializer(help_text="Where to PUT meta.json.")
+    audio = PresignedUploadSerializer(required=False, help_text="Where to PUT the audio file.")
+    tracks = serializers.DictField(
+        child=PresignedUploadSerializer(),
+        required=False,
+        help_text="Where to PUT each per-user file, by its normalized name '<user_id>.<ext>'."
+    )
+
+class UploadedPartSerializer(serializers.Serializer):
+    part_number = serializers.IntegerField(min_value=1)
+    etag = serializers.CharField(help_text="ETag returned by S3 for the part.")
+
+class ProtocolCommitRequestSerializer(serializers.Serializer):
+    parts = UploadedPartSerializer(
+        many=True,
+        required=False,
+        help_text="Uploaded audio parts, required for multipart uploads."
+    )
 
 class ProtocolJobSerializer(serializers.Serializer):
     id = serializers.UUIDField(help_text="Unique identifier for the protocol job.")
     status = serializers.ChoiceField(
-        choices=['pending', 'processing', 'completed', 'failed'],
+        choices=['uploading', 'pending', 'processing', 'completed', 'failed'],
         help_text="Current status of the job."
     )
     created_at = serializers.DateTimeField(required=False, help_text="Timestamp when the job was created.")
@@ -28,9 +150,101 @@ class ProtocolJobSerializer(serializers.Serializer):
 class ProtocolResultSerializer(serializers.Serializer):
     id = serializers.UUIDField(help_text="Unique identifier for the protocol job.")
     status = serializers.ChoiceField(
-        choices=['pending', 'processing', 'completed', 'failed'],
+        choices=['uploading', 'pending', 'processing', 'completed', 'failed'],
         help_text="Current status of the job."
     )
     result_markdown = serializers.CharField(required=False, help_text="The generated markdown protocol (only available if status is 'completed').")
+    results = serializers.DictField(
+        child=serializers.CharField(),
+        required=False,
+        help_text="Markdown per template name, if the job rendered several templates."
+    )
     error_message = serializers.CharField(required=False, help_text="Error message if the job failed.")
     completed_at = serializers.DateTimeField(required=False, help_text="Timestamp when the job was finished.")
+    parts_done = serializers.IntegerField(required=False, help_text="Parts (time window or segment x channel) transcribed so far.")
+    parts_total = serializers.IntegerField(required=False, help_text="Parts to transcribe in total.")
+    channels_total = serializers.IntegerField(required=False, help_text="Channels mapped to a user.")
+    audio_seconds_done = serializers.FloatField(required=False, help_text="Seconds of the recording transcribed so far.")
+    attempts = serializers.IntegerField(required=False, help_text="Processing attempts; above 1 after a worker was lost.")
+    audio_tracks = serializers.ListField(
+        child=serializers.CharField(),
+        required=False,
+        help_text="The per-user audio files, if the job was uploaded as tracks instead of one FLAC file."
+    )
+    predicted_remaining_seconds = serializers.FloatField(
+        required=False, help_text="Expected seconds until a pending or processing job is done, from the current backlog."
+    )
+    predicted_completion_at = serializers.DateTimeField(required=False, help_text="Expected completion time.")
+    timings = serializers.DictField(
+        child=serializers.FloatField(),
+        required=False,
+        help_text="Seconds per pipeline stage (download, decode, asr, render, upload, ...), summed over the subtasks of a fanned-out job."
+    )
+
+class ProtocolRenderRequestSerializer(serializers.Serializer):
+    templates = serializers.ListField(
+        child=serializers.CharField(),
+        min_length=1,
+        help_text="Templates to render from the job's stored transcript."
+    )
+
+    def validate_templates(self, value):
+        validate_template_names(value)
+        return value
+
+class ProtocolRenderResultSerializer(serializers.Serializer):
+    id = serializers.UUIDField(help_text="Unique identifier for the protocol job.")
+    results = serializers.DictField(
+        child=serializers.CharField(),
+        help_text="Rendered markdown per template name."
+    )
+
+class ProtocolTemplateListSerializer(serializers.Serializer):
+    templates = serializers.ListField(
+        child=serializers.CharField(),
+        help_text="Template names that can be passed as 'template' or 'templates'."
+    )
+
+class ProtocolJobListQuerySerializer(serializers.Serializer):
+    status = serializers.ChoiceField(
+        choices=['uploading', 'pending', 'processing', 'completed', 'failed'],
+        required=False,
+        help_text="Only jobs with this status."
+    )
+    guild_id = serializers.CharField(required=False, help_text="Only jobs of this guild.")
+    template = serializers.CharField(required=False, help_text="Only jobs whose primary template is this one.")
+    created_after = serializers.DateTimeField(required=False, help_text="Only jobs created at or after this time.")
+    created_before = serializers.DateTimeField(required=False, help_text="Only jobs created at or before this time.")
+    limit = serializers.IntegerField(required=False, default=50, min_value=1, max_value=500, help_text="Page size.")
+    cursor = serializers.CharField(required=False, help_text="The next_cursor of the previous page.")
+
+class ProtocolJobSummarySerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    status = serializers.CharField()
+    created_at = serializers.DateTimeField()
+    guild_id = serializers.CharField(required=False, allow_null=True)
+    template_name = serializers.CharField(required=False)
+    audio_seconds = serializers.FloatField(required=False, allow_null=True)
+    processing_seconds = serializers.FloatField(required=False, allow_null=True)
+
+class ProtocolJobListSerializer(serializers.Serializer):
+    jobs = ProtocolJobSummarySerializer(many=True, help_text="Jobs, newest first.")
+    next_cursor = serializers.CharField(allow_null=True, help_text="Cursor of the next page, null on the last one.")
+
+class ProtocolBacklogClassSerializer(serializers.Serializer):
+    workers = serializers.IntegerField(help_text="Worker processes consuming the class.")
+    queued_jobs = serializers.IntegerField()
+    queued_audio_seconds = serializers.FloatField(help_text="Audio seconds times channels of queued jobs.")
+    running_jobs = serializers.IntegerField()
+    running_audio_seconds = serializers.FloatField(help_text="Audio seconds times channels running jobs have left.")
+    compute_seconds = serializers.FloatField(help_text="Expected compute seconds of the queued and running audio.")
+    drain_seconds = serializers.FloatField(help_text="compute_seconds over the class's workers.")
+
+class ProtocolBacklogSerializer(serializers.Serializer):
+    rtf = serializers.FloatField(help_text="Observed compute seconds per second of one audio channel.")
+    queued_jobs = serializers.IntegerField()
+    queued_audio_seconds = serializers.FloatField()
+    running_jobs = serializers.IntegerField()
+    running_audio_seconds = serializers.FloatField()
+    compute_seconds = serializers.FloatField()
+    size_classes = serializers.DictField(child=ProtocolBacklogClassSerializer(), help_text="The same per size class.")
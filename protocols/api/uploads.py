@@ -0,0 +1,177 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from protocols.core.tracks import TRACK_HEAD_BYTES, TRACK_TAIL_BYTES, track_content_type, track_key, track_name
+
+# Multipart form field -> object name below jobs/<id>/
+JOB_UPLOAD_FIELDS = {
+    'meta': ('meta.json', 'application/json'),
+    'audio': ('audio.flac', 'audio/flac'),
+}
+# Field of the per-user audio files, each named after its user
+TRACKS_FIELD = 'tracks'
+
+
+class S3UploadedFile(UploadedFile):
+    """
+    Stand-in for an uploaded file whose bytes already went to S3. ``head``
+    keeps its first bytes, enough for the FLAC header, and ``tail`` the
+    last ones of a track, for the length of an Ogg stream. ``key`` is None
+    for a file that was refused and not stored.
+    """
+
+    def __init__(self, key, name, content_type, size, head=b'', tail=b''):
+        super().__init__(file=None, name=name, content_type=content_type, size=size)
+        self.key = key
+        self.head = head
+        self.tail = tail
+
+    def open(self, mode=None):
+        raise ValueError('The file was streamed to S3 and has no local content.')
+
+
+class _StreamingObject:
+    """
+    One object being written to S3. The first part is held back so small
+    files go out with a single put_object; larger ones become a multipart
+    upload whose parts are sent from the handler's thread pool while the
+    request body is still being read.
+    """
+
+    def __init__(self, handler, key, content_type, tail_bytes=0):
+        self.handler = handler
+        self.key = key
+        self.content_type = content_type
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.futures = []
+        self.size = 0
+        self.head = b''
+        self.tail = b''
+        self.tail_bytes = tail_bytes
+
+    def write(self, data):
+        if len(self.head) < TRACK_HEAD_BYTES:
+            self.head += bytes(data[:TRACK_HEAD_BYTES - len(self.head)])
+        if self.tail_bytes:
+            self.tail = (self.tail + bytes(data))[-self.tail_bytes:]
+        self.size += len(data)
+        self.buffer += data
+        if len(self.buffer) >= self.handler.storage.multipart_part_size:
+            self._flush_part()
+
+    def _flush_part(self):
+        storage = self.handler.storage
+        if self.upload_id is None:
+            self.upload_id = storage.create_multipart_upload(self.key, content_type=self.content_type)
+        part_number = len(self.futures) + 1
+        self.futures.append(self.handler.submit(
+            storage.upload_part, self.key, self.upload_id, part_number, bytes(self.buffer)
+        ))
+        self.buffer.clear()
+
+    def finish(self):
+        storage = self.handler.storage
+        if self.upload_id is None:
+            return self.handler.submit(storage.upload_bytes, self.key, bytes(self.buffer), self.content_type)
+        if self.buffer:
+            self._flush_part()
+        return self.handler.submit(self._complete)
+
+    def _complete(self):
+        parts = [future.result() for future in self.futures]
+        self.handler.storage.complete_multipart_upload(self.key, self.upload_id, parts)
+
+    def abort(self):
+        if self.upload_id is not None:
+            try:
+                self.handler.storage.abort_multipart_upload(self.key, self.upload_id)
+            except Exception:
+                pass
+
+
+class S3StreamingUploadHandler(FileUploadHandler):
+    """
+    Streams the job's ``meta`` and ``audio`` (or ``tracks``) form files
+    straight to ``jobs/<job_id>/`` in S3 while the request body is being
+    read, so nothing is spooled to memory or temp files and the files
+    upload concurrently. At most ``max_pending`` parts are buffered at a
+    time.
+    """
+
+    def __init__(self, storage, job_id, concurrency=4, request=None):
+        super().__init__(request)
+        self.storage = storage
+        self.job_id = job_id
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.pending = threading.BoundedSemaphore(concurrency * 2)
+        self.current = None
+        self.objects = []
+        self.completions = []
+
+    def submit(self, fn, *args):
+        # Back-pressure: wait for a slot before buffering another part
+        self.pending.acquire()
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self.pending.release())
+        return future
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.current = None
+        if field_name in JOB_UPLOAD_FIELDS:
+            name, default_type = JOB_UPLOAD_FIELDS[field_name]
+            self.current = _StreamingObject(self, f"jobs/{self.job_id}/{name}", content_type or default_type)
+            self.objects.append(self.current)
+        elif field_name == TRACKS_FIELD:
+            try:
+                name = track_name(file_name)
+            except ValueError:
+                # Left to the serializer to report
+                name = None
+            if name is not None:
+                self.current = _StreamingObject(
+                    self, track_key(self.job_id, name), track_content_type(name), tail_bytes=TRACK_TAIL_BYTES
+                )
+                self.objects.append(self.current)
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.current is not None:
+            self.current.write(raw_data)
+        # Nothing is passed on to other handlers
+
+    def file_complete(self, file_size):
+        if self.current is None:
+            if self.field_name == TRACKS_FIELD:
+                return S3UploadedFile(None, self.file_name, self.content_type, 0)
+            return None
+        obj = self.current
+        self.completions.append(obj.finish())
+        self.current = None
+        return S3UploadedFile(obj.key, self.file_name, self.content_type, obj.size, head=obj.head, tail=obj.tail)
+
+    def upload_complete(self):
+        self.wait()
+
+    def upload_interrupted(self):
+        self.abort()
+
+    def wait(self):
+        """
+        Blocks until every object is in S3; re-raises the first failure.
+        """
+        try:
+            for future in self.completions:
+                future.result()
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def abort(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        for obj in self.objects:
+            obj.abort()
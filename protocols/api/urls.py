@@ -1,10 +1,22 @@
 from django.urls import path
-from .views import ProtocolRequestView, ProtocolResultView
+from .views import (
+    ProtocolRequestView, ProtocolResultView, ProtocolRenderView, ProtocolTemplateListView,
+    ProtocolUploadView, ProtocolCommitView, ProtocolJobListView, ProtocolBacklogView,
+    protocol_events, metrics_view
+)
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
 urlpatterns = [
     path('request/', ProtocolRequestView.as_view(), name='protocol_request'),
+    path('uploads/', ProtocolUploadView.as_view(), name='protocol_upload'),
+    path('uploads/<uuid:job_id>/commit/', ProtocolCommitView.as_view(), name='protocol_commit'),
+    path('jobs/', ProtocolJobListView.as_view(), name='protocol_jobs'),
     path('result/<uuid:job_id>/', ProtocolResultView.as_view(), name='protocol_result'),
+    path('result/<uuid:job_id>/events/', protocol_events, name='protocol_events'),
+    path('render/<uuid:job_id>/', ProtocolRenderView.as_view(), name='protocol_render'),
+    path('templates/', ProtocolTemplateListView.as_view(), name='protocol_templates'),
+    path('backlog/', ProtocolBacklogView.as_view(), name='protocol_backlog'),
+    path('metrics/', metrics_view, name='protocol_metrics'),
     
     # OpenAPI Schema
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
@@ -1,79 +1,541 @@
-from django.http import HttpResponse, JsonResponse
+import asyncio
+import functools
+import hashlib
+from contextlib import aclosing
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, parsers
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 import json
 import os
 import threading
 from django.utils import timezone
-from .serializers import ProtocolRequestSerializer, ProtocolJobSerializer, ProtocolResultSerializer
+from .serializers import (
+    ProtocolRequestSerializer, ProtocolJobSerializer, ProtocolResultSerializer,
+    ProtocolRenderRequestSerializer, ProtocolRenderResultSerializer, ProtocolTemplateListSerializer,
+    ProtocolUploadRequestSerializer, ProtocolUploadSerializer, ProtocolCommitRequestSerializer,
+    ProtocolJobListQuerySerializer, ProtocolJobSummarySerializer, ProtocolJobListSerializer,
+    ProtocolBacklogSerializer
+)
+from .uploads import S3StreamingUploadHandler
 import uuid
+from protocols.core import metrics
 from protocols.core.s3_storage import S3Storage
+from protocols.core.queue.backlog import backlog_metrics, estimate_backlog, predict_completion
+from protocols.core.queue.base import QueueFull
 from protocols.core.queue.factory import get_queue_backend
+from protocols.core.queue.routing import classify, estimate_cost, expected_start_seconds
+from protocols.core.flac import STREAMINFO_BYTES, read_streaminfo
+from protocols.core.status.factory import get_status_store
+from protocols.core.templates import get_template_registry
+from protocols.core.tracks import (
+    TRACK_HEAD_BYTES, TRACK_TAIL_BYTES, combine_track_info, read_track_info, track_key, track_name
+)
+from protocols.core.utils import generate_protocol
+
+def get_job_status(job_id, storage):
+    # Live status from the status store, falling back to the final
+    # snapshot in S3 once the live entry has expired
+    job_id = str(job_id)
+    store = get_status_store()
+    status_data = store.get(job_id)
+    if status_data is None and not store.durable:
+        status_data = storage.get_status(job_id)
+    return status_data
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+def status_etag(status_data):
+    # The result body only changes together with the status, so the ETag
+    # can be derived without downloading the result
+    payload = json.dumps(status_data, sort_keys=True, default=str).encode('utf-8')
+    return f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+
+def if_none_match_tags(header):
+    # The entity tags listed in an If-None-Match header; weak ones compare
+    # like strong ones
+    tags = set()
+    for tag in (header or '').split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag:
+            tags.add(tag)
+    return tags
+
+def etag_matches(etag, header):
+    tags = if_none_match_tags(header)
+    return '*' in tags or etag in tags
+
+async def wait_for_status_change(job_id, known_etag, timeout):
+    """
+    Returns once the job's status no longer matches ``known_etag``, an
+    If-None-Match header (or, if that is None, once it changes from the
+    current one), or after ``timeout`` seconds.
+    """
+    store = get_status_store()
+    try:
+        async with asyncio.timeout(timeout):
+            async with aclosing(store.listen(job_id, heartbeat=timeout)) as statuses:
+                async for status_data in statuses:
+                    if status_data is None:
+                        # Unknown or expired; the regular lookup decides
+                        return
+                    etag = status_etag(status_data)
+                    if known_etag is None:
+                        if status_data.get('status') in TERMINAL_STATUSES:
+                            return
+                        known_etag = etag
+                    elif not etag_matches(etag, known_etag):
+                        return
+    except TimeoutError:
+        pass
+
+def read_stored_track_info(storage, key):
+    # The header and the last page, without downloading the whole track
+    size = storage.object_size(key)
+    head = storage.get_range(key, 0, TRACK_HEAD_BYTES)
+    tail = storage.get_range(key, max(0, size - TRACK_TAIL_BYTES), TRACK_TAIL_BYTES) if size else b''
+    return read_track_info(head, tail)
+
+def queue_full_response():
+    retry_after = getattr(settings, 'QUEUE_RETRY_AFTER_SECONDS', 30)
+    return Response(
+        {'error': 'Too many queued jobs, try again later'},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={'Retry-After': str(retry_after)}
+    )
+
+def enqueue_job(job_id, template_names, status_data=None, audio_info=None):
+    """
+    Marks the job as pending and hands it to the queue backend. With the
+    audio's FLAC header the job gets a cost estimate, which picks its size
+    class, and the expected wait before it starts.
+    """
+    store = get_status_store()
+    cost = estimate_cost(audio_info)
+    size_class = classify(cost)
+    audio_seconds = audio_info.duration * audio_info.channels if audio_info is not None else 0.0
+    status_data = dict(status_data or {}, **{
+        'id': job_id,
+        'status': 'pending',
+        'template_name': template_names[0],
+        'template_names': template_names,
+        'size_class': size_class.name,
+        'priority': size_class.priority,
+        'estimated_cost_seconds': cost,
+        'expected_start_seconds': expected_start_seconds(size_class, store.get_backlog().get(size_class.name))
+    })
+    if audio_info is not None:
+        status_data['audio_seconds'] = audio_info.duration
+        status_data['audio_channels'] = audio_info.channels
+    status_data.setdefault('created_at', timezone.now().isoformat())
+    store.update(job_id, status_data)
+
+    # Counted before the job is queued so a fast worker can't take it off first
+    store.adjust_backlog(size_class.name, 1, cost or 0.0, audio_seconds)
+    try:
+        queue = get_queue_backend()
+        queue.enqueue_protocol_job(job_id, template_name=template_names[0], template_names=template_names, cost=cost)
+    except Exception:
+        store.adjust_backlog(size_class.name, -1, -(cost or 0.0), -audio_seconds)
+        raise
+    return status_data
 
 class ProtocolRequestView(APIView):
     parser_classes = (parsers.MultiPartParser, parsers.FormParser)
 
     @extend_schema(
         summary="Request protocol generation",
-        description="Submit a new protocol processing job. Upload a meta.json and a FLAC audio file. Returns a job ID to track progress.",
+        description="Submit a new protocol processing job. Upload a meta.json and either a multi-channel FLAC audio file "
+                    "or one Opus/FLAC track per user. Returns a job ID to track progress.",
         request=ProtocolRequestSerializer,
         responses={202: ProtocolJobSerializer},
         tags=["Protocols"]
     )
     def post(self, request, *args, **kwargs):
-        serializer = ProtocolRequestSerializer(data=request.data)
-        if serializer.is_valid():
-            meta_file = serializer.validated_data['meta']
-            audio_file = serializer.validated_data['audio']
-            template_name = serializer.validated_data.get('template', 'default.md.j2')
+        # Refuse before the upload is read when the queue can't take more
+        if not get_queue_backend().has_capacity():
+            return queue_full_response()
+
+        job_id = str(uuid.uuid4())
+        storage = S3Storage()
 
-            job_id = str(uuid.uuid4())
-            storage = S3Storage()
+        # Stream meta and audio to S3 while the body is parsed, instead of
+        # letting Django spool them to temp files and re-uploading them
+        handler = S3StreamingUploadHandler(
+            storage, job_id,
+            concurrency=getattr(settings, 'S3_UPLOAD_CONCURRENCY', 4),
+            request=request._request
+        )
+        request._request.upload_handlers = [handler]
+        try:
+            serializer = ProtocolRequestSerializer(data=request.data)
+            valid = serializer.is_valid()
+        except Exception as e:
+            return Response({'error': f'Failed to upload to S3: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if valid:
+            template_name = serializer.validated_data.get('template', 'default.md.j2')
+            template_names = serializer.validated_data.get('templates') or [template_name]
+
+            tracks = serializer.validated_data.get('tracks')
+            if tracks:
+                audio_info = combine_track_info([
+                    read_track_info(getattr(f, 'head', b''), getattr(f, 'tail', b'')) for f in tracks
+                ])
+                job_data = {'audio_tracks': [track_name(f.name) for f in tracks]}
+            else:
+                audio_info = read_streaminfo(getattr(serializer.validated_data['audio'], 'head', b''))
+                job_data = None
             try:
-                # Upload files to S3
-                storage.upload_file(f"jobs/{job_id}/meta.json", meta_file)
-                storage.upload_file(f"jobs/{job_id}/audio.flac", audio_file)
-                
-                # Set initial status
-                status_data = {
-                    'id': job_id,
-                    'status': 'pending',
-                    'created_at': timezone.now().isoformat(),
-                    'template_name': template_name
-                }
-                storage.update_status(job_id, status_data)
+                status_data = enqueue_job(job_id, template_names, job_data, audio_info=audio_info)
+            except QueueFull:
+                get_status_store().delete(job_id)
+                storage.delete_job(job_id)
+                return queue_full_response()
             except Exception as e:
-                return Response({'error': f'Failed to upload to S3: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            # Start background processing
-            queue = get_queue_backend()
-            queue.enqueue_protocol_job(job_id, template_name=template_name)
+                return Response({'error': f'Failed to queue job: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
             return Response(status_data, status=status.HTTP_202_ACCEPTED)
-        
+
+        # The files were already streamed to S3 before the other fields were validated
+        try:
+            storage.delete_job(job_id)
+        except Exception:
+            pass
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class ProtocolUploadView(APIView):
+    @extend_schema(
+        summary="Start a direct-to-S3 upload",
+        description="Create a job and receive presigned URLs to PUT meta.json and the audio directly to S3. Large audio files get presigned multipart part URLs. With 'tracks', each per-user file gets its own URL instead. Call the commit endpoint afterwards.",
+        request=ProtocolUploadRequestSerializer,
+        responses={201: ProtocolUploadSerializer},
+        tags=["Protocols"]
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = ProtocolUploadRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        template_name = serializer.validated_data.get('template', 'default.md.j2')
+        template_names = serializer.validated_data.get('templates') or [template_name]
+        audio_size = serializer.validated_data.get('audio_size')
+        tracks = serializer.validated_data.get('tracks')
+        expires_in = getattr(settings, 'PRESIGNED_URL_EXPIRES', 3600)
+        part_size = getattr(settings, 'PRESIGNED_PART_SIZE', 64 * 1024 * 1024)
+
+        job_id = str(uuid.uuid4())
+        storage = S3Storage()
+        meta_key = f"jobs/{job_id}/meta.json"
+        audio_key = f"jobs/{job_id}/audio.flac"
+        status_data = {
+            'id': job_id,
+            'status': 'uploading',
+            'created_at': timezone.now().isoformat(),
+            'template_name': template_names[0],
+            'template_names': template_names
+        }
+
+        try:
+            response = {
+                'id': job_id,
+                'expires_in': expires_in,
+                'meta': {'key': meta_key, 'method': 'PUT', 'url': storage.presigned_put_url(meta_key, expires_in)},
+            }
+            if tracks:
+                response['tracks'] = {
+                    name: {
+                        'key': track_key(job_id, name),
+                        'method': 'PUT',
+                        'url': storage.presigned_put_url(track_key(job_id, name), expires_in)
+                    }
+                    for name in tracks
+                }
+                status_data['audio_tracks'] = tracks
+            elif audio_size and audio_size > part_size:
+                upload_id = storage.create_multipart_upload(audio_key, content_type='audio/flac')
+                part_count = -(-audio_size // part_size)
+                response['audio'] = {
+                    'key': audio_key,
+                    'method': 'PUT',
+                    'upload_id': upload_id,
+                    'part_size': part_size,
+                    'parts': storage.presigned_part_urls(audio_key, upload_id, part_count, expires_in)
+                }
+                status_data['audio_upload_id'] = upload_id
+            else:
+                response['audio'] = {'key': audio_key, 'method': 'PUT', 'url': storage.presigned_put_url(audio_key, expires_in)}
+            get_status_store().update(job_id, status_data)
+        except Exception as e:
+            return Response({'error': f'Failed to prepare upload: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response(response, status=status.HTTP_201_CREATED)
+
+class ProtocolCommitView(APIView):
+    @extend_schema(
+        summary="Commit a direct-to-S3 upload",
+        description="Check that meta.json and the audio (or every track) were uploaded, completing the multipart upload if one was used, and queue the job.",
+        request=ProtocolCommitRequestSerializer,
+        responses={202: ProtocolJobSerializer},
+        tags=["Protocols"]
+    )
+    def post(self, request, job_id, *args, **kwargs):
+        serializer = ProtocolCommitRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        job_id = str(job_id)
+        store = get_status_store()
+        status_data = store.get(job_id)
+        if not status_data:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        if status_data.get('status') != 'uploading':
+            return Response({'error': 'Job was already committed'}, status=status.HTTP_409_CONFLICT)
+
+        storage = S3Storage()
+        audio_key = f"jobs/{job_id}/audio.flac"
+        tracks = status_data.get('audio_tracks')
+        audio_keys = [track_key(job_id, name) for name in tracks] if tracks else [audio_key]
+        upload_id = status_data.get('audio_upload_id')
+        try:
+            if upload_id:
+                parts = serializer.validated_data.get('parts')
+                if not parts:
+                    return Response({'parts': ['Required for multipart uploads.']}, status=status.HTTP_400_BAD_REQUEST)
+                storage.complete_multipart_upload(audio_key, upload_id, [
+                    {'ETag': part['etag'], 'PartNumber': part['part_number']}
+                    for part in sorted(parts, key=lambda p: p['part_number'])
+                ])
+
+            missing = [
+                key for key in [f"jobs/{job_id}/meta.json", *audio_keys]
+                if not storage.object_exists(key)
+            ]
+        except Exception as e:
+            return Response({'error': f'Failed to verify upload: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if missing:
+            return Response({'error': 'Upload incomplete', 'missing': missing}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            if tracks:
+                audio_info = combine_track_info([read_stored_track_info(storage, key) for key in audio_keys])
+            else:
+                audio_info = read_streaminfo(storage.get_range(audio_key, 0, STREAMINFO_BYTES))
+        except Exception:
+            audio_info = None
+
+        job_data = {'created_at': status_data['created_at']}
+        if tracks:
+            job_data['audio_tracks'] = tracks
+        try:
+            status_data = enqueue_job(job_id, status_data['template_names'], job_data, audio_info=audio_info)
+        except QueueFull:
+            # The upload stays; the client can commit again later
+            store.update(job_id, {'status': 'uploading', 'audio_upload_id': None})
+            return queue_full_response()
+        return Response(status_data, status=status.HTTP_202_ACCEPTED)
+
 class ProtocolResultView(APIView):
+    @classmethod
+    def as_view(cls, **initkwargs):
+        """
+        Wraps the view for ``?wait=<seconds>``: the wait happens in an async
+        view so long-polling clients don't hold a worker thread under ASGI,
+        then the regular (sync) view answers.
+        """
+        view = super().as_view(**initkwargs)
+        sync_view = sync_to_async(view)
+
+        async def long_poll_view(request, job_id, *args, **kwargs):
+            wait = request.GET.get('wait')
+            if wait:
+                try:
+                    wait = min(float(wait), getattr(settings, 'RESULT_MAX_WAIT_SECONDS', 60))
+                except ValueError:
+                    return JsonResponse({'wait': ['A number of seconds is required.']}, status=400)
+                if wait > 0:
+                    await wait_for_status_change(str(job_id), request.headers.get('If-None-Match'), wait)
+            return await sync_view(request, job_id, *args, **kwargs)
+
+        return functools.update_wrapper(long_poll_view, view)
+
     @extend_schema(
         summary="Get protocol job result",
-        description="Retrieve the status or the final markdown result of a previously submitted protocol job.",
-        responses={200: ProtocolResultSerializer},
+        description="Retrieve the status or the final markdown result of a previously submitted protocol job. "
+                    "Responses carry an ETag; send it as If-None-Match to get 304 while nothing changed. "
+                    "With ?wait=<seconds> the request blocks until the status differs from If-None-Match "
+                    "(or from the status at request time).",
+        parameters=[OpenApiParameter('wait', float, description="Seconds to wait for a status change.")],
+        responses={200: ProtocolResultSerializer, 304: None},
         tags=["Protocols"]
     )
     def get(self, request, job_id, *args, **kwargs):
         storage = S3Storage()
-        status_data = storage.get_status(job_id)
+        status_data = get_job_status(job_id, storage)
         
         if not status_data:
             return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
 
+        etag = status_etag(status_data)
+        if etag_matches(etag, request.headers.get('If-None-Match')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
         if status_data.get('status') == 'completed':
             result_markdown = storage.get_result(job_id)
             status_data['result_markdown'] = result_markdown
-            return Response(status_data)
+            template_names = status_data.get('template_names') or []
+            if len(template_names) > 1:
+                status_data['results'] = {
+                    name: storage.get_result(job_id, template_name=name)
+                    for name in template_names
+                }
+        elif status_data.get('status') in ('pending', 'processing'):
+            # Derived from the current backlog, so not part of the ETag
+            prediction = predict_completion(status_data, estimate_backlog(get_status_store()), timezone.now())
+            status_data.update(prediction or {})
         
-        return Response(status_data)
+        return Response(status_data, headers={'ETag': etag})
+
+async def protocol_events(request, job_id):
+    """
+    Server-sent events of the job's status transitions, fed by the status
+    store's notifications. The stream ends after a terminal status.
+    """
+    job_id = str(job_id)
+    status_data = await sync_to_async(get_job_status, thread_sensitive=False)(job_id, S3Storage())
+    if not status_data:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    heartbeat = getattr(settings, 'STATUS_STREAM_HEARTBEAT', 15)
+
+    def event(data):
+        return f"id: {status_etag(data)}\nevent: status\ndata: {json.dumps(data)}\n\n"
+
+    async def stream():
+        if status_data.get('status') in TERMINAL_STATUSES:
+            yield event(status_data)
+            return
+        last = None
+        async with aclosing(get_status_store().listen(job_id, heartbeat=heartbeat)) as statuses:
+            async for current in statuses:
+                if current is None:
+                    # The live entry expired
+                    return
+                etag = status_etag(current)
+                if etag == last:
+                    yield ': keep-alive\n\n'
+                    continue
+                last = etag
+                yield event(current)
+                if current.get('status') in TERMINAL_STATUSES:
+                    return
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class ProtocolRenderView(APIView):
+    @extend_schema(
+        summary="Render stored transcript with other templates",
+        description="Render one or more templates from the transcript of a completed job, without running transcription again.",
+        request=ProtocolRenderRequestSerializer,
+        responses={200: ProtocolRenderResultSerializer},
+        tags=["Protocols"]
+    )
+    def post(self, request, job_id, *args, **kwargs):
+        serializer = ProtocolRenderRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        job_id = str(job_id)
+        storage = S3Storage()
+        transcriptions = storage.get_transcripts(job_id)
+        if transcriptions is None:
+            if not get_job_status(job_id, storage):
+                return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'error': 'Transcript not available yet'}, status=status.HTTP_409_CONFLICT)
+        meta_data = storage.get_meta(job_id)
+        if meta_data is None:
+            # Removed by cleanup_jobs after the transcript was read
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        registry = get_template_registry()
+        results = {
+            name: generate_protocol(meta_data, transcriptions, registry.get(name))
+            for name in serializer.validated_data['templates']
+        }
+        return Response({'id': job_id, 'results': results})
+
+class ProtocolBacklogView(APIView):
+    @extend_schema(
+        summary="Get the work backlog",
+        description="Queued and running work per size class in audio seconds times channels, and the compute "
+                    "seconds it takes at the observed real-time factor; for worker autoscaling.",
+        responses={200: ProtocolBacklogSerializer},
+        tags=["Protocols"]
+    )
+    def get(self, request, *args, **kwargs):
+        return Response(estimate_backlog(get_status_store()))
+
+class ProtocolTemplateListView(APIView):
+    @extend_schema(
+        summary="List protocol templates",
+        description="List the template names accepted by the request and render endpoints.",
+        responses={200: ProtocolTemplateListSerializer},
+        tags=["Protocols"]
+    )
+    def get(self, request, *args, **kwargs):
+        return Response({'templates': get_template_registry().names()})
+
+class ProtocolJobListView(APIView):
+    @extend_schema(
+        summary="List protocol jobs",
+        description="Jobs newest first, filtered by status, guild, template and creation time. "
+                    "Pages are read from the status store's index; pass next_cursor as cursor for the next one.",
+        parameters=[ProtocolJobListQuerySerializer],
+        responses={200: ProtocolJobListSerializer},
+        tags=["Protocols"]
+    )
+    def get(self, request, *args, **kwargs):
+        query = ProtocolJobListQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+
+        filters = {
+            'status': params.get('status'),
+            'guild_id': params.get('guild_id'),
+            'template_name': params.get('template'),
+        }
+        try:
+            jobs, next_cursor = get_status_store().list_jobs(
+                filters,
+                limit=params['limit'],
+                cursor=params.get('cursor'),
+                created_after=params.get('created_after'),
+                created_before=params.get('created_before')
+            )
+        except ValueError as e:
+            return Response({'cursor': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        except NotImplementedError as e:
+            return Response({'error': str(e)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        return Response({
+            'jobs': ProtocolJobSummarySerializer(jobs, many=True).data,
+            'next_cursor': next_cursor
+        })
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint: this process's metrics plus those the
+    other API and worker processes wrote to METRICS_DIR.
+    """
+    body = metrics.collect(getattr(settings, 'METRICS_DIR', '') or None)
+    body += metrics.render(backlog_metrics(estimate_backlog(get_status_store())))
+    return HttpResponse(body, content_type=metrics.CONTENT_TYPE)
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class ProtocolsConfig(AppConfig):
     name = 'protocols'
+
+    def ready(self):
+        from django.conf import settings
+        directory = getattr(settings, 'METRICS_DIR', '')
+        if directory:
+            # Every process shares its metrics with the one being scraped
+            from protocols.core import metrics
+            metrics.start_snapshot_writer(directory, getattr(settings, 'METRICS_SNAPSHOT_INTERVAL', 15.0))
@@ -0,0 +1,346 @@
+import base64
+import bisect
+import hashlib
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+S3_NS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class StubObject:
+    def __init__(self, body, content_type='binary/octet-stream', last_modified=None):
+        self.body = body
+        self.content_type = content_type
+        self.etag = f'"{hashlib.md5(body).hexdigest()}"'
+        self.last_modified = last_modified or datetime.now(timezone.utc)
+
+
+class S3Stub:
+    """
+    In-process S3 stand-in for benchmarks: path-style requests for one or
+    more buckets, with just enough of the API for S3Storage (objects,
+    ListObjectsV2, DeleteObjects, CopyObject and multipart uploads).
+    Not a conformance test target.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.buckets = {}
+        self.uploads = {}
+        # Sorted key index per bucket, rebuilt lazily after new keys appear;
+        # deleted keys stay in it and are skipped when listing
+        self._sorted_keys = {}
+        self.lock = threading.Lock()
+        self.request_count = 0
+        stub = self
+
+        class Handler(_Handler):
+            pass
+        Handler.stub = stub
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def create_bucket(self, name):
+        self.buckets.setdefault(name, {})
+
+    def put(self, bucket, key, body, last_modified=None, content_type='binary/octet-stream'):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        with self.lock:
+            objects = self.buckets.setdefault(bucket, {})
+            if key not in objects:
+                self._sorted_keys.pop(bucket, None)
+            objects[key] = StubObject(body, content_type, last_modified)
+
+    def sorted_keys(self, bucket):
+        with self.lock:
+            keys = self._sorted_keys.get(bucket)
+            if keys is None:
+                keys = self._sorted_keys[bucket] = sorted(self.buckets.get(bucket, {}))
+            return keys
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _iter_from(items, start):
+    for i in range(start, len(items)):
+        yield items[i]
+
+
+def _http_date(dt):
+    return dt.strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+
+def _iso_date(dt):
+    return dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, delayed
+    # ACKs add ~40ms to every keep-alive request
+    disable_nagle_algorithm = True
+    stub = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # Request plumbing
+
+    def _parse(self):
+        url = urlparse(self.path)
+        parts = url.path.lstrip('/').split('/', 1)
+        bucket = unquote(parts[0])
+        key = unquote(parts[1]) if len(parts) > 1 else ''
+        query = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        with self.stub.lock:
+            self.stub.request_count += 1
+        return bucket, key, query
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            return self._read_chunked()
+        data = self.rfile.read(length) if length else b''
+        if 'aws-chunked' in self.headers.get('Content-Encoding', '') or \
+                self.headers.get('x-amz-content-sha256', '').startswith('STREAMING-'):
+            return self._decode_aws_chunked(data)
+        return data
+
+    def _read_chunked(self):
+        data = b''
+        while True:
+            size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+            if size == 0:
+                while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                return data
+            data += self.rfile.read(size)
+            self.rfile.readline()
+
+    @staticmethod
+    def _decode_aws_chunked(data):
+        out, pos = b'', 0
+        while pos < len(data):
+            line_end = data.index(b'\r\n', pos)
+            size = int(data[pos:line_end].split(b';')[0], 16)
+            if size == 0:
+                break
+            out += data[line_end + 2:line_end + 2 + size]
+            pos = line_end + 2 + size + 2
+        return out
+
+    def _send(self, status, body=b'', headers=None, content_type='application/xml'):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _error(self, status, code, message=''):
+        self._send(status, f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code>'
+                           f'<Message>{escape(message)}</Message></Error>')
+
+    def _objects(self, bucket):
+        objects = self.stub.buckets.get(bucket)
+        if objects is None:
+            self._error(404, 'NoSuchBucket', bucket)
+        return objects
+
+    # Verbs
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        bucket, key, query = self._parse()
+        objects = self._objects(bucket)
+        if objects is None:
+            return
+        if not key:
+            return self._list_objects(bucket, objects, query)
+        obj = objects.get(key)
+        if obj is None:
+            return self._error(404, 'NoSuchKey', key)
+        body = obj.body
+        status = 200
+        headers = {'ETag': obj.etag, 'Last-Modified': _http_date(obj.last_modified), 'Accept-Ranges': 'bytes'}
+        range_header = self.headers.get('Range')
+        if range_header and range_header.startswith('bytes='):
+            start, _, end = range_header[6:].partition('-')
+            if start == '':
+                start, end = max(0, len(body) - int(end)), len(body) - 1
+            else:
+                start, end = int(start), int(end) if end else len(body) - 1
+            end = min(end, len(body) - 1)
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+            body = body[start:end + 1]
+            status = 206
+        self._send(status, body, headers, content_type=obj.content_type)
+
+    def do_PUT(self):
+        bucket, key, query = self._parse()
+        body = self._body()
+        objects = self._objects(bucket)
+        if objects is None:
+            return
+        if 'uploadId' in query:
+            upload = self.stub.uploads.get(query['uploadId'])
+            if upload is None:
+                return self._error(404, 'NoSuchUpload')
+            obj = StubObject(body)
+            upload['parts'][int(query['partNumber'])] = body
+            return self._send(200, headers={'ETag': obj.etag})
+        copy_source = self.headers.get('x-amz-copy-source')
+        if copy_source:
+            src_bucket, _, src_key = unquote(copy_source).lstrip('/').partition('/')
+            src = self.stub.buckets.get(src_bucket, {}).get(src_key)
+            if src is None:
+                return self._error(404, 'NoSuchKey', src_key)
+            content_type = self.headers.get('Content-Type', src.content_type)
+            self.stub.put(bucket, key, src.body, content_type=content_type)
+            obj = objects[key]
+            return self._send(200, f'<CopyObjectResult><ETag>{escape(obj.etag)}</ETag>'
+                                   f'<LastModified>{_iso_date(obj.last_modified)}</LastModified></CopyObjectResult>')
+        self.stub.put(bucket, key, body, content_type=self.headers.get('Content-Type', 'binary/octet-stream'))
+        self._send(200, headers={'ETag': objects[key].etag})
+
+    def do_DELETE(self):
+        bucket, key, query = self._parse()
+        objects = self._objects(bucket)
+        if objects is None:
+            return
+        if 'uploadId' in query:
+            self.stub.uploads.pop(query['uploadId'], None)
+        else:
+            with self.stub.lock:
+                objects.pop(key, None)
+        self._send(204)
+
+    def do_POST(self):
+        bucket, key, query = self._parse()
+        body = self._body()
+        objects = self._objects(bucket)
+        if objects is None:
+            return
+        if 'delete' in query:
+            return self._delete_objects(objects, body)
+        if 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            self.stub.uploads[upload_id] = {
+                'key': key, 'parts': {}, 'content_type': self.headers.get('Content-Type', 'binary/octet-stream')
+            }
+            return self._send(200, f'<InitiateMultipartUploadResult><Bucket>{escape(bucket)}</Bucket>'
+                                   f'<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>'
+                                   f'</InitiateMultipartUploadResult>')
+        if 'uploadId' in query:
+            upload = self.stub.uploads.pop(query['uploadId'], None)
+            if upload is None:
+                return self._error(404, 'NoSuchUpload')
+            data = b''.join(upload['parts'][n] for n in sorted(upload['parts']))
+            self.stub.put(bucket, key, data, content_type=upload['content_type'])
+            return self._send(200, f'<CompleteMultipartUploadResult><Bucket>{escape(bucket)}</Bucket>'
+                                   f'<Key>{escape(key)}</Key><ETag>{escape(objects[key].etag)}</ETag>'
+                                   f'</CompleteMultipartUploadResult>')
+        self._error(400, 'InvalidRequest')
+
+    # Bucket operations
+
+    def _list_objects(self, bucket, objects, query):
+        prefix = query.get('prefix', '')
+        delimiter = query.get('delimiter', '')
+        max_keys = int(query.get('max-keys', 1000))
+        token = query.get('start-after') or ''
+        if query.get('continuation-token'):
+            token = base64.urlsafe_b64decode(query['continuation-token']).decode('utf-8')
+
+        index = self.stub.sorted_keys(bucket)
+        start = bisect.bisect_right(index, token) if token > prefix else bisect.bisect_left(index, prefix)
+
+        contents, prefixes, last = [], [], None
+        truncated = False
+        for key in _iter_from(index, start):
+            if not key.startswith(prefix):
+                break
+            if key not in objects:
+                continue
+            if delimiter:
+                idx = key.find(delimiter, len(prefix))
+                if idx >= 0:
+                    common = key[:idx + len(delimiter)]
+                    if prefixes and prefixes[-1] == common:
+                        last = key
+                        continue
+                    if len(contents) + len(prefixes) >= max_keys:
+                        truncated = True
+                        break
+                    prefixes.append(common)
+                    last = key
+                    continue
+            if len(contents) + len(prefixes) >= max_keys:
+                truncated = True
+                break
+            contents.append(key)
+            last = key
+
+        xml = [f'<?xml version="1.0" encoding="UTF-8"?><ListBucketResult xmlns="{S3_NS}">',
+               f'<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(contents) + len(prefixes)}</KeyCount>',
+               f'<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{"true" if truncated else "false"}</IsTruncated>']
+        if truncated:
+            # A common prefix is exhausted only once we are past all its keys
+            next_token = last
+            if prefixes and last.startswith(prefixes[-1]):
+                next_token = prefixes[-1] + '￿'
+            # Opaque like S3's, the marker above is not valid in XML
+            next_token = base64.urlsafe_b64encode(next_token.encode('utf-8')).decode('ascii')
+            xml.append(f'<NextContinuationToken>{next_token}</NextContinuationToken>')
+        for key in contents:
+            obj = objects.get(key)
+            if obj is None:
+                continue
+            xml.append(f'<Contents><Key>{escape(key)}</Key><LastModified>{_iso_date(obj.last_modified)}</LastModified>'
+                       f'<ETag>{escape(obj.etag)}</ETag><Size>{len(obj.body)}</Size></Contents>')
+        for common in prefixes:
+            xml.append(f'<CommonPrefixes><Prefix>{escape(common)}</Prefix></CommonPrefixes>')
+        xml.append('</ListBucketResult>')
+        self._send(200, ''.join(xml))
+
+    def _delete_objects(self, objects, body):
+        root = ElementTree.fromstring(body)
+        deleted = []
+        with self.stub.lock:
+            for element in root.iter():
+                if element.tag.endswith('Key'):
+                    objects.pop(element.text, None)
+                    deleted.append(element.text)
+        xml = ''.join(f'<Deleted><Key>{escape(k)}</Key></Deleted>' for k in deleted)
+        self._send(200, f'<?xml version="1.0" encoding="UTF-8"?><DeleteResult xmlns="{S3_NS}">{xml}</DeleteResult>')
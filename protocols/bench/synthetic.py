@@ -0,0 +1,80 @@
+import resource
+from datetime import datetime, timedelta
+import numpy as np
+import soundfile as sf
+
+
+def _synthetic_blocks(duration_seconds, channels, samplerate, block_seconds, seed):
+    # Each channel alternates between short tone bursts ("speech") and
+    # silence, roughly like a per-speaker Discord recording
+    rng = np.random.default_rng(seed)
+    block_frames = int(block_seconds * samplerate)
+    total_frames = int(duration_seconds * samplerate)
+    t = np.arange(block_frames) / samplerate
+    written = 0
+    while written < total_frames:
+        n = min(block_frames, total_frames - written)
+        block = np.zeros((n, channels), dtype=np.float32)
+        for ch in range(channels):
+            if rng.random() < 0.3:
+                freq = 150 + 50 * ch
+                block[:, ch] = 0.2 * np.sin(2 * np.pi * freq * t[:n])
+        yield block
+        written += n
+
+
+def write_synthetic_flac(path, duration_seconds, channels, samplerate=48000, block_seconds=10, seed=0):
+    """
+    Writes a multi-channel FLAC file of ``duration_seconds`` block by block.
+    """
+    with sf.SoundFile(path, 'w', samplerate=samplerate, channels=channels, format='FLAC', subtype='PCM_16') as f:
+        for block in _synthetic_blocks(duration_seconds, channels, samplerate, block_seconds, seed):
+            f.write(block)
+
+
+def write_synthetic_tracks(paths, duration_seconds, samplerate=48000, block_seconds=10, seed=0):
+    """
+    The session of ``write_synthetic_flac`` as one mono Ogg Opus file per
+    channel, like the recorder's per-user tracks. Opus needs a sample rate
+    of 8, 12, 16, 24 or 48 kHz.
+    """
+    files = [
+        sf.SoundFile(path, 'w', samplerate=samplerate, channels=1, format='OGG', subtype='OPUS')
+        for path in paths
+    ]
+    try:
+        for block in _synthetic_blocks(duration_seconds, len(files), samplerate, block_seconds, seed):
+            for ch, f in enumerate(files):
+                f.write(block[:, ch])
+    finally:
+        for f in files:
+            f.close()
+
+
+def synthetic_meta(duration_seconds, speakers, events_per_minute=2.0, start=None):
+    """
+    meta.json data for a synthetic session: one user per channel and
+    ``events_per_minute`` bot events spread over the recording.
+    """
+    start = start or datetime(2026, 1, 30, 20, 0, 0)
+    n_events = max(1, int(duration_seconds / 60 * events_per_minute))
+    return {
+        'guild_id': 1,
+        'start_time': start.isoformat(),
+        'end_time': (start + timedelta(seconds=duration_seconds)).isoformat(),
+        'users': {str(100 + ch): {'name': f'Speaker{ch}', 'channel': ch} for ch in range(speakers)},
+        'events': [
+            {
+                'timestamp': (start + timedelta(seconds=duration_seconds * i / n_events)).isoformat(),
+                'message': f'Event {i}'
+            }
+            for i in range(n_events)
+        ],
+    }
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the current process in MiB (Linux reports KiB).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
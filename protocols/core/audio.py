@@ -0,0 +1,182 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import soundfile as sf
+from . import flac
+
+# Frames decoded per libsndfile read. Small enough to keep the transient
+# interleaved block negligible next to the per-channel window buffers.
+READ_BLOCK_FRAMES = 65536
+
+
+def mapped_channels(users, num_channels):
+    """
+    Returns the sorted list of channel indices referenced by ``users`` that
+    exist in a file with ``num_channels`` channels.
+    """
+    channels = set()
+    for user_info in users.values():
+        channel_idx = user_info.get('channel')
+        if channel_idx is not None and 0 <= channel_idx < num_channels:
+            channels.add(channel_idx)
+    return sorted(channels)
+
+
+def iter_channel_windows(audio_file_path, channels, window_seconds, dtype='float32', overlap_seconds=0.0):
+    """
+    Decodes ``audio_file_path`` block by block and yields
+    ``(start_seconds, {channel_idx: samples})`` windows of at most
+    ``window_seconds`` each. Only the requested channels are kept, so peak
+    memory is bounded by ``window_seconds * len(channels)`` samples no matter
+    how long the recording is.
+
+    With ``overlap_seconds`` every window but the last also holds that much
+    of the next one, so speech cut at a seam is heard whole once; windows
+    still start ``window_seconds`` apart (see
+    ``protocols.core.segments.merge_window_transcripts``).
+    """
+    with sf.SoundFile(audio_file_path) as f:
+        window_frames = max(1, int(window_seconds * f.samplerate))
+        overlap_frames = int(overlap_seconds * f.samplerate)
+        blocks = f.blocks(blocksize=min(READ_BLOCK_FRAMES, window_frames), dtype=dtype, always_2d=True)
+        yield from _collect_windows(blocks, f.samplerate, channels, window_frames, dtype, overlap_frames)
+
+
+def iter_track_windows(track_paths, window_seconds, dtype='float32', skip_frames=0, overlap_seconds=0.0):
+    """
+    ``iter_channel_windows`` for one file per channel, ``{channel_idx:
+    path}``, e.g. the per-user Opus tracks of a recording; only the first
+    channel of each file is used. Every file is decoded on a thread of its
+    own, and the next window of each is decoded while the caller works on
+    the current one. Files that end early are missing from the later
+    windows. The first ``skip_frames`` samples are dropped; window starts
+    are relative to the first sample kept.
+
+    :raises ValueError: If the files have different sample rates.
+    """
+    files = {}
+    try:
+        for channel_idx, path in sorted(track_paths.items()):
+            files[channel_idx] = sf.SoundFile(path)
+        samplerates = {f.samplerate for f in files.values()}
+        if len(samplerates) > 1:
+            raise ValueError(f"The audio tracks have different sample rates: {sorted(samplerates)}")
+        if not files:
+            return
+        samplerate = samplerates.pop()
+        window_frames = max(1, int(window_seconds * samplerate))
+        overlap_frames = int(overlap_seconds * samplerate)
+
+        def track_windows(f):
+            if skip_frames >= f.frames:
+                return
+            if skip_frames:
+                f.seek(skip_frames)
+            blocks = f.blocks(blocksize=min(READ_BLOCK_FRAMES, window_frames), dtype=dtype, always_2d=True)
+            for _, window in _collect_windows(blocks, samplerate, [0], window_frames, dtype, overlap_frames):
+                yield window[0]
+
+        tracks = {channel_idx: track_windows(f) for channel_idx, f in files.items()}
+        try:
+            with ThreadPoolExecutor(max_workers=len(tracks), thread_name_prefix='track-decode') as pool:
+                pending = {channel_idx: pool.submit(next, track, None) for channel_idx, track in tracks.items()}
+                window_start = 0
+                while pending:
+                    window = {}
+                    for channel_idx, future in pending.items():
+                        samples = future.result()
+                        if samples is not None:
+                            window[channel_idx] = samples
+                    if not window:
+                        return
+                    pending = {channel_idx: pool.submit(next, tracks[channel_idx], None) for channel_idx in window}
+                    yield window_start / samplerate, window
+                    window_start += window_frames
+        finally:
+            # The pool has waited for the decodes in flight
+            for track in tracks.values():
+                track.close()
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def iter_flac_range_windows(data, info, frames, channels, window_seconds, dtype='float32', skip_frames=0,
+                            overlap_seconds=0.0):
+    """
+    ``iter_channel_windows`` for ``data``, a run of ``frames`` samples of
+    whole FLAC frames cut from the stream described by ``info`` (see
+    ``protocols.core.flac``), e.g. bytes or an mmap. The first
+    ``skip_frames`` samples are dropped; window starts are relative to the
+    first sample kept.
+    """
+    window_frames = max(1, int(window_seconds * info.samplerate))
+    overlap_frames = int(overlap_seconds * info.samplerate)
+    blocks = _iter_flac_range_blocks(data, info, frames, min(READ_BLOCK_FRAMES, window_frames), dtype)
+    if skip_frames:
+        blocks = _skip(blocks, skip_frames)
+    yield from _collect_windows(blocks, info.samplerate, channels, window_frames, dtype, overlap_frames)
+
+
+def _iter_flac_range_blocks(data, info, frames, block_frames, dtype):
+    # libsndfile seeks by the absolute frame numbers in the frame headers,
+    # which don't match a cut-out run, so every block is decoded from its
+    # own header with a single read that never seeks
+    first = flac.parse_frame_header(data, 0, info)
+    if first is None:
+        raise ValueError('The audio range does not start at a FLAC frame')
+    view = memoryview(data)
+    read = lambda start, length: bytes(view[start:start + length])
+    block_start, end = flac.Frame(0, first), flac.Frame(len(data), first + frames)
+    while block_start.sample < end.sample:
+        block_end = end
+        if block_start.sample + block_frames < end.sample:
+            _, block_end = flac.locate_sample(read, block_start, end, info, block_start.sample + block_frames - 1)
+        n = block_end.sample - block_start.sample
+        header = flac.range_header(info, n)
+        with sf.SoundFile(io.BytesIO(header + view[block_start.offset:block_end.offset])) as f:
+            yield f.read(n, dtype=dtype, always_2d=True)
+        block_start = block_end
+
+
+def _skip(blocks, frames):
+    for block in blocks:
+        if frames >= len(block):
+            frames -= len(block)
+            continue
+        yield block[frames:]
+        frames = 0
+
+
+def _collect_windows(blocks, samplerate, channels, window_frames, dtype, overlap_frames=0):
+    # Windows start ``window_frames`` apart and run ``overlap_frames`` into
+    # the next one; the last one ends with the audio
+    window = None
+    filled = 0
+    carried = 0
+    window_start = 0
+
+    for block in blocks:
+        pos = 0
+        while pos < len(block):
+            if window is None:
+                # A fresh buffer per window: consumers may keep references
+                # to the yielded arrays after we move on.
+                window = np.empty((len(channels), window_frames + overlap_frames), dtype=dtype)
+            n = min(len(block) - pos, window_frames + overlap_frames - filled)
+            window[:, filled:filled + n] = block[pos:pos + n, channels].T
+            filled += n
+            pos += n
+            if filled == window_frames + overlap_frames:
+                yield window_start / samplerate, dict(zip(channels, window))
+                window_start += window_frames
+                tail = window[:, window_frames:]
+                window = None
+                filled = carried = overlap_frames
+                if overlap_frames:
+                    window = np.empty((len(channels), window_frames + overlap_frames), dtype=dtype)
+                    window[:, :overlap_frames] = tail
+
+    # A carried-over tail alone was already heard by the previous window
+    if filled > carried:
+        yield window_start / samplerate, dict(zip(channels, window[:, :filled]))
@@ -0,0 +1,30 @@
+import hashlib
+import json
+import numpy as np
+from abc import ABC, abstractmethod
+
+def transcript_cache_key(channel_data, samplerate, options):
+    """
+    Content address of a channel segment: hash of its PCM samples, the
+    sample format and rate, and the engine options that affect the output.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'samplerate': samplerate,
+        'dtype': channel_data.dtype.str,
+        'options': options,
+    }, sort_keys=True).encode('utf-8'))
+    digest.update(np.ascontiguousarray(channel_data))
+    return digest.hexdigest()
+
+class TranscriptCache(ABC):
+    @abstractmethod
+    def get(self, key):
+        """
+        :return: Cached list of {'type', 'timestamp', 'text'} segments, or None.
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key, transcripts):
+        pass
@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+from .base import TranscriptCache
+
+class DiskTranscriptCache(TranscriptCache):
+    """
+    Stores one JSON file per key below ``directory``. Reads bump the file's
+    mtime, and once the cache grows past ``max_bytes`` the least recently
+    used entries are removed until it is back under 90% of the limit.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                transcripts = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return transcripts
+
+    def set(self, key, transcripts):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(transcripts, f)
+        size = os.path.getsize(tmp_path)
+        try:
+            # The entry being replaced no longer counts
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        # Atomic, so concurrent workers never read a partial entry
+        os.replace(tmp_path, path)
+
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        else:
+            self._size += size - replaced
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
@@ -0,0 +1,18 @@
+from django.conf import settings
+
+def get_transcript_cache():
+    cache_type = getattr(settings, 'TRANSCRIPT_CACHE', 'none').lower()
+
+    if cache_type == 'none':
+        return None
+    elif cache_type == 'disk':
+        from .disk import DiskTranscriptCache
+        return DiskTranscriptCache(
+            directory=getattr(settings, 'TRANSCRIPT_CACHE_DIR', '/tmp/protoscript-cache'),
+            max_bytes=getattr(settings, 'TRANSCRIPT_CACHE_MAX_BYTES', 1024 ** 3)
+        )
+    elif cache_type == 's3':
+        from .s3 import S3TranscriptCache
+        return S3TranscriptCache()
+    else:
+        raise ValueError(f"Unknown Transcript Cache: {cache_type}")
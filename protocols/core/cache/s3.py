@@ -0,0 +1,30 @@
+import logging
+from botocore.exceptions import BotoCoreError, ClientError
+from protocols.core.s3_storage import S3Storage
+from .base import TranscriptCache
+
+logger = logging.getLogger(__name__)
+
+class S3TranscriptCache(TranscriptCache):
+    """
+    Shares cached transcripts between workers through the job bucket,
+    under the ``cache/`` prefix.
+    """
+
+    def __init__(self, storage=None, prefix='cache/'):
+        self.storage = storage or S3Storage()
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            return self.storage.download_json(f'{self.prefix}{key}.json')
+        except ClientError:
+            # NoSuchKey, or the cache is unreachable: treat both as a miss
+            return None
+
+    def set(self, key, transcripts):
+        try:
+            self.storage.upload_json(f'{self.prefix}{key}.json', transcripts)
+        except (BotoCoreError, ClientError) as e:
+            # The transcript is still returned; only later runs miss it
+            logger.warning("Could not cache transcript %s: %s", key, e)
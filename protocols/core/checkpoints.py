@@ -0,0 +1,49 @@
+class WindowCheckpoints:
+    """
+    The transcripts of each decoded window of a job, kept under
+    ``jobs/<id>/partial/`` as the windows complete so that a retry after a
+    crash only transcribes the windows that are missing.
+    """
+
+    def __init__(self, storage, job_id, window_seconds):
+        self.storage = storage
+        self.prefix = f"jobs/{job_id}/partial/window-"
+        self.window_seconds = window_seconds
+
+    def key(self, index):
+        return f"{self.prefix}{index:05d}.json"
+
+    def load(self):
+        """
+        :return: The checkpoints of the leading run of completed windows,
+                 in order. Checkpoints written with another window length
+                 don't line up with the windows and are ignored.
+        """
+        indices = set()
+        for key in self.storage.list_keys(self.prefix):
+            try:
+                indices.add(int(key[len(self.prefix):].split('.', 1)[0]))
+            except ValueError:
+                continue
+
+        checkpoints = []
+        while len(checkpoints) in indices:
+            checkpoint = self.storage.download_json(self.key(len(checkpoints)))
+            if checkpoint.get('window_seconds') != self.window_seconds:
+                return []
+            checkpoints.append(checkpoint)
+        return checkpoints
+
+    def save(self, index, start_seconds, transcripts, stats):
+        checkpoint = {
+            'index': index,
+            'start_seconds': start_seconds,
+            'window_seconds': self.window_seconds,
+            'transcripts': transcripts,
+            'stats': stats,
+        }
+        self.storage.upload_json(self.key(index), checkpoint)
+        return checkpoint
+
+    def delete(self, count):
+        self.storage.delete_keys([self.key(index) for index in range(count)])
@@ -1,24 +1,147 @@
+import time
 from abc import ABC, abstractmethod
+from protocols.core import metrics
+from protocols.core.cache.base import transcript_cache_key
 
 class STTEngine(ABC):
-    def transcribe(self, audio_data, samplerate, users):
+    # Optional protocols.core.vad.base.VAD; when set, only speech islands
+    # reach transcribe_channel.
+    vad = None
+    # Number of segments handed to transcribe_batch at once
+    batch_size = 1
+    # Optional protocols.core.cache.base.TranscriptCache consulted before
+    # transcribe_channel, and the engine options that go into its keys
+    cache = None
+    cache_options = {}
+
+    def transcribe(self, audio_data, samplerate, users, stats=None):
         """
         Transcribes audio data for the specified users by splitting into channels.
         """
+        channels = {
+            idx: audio_data[:, idx]
+            for idx in range(audio_data.shape[1])
+        }
+        return self.transcribe_windows([(0.0, channels)], samplerate, users, stats=stats)
+
+    def transcribe_windows(self, windows, samplerate, users, stats=None):
+        """
+        Transcribes a stream of ``(start_seconds, {channel_idx: samples})``
+        windows, as produced by ``protocols.core.audio.iter_channel_windows``.
+        Timestamps are shifted by the window start so they stay relative to
+        the beginning of the recording.
+
+        If ``stats`` is a dict it is filled with the audio/speech seconds seen
+        and, with a cache configured, cache hits/misses per channel.
+        """
+        if stats is None:
+            stats = {}
+        stats.setdefault('audio_seconds', 0.0)
+        stats.setdefault('speech_seconds', 0.0)
+
+        cache_stats = stats.setdefault('cache', {}) if self.cache is not None else None
+        cache_options = self.cache_key_options() if self.cache is not None else None
+        batch_size = max(1, self.batch_size)
         transcriptions = []
-        for user_id, user_info in users.items():
-            channel_idx = user_info.get('channel')
-            if channel_idx is not None and channel_idx < audio_data.shape[1]:
-                channel_data = audio_data[:, channel_idx]
-                channel_transcripts = self.transcribe_channel(channel_data, samplerate)
+        for window_start, channels in windows:
+            # Collect every segment of this window first so engines that
+            # support batching can run them through the model together.
+            items = []
+            for user_id, user_info in users.items():
+                channel_idx = user_info.get('channel')
+                channel_data = channels.get(channel_idx)
+                if channel_data is None:
+                    continue
+                stats['audio_seconds'] += len(channel_data) / samplerate
+                metrics.AUDIO_SECONDS.inc(len(channel_data) / samplerate)
+
+                for segment_start, segment_data in self.speech_segments(channel_data, samplerate):
+                    stats['speech_seconds'] += len(segment_data) / samplerate
+                    offset = window_start + segment_start / samplerate
+                    items.append((user_id, user_info, channel_idx, offset, segment_data))
+
+            results = [None] * len(items)
+            keys = [None] * len(items)
+            pending = []
+            for i, (_, _, channel_idx, _, segment_data) in enumerate(items):
+                if self.cache is not None:
+                    keys[i] = transcript_cache_key(segment_data, samplerate, cache_options)
+                    results[i] = self.cache.get(keys[i])
+                    channel_stats = cache_stats.setdefault(str(channel_idx), {'hits': 0, 'misses': 0})
+                    channel_stats['hits' if results[i] is not None else 'misses'] += 1
+                    metrics.TRANSCRIPT_CACHE.labels(result='hit' if results[i] is not None else 'miss').inc()
+                if results[i] is None:
+                    pending.append(i)
+
+            for b in range(0, len(pending), batch_size):
+                batch = pending[b:b + batch_size]
+                batch_results = self._timed_batch([items[i][4] for i in batch], samplerate)
+                for i, channel_transcripts in zip(batch, batch_results):
+                    results[i] = channel_transcripts
+                    if self.cache is not None:
+                        self.cache.set(keys[i], channel_transcripts)
+
+            for (user_id, user_info, _, offset, _), channel_transcripts in zip(items, results):
                 for t in channel_transcripts:
+                    t = dict(t)
                     t.update({
+                        'timestamp': t['timestamp'] + offset,
                         'user_id': user_id,
                         'user_name': user_info['name']
                     })
                     transcriptions.append(t)
+
+        stats['skipped_seconds'] = stats['audio_seconds'] - stats['speech_seconds']
+        stats['speech_ratio'] = stats['speech_seconds'] / stats['audio_seconds'] if stats['audio_seconds'] else 0.0
         return transcriptions
 
+    def cache_key_options(self):
+        """
+        The options that determine a transcript, which go into its cache
+        key; engines that don't run the model themselves ask the one that
+        does.
+        """
+        return self.cache_options
+
+    def metric_labels(self):
+        # The engine options set by the factory, else the class name
+        return {
+            'engine': self.cache_options.get('engine', type(self).__name__.lower()),
+            'model': self.cache_options.get('model', ''),
+        }
+
+    def _timed_batch(self, segments, samplerate):
+        start = time.perf_counter()
+        results = self.transcribe_batch(segments, samplerate)
+        seconds = time.perf_counter() - start
+        audio_seconds = sum(len(segment) for segment in segments) / samplerate
+        labels = self.metric_labels()
+        metrics.ASR_SECONDS.labels(**labels).inc(seconds)
+        metrics.ASR_AUDIO_SECONDS.labels(**labels).inc(audio_seconds)
+        if audio_seconds:
+            metrics.ASR_RTF.labels(**labels).observe(seconds / audio_seconds)
+        return results
+
+    def speech_segments(self, channel_data, samplerate):
+        """
+        Yields ``(start_sample, samples)`` for the parts of a channel that
+        should be transcribed: the whole channel without a VAD, otherwise
+        only the detected speech islands.
+        """
+        if self.vad is None:
+            yield 0, channel_data
+            return
+        for start, end in self.vad.detect(channel_data, samplerate):
+            yield start, channel_data[start:end]
+
+    def transcribe_batch(self, channels, samplerate):
+        """
+        Transcribes several channel segments, returning one transcript list
+        per input in the same order. Engines that can run a real batch
+        override this; the default transcribes them one after another.
+        """
+        return [self.transcribe_channel(channel_data, samplerate) for channel_data in channels]
+
     @abstractmethod
     def transcribe_channel(self, channel_data, samplerate):
         """
@@ -1,15 +1,56 @@
 import os
 from django.conf import settings
+from protocols.core.cache.factory import get_transcript_cache
+from protocols.core.vad.factory import get_vad
 
 def get_stt_engine():
+    engine = _build_engine()
+    engine.vad = get_vad()
+    engine.cache = get_transcript_cache()
+    # What determines a transcript; the batch size doesn't, so it is left out
+    engine.cache_options = {
+        'engine': getattr(settings, 'STT_ENGINE', 'whisper').lower(),
+        'model': getattr(settings, 'STT_MODEL', 'openai/whisper-tiny'),
+    }
+    return engine
+
+def _build_engine():
     engine_type = getattr(settings, 'STT_ENGINE', 'whisper').lower()
-    model_name = getattr(settings, 'STT_MODEL', 'openai/whisper-tiny')
-    
+    options = {
+        'model_name': getattr(settings, 'STT_MODEL', 'openai/whisper-tiny'),
+        'batch_size': getattr(settings, 'STT_BATCH_SIZE', 1),
+        'mock_latency': getattr(settings, 'STT_MOCK_LATENCY', 0.0),
+        'server_socket': getattr(settings, 'STT_SERVER_SOCKET', '/tmp/protoscript-stt.sock'),
+        'server_timeout': getattr(settings, 'STT_SERVER_TIMEOUT', 600.0),
+    }
+    workers = getattr(settings, 'STT_WORKERS', 0)
+
+    if workers > 1:
+        from .parallel import ParallelEngine
+        return ParallelEngine(engine_type, options, workers=workers)
+    return create_engine(engine_type, options)
+
+def create_engine(engine_type, options):
+    """
+    Instantiates an engine from plain options without touching Django
+    settings, so it can also run inside pool processes.
+    """
     if engine_type == 'whisper':
         from .whisper import WhisperEngine
-        return WhisperEngine(model_name=model_name)
+        return WhisperEngine(model_name=options['model_name'], batch_size=options['batch_size'])
     elif engine_type == 'mock':
         from .mock import MockEngine
-        return MockEngine()
+        return MockEngine(
+            batch_size=options['batch_size'],
+            latency=options.get('mock_latency', 0.0),
+            record=options.get('record', False)
+        )
+    elif engine_type == 'remote':
+        from .remote import RemoteEngine
+        return RemoteEngine(
+            socket_path=options['server_socket'],
+            batch_size=options['batch_size'],
+            timeout=options.get('server_timeout', 600.0)
+        )
     else:
         raise ValueError(f"Unknown STT Engine: {engine_type}")
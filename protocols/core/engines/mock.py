@@ -1,7 +1,29 @@
+import time
 from .base import STTEngine
 
 class MockEngine(STTEngine):
+    def __init__(self, batch_size=1, latency=0.0, record=False):
+        self.batch_size = batch_size
+        # Simulated inference cost in seconds per second of audio
+        self.latency = latency
+        self.record = record
+        # With ``record``, every channel segment handed to transcribe_channel,
+        # in call order, and the size of every transcribe_batch call, so
+        # tests can assert what actually reached the engine. Off by default,
+        # as a long-running worker would keep all its audio.
+        self.received_segments = []
+        self.received_batches = []
+
+    def transcribe_batch(self, channels, samplerate):
+        if self.record:
+            self.received_batches.append(len(channels))
+        return super().transcribe_batch(channels, samplerate)
+
     def transcribe_channel(self, channel_data, samplerate):
+        if self.record:
+            self.received_segments.append(channel_data)
+        if self.latency:
+            time.sleep(len(channel_data) / samplerate * self.latency)
         return [{
             'type': 'transcript',
             'timestamp': 1.0,
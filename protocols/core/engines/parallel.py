@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from .base import STTEngine
+
+# Engine owned by a pool process, created once by _init_worker
+_worker_engine = None
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _init_worker(engine_type, options, threads):
+    global _worker_engine
+    # Split the cores between pool processes instead of letting every
+    # process spin up one intra-op thread per core.
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    from .factory import create_engine
+    # Pool engines must not hold on to the shared memory they are given
+    _worker_engine = create_engine(engine_type, dict(options, record=False))
+
+
+def _transcribe_shared(segments, samplerate):
+    """
+    Runs in a pool process. ``segments`` are ``(shm_name, length, dtype)``
+    tuples describing arrays the parent placed in shared memory.
+    """
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in segments]
+    try:
+        channels = [
+            np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf)
+            for shm, (_, length, dtype) in zip(blocks, segments)
+        ]
+        results = _worker_engine.transcribe_batch(channels, samplerate)
+        del channels
+        return results
+    finally:
+        for shm in blocks:
+            shm.close()
+
+
+class ParallelEngine(STTEngine):
+    """
+    Spreads channel segments over a local process pool. Every pool process
+    loads its own engine once at start-up; segment audio is handed over
+    through shared memory rather than pickled through the pool's pipes.
+    """
+
+    def __init__(self, engine_type, options, workers):
+        self.engine_type = engine_type
+        self.options = options
+        self.workers = workers
+        self.inner_batch_size = max(1, options.get('batch_size', 1))
+        # Give the pool enough segments per call to keep every process busy
+        self.batch_size = self.workers * self.inner_batch_size
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                threads = max(1, available_cores() // self.workers)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    # Never fork a process that may already hold model threads
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.engine_type, self.options, threads)
+                )
+            return self._pool
+
+    def transcribe_batch(self, channels, samplerate):
+        blocks = []
+        try:
+            segments = []
+            for channel_data in channels:
+                channel_data = np.ascontiguousarray(channel_data)
+                shm = shared_memory.SharedMemory(create=True, size=max(1, channel_data.nbytes))
+                blocks.append(shm)
+                np.ndarray(channel_data.shape, dtype=channel_data.dtype, buffer=shm.buf)[:] = channel_data
+                segments.append((shm.name, len(channel_data), channel_data.dtype.str))
+
+            futures = [
+                self.pool.submit(_transcribe_shared, segments[i:i + self.inner_batch_size], samplerate)
+                for i in range(0, len(segments), self.inner_batch_size)
+            ]
+            results = []
+            for future in futures:
+                results.extend(future.result())
+            return results
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    def transcribe_channel(self, channel_data, samplerate):
+        return self.transcribe_batch([channel_data], samplerate)[0]
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
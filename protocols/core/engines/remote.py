@@ -0,0 +1,151 @@
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from .base import STTEngine
+
+# Messages are a 4-byte big-endian length, a JSON header of that length and
+# the binary payloads whose sizes the header lists under 'sizes'. A client
+# starts every connection with {'type': 'info'}, which the server answers with
+# the 'engine' and 'model' it runs; every other request is a batch.
+_LENGTH = struct.Struct('>I')
+
+
+def send_message(sock, header, payloads=()):
+    payloads = [memoryview(payload).cast('B') for payload in payloads]
+    header = json.dumps(dict(header, sizes=[len(payload) for payload in payloads])).encode('utf-8')
+    sock.sendall(_LENGTH.pack(len(header)) + header)
+    for payload in payloads:
+        sock.sendall(payload)
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError('The connection was closed mid-message')
+        received += count
+    return buffer
+
+
+def recv_message(sock):
+    """
+    :return: ``(header, payloads)``, or None if the peer closed the
+             connection between messages.
+    """
+    first = sock.recv(_LENGTH.size)
+    if not first:
+        return None
+    if len(first) < _LENGTH.size:
+        first += _recv_exactly(sock, _LENGTH.size - len(first))
+    (length,) = _LENGTH.unpack(first)
+    header = json.loads(_recv_exactly(sock, length).decode('utf-8'))
+    return header, [_recv_exactly(sock, size) for size in header.get('sizes', [])]
+
+
+class RemoteEngine(STTEngine):
+    """
+    Client of a local inference server (``manage.py run_inference_server``)
+    that owns the model, so worker processes don't each load a copy. VAD
+    and the transcript cache still run in the worker; only the speech
+    segments are sent, in one request per batch, as raw PCM over the Unix
+    socket. The server batches them with those of other workers.
+    """
+
+    def __init__(self, socket_path, batch_size=1, timeout=600.0, connect_timeout=60.0):
+        self.socket_path = socket_path
+        self.batch_size = batch_size
+        self.timeout = timeout
+        # The server may still be loading its model when workers start
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+    def _socket(self):
+        # One connection per thread, and never one inherited over a fork
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.sock = None
+            self._local.pid = os.getpid()
+        if self._local.sock is None:
+            sock = self._connect()
+            try:
+                send_message(sock, {'type': 'info'})
+                response = recv_message(sock)
+                if response is None:
+                    raise ConnectionError('The inference server closed the connection')
+            except OSError:
+                sock.close()
+                raise
+            self._local.info = {'engine': response[0]['engine'], 'model': response[0]['model']}
+            self._local.sock = sock
+        return self._local.sock
+
+    def server_info(self):
+        """
+        :return: The ``engine`` and ``model`` the inference server runs, as
+                 it answered when this thread connected.
+        """
+        self._socket()
+        return self._local.info
+
+    def cache_key_options(self):
+        # Transcripts are cached as the server's engine made them, so they
+        # are shared with workers running that engine themselves and not
+        # with a server that was restarted with another model
+        return self.server_info()
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None and self._local.pid == os.getpid():
+            sock.close()
+        self._local.sock = None
+
+    def _request(self, header, payloads):
+        try:
+            send_message(self._socket(), header, payloads)
+            response = recv_message(self._socket())
+            if response is None:
+                raise ConnectionError('The inference server closed the connection')
+            return response[0]
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+
+    def transcribe_batch(self, channels, samplerate):
+        channels = [np.ascontiguousarray(channel_data) for channel_data in channels]
+        header = {
+            'samplerate': samplerate,
+            'segments': [{'dtype': channel_data.dtype.str, 'length': len(channel_data)} for channel_data in channels],
+        }
+        try:
+            response = self._request(header, channels)
+        except ConnectionError:
+            # Once more on a fresh connection, e.g. after a server restart.
+            # Not after a timeout: the server may still be working on the
+            # batch, and sending it again would only queue it twice.
+            response = self._request(header, channels)
+        if 'error' in response:
+            raise RuntimeError(f"Inference server error: {response['error']}")
+        return response['results']
+
+    def transcribe_channel(self, channel_data, samplerate):
+        return self.transcribe_batch([channel_data], samplerate)[0]
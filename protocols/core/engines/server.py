@@ -0,0 +1,180 @@
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+from protocols.core import metrics
+from .remote import recv_message, send_message
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    """
+    One segment waiting for the model; the connection's thread waits on
+    ``done``.
+    """
+
+    def __init__(self, samples, samplerate):
+        self.samples = samples
+        self.samplerate = samplerate
+        self.queued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        inference = self.server.inference
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ConnectionError):
+                return
+            if message is None:
+                return
+            header, payloads = message
+            if header.get('type') == 'info':
+                try:
+                    send_message(self.request, inference.info())
+                except OSError:
+                    return
+                continue
+            try:
+                pending = [
+                    inference.submit(np.frombuffer(payload, dtype=np.dtype(segment['dtype'])), header['samplerate'])
+                    for segment, payload in zip(header['segments'], payloads)
+                ]
+                for item in pending:
+                    item.done.wait()
+                errors = [item.error for item in pending if item.error is not None]
+                if errors:
+                    response = {'error': str(errors[0])}
+                else:
+                    response = {'results': [item.result for item in pending]}
+            except Exception as e:
+                logger.exception("Bad inference request")
+                response = {'error': str(e)}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class InferenceServer:
+    """
+    Owns one engine and serves ``RemoteEngine`` clients over a Unix socket.
+    Segments from all connections go through one queue; the batching
+    thread takes up to ``max_batch_size`` of them, waiting at most
+    ``max_wait`` seconds after the first for more to arrive, and runs them
+    through ``transcribe_batch`` together.
+    """
+
+    def __init__(self, engine, socket_path, max_batch_size=8, max_wait=0.01):
+        self.engine = engine
+        self.socket_path = socket_path
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._server = None
+        self._threads = []
+
+    def info(self):
+        # What clients put in their transcript cache keys; the factory's
+        # options when the engine came from run_inference_server
+        return {
+            'engine': self.engine.cache_options.get('engine', type(self.engine).__name__.lower()),
+            'model': self.engine.cache_options.get('model', ''),
+        }
+
+    def submit(self, samples, samplerate):
+        item = _Pending(samples, samplerate)
+        self._queue.put(item)
+        return item
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        while not self._stopped.is_set():
+            batch = self._next_batch()
+            by_rate = defaultdict(list)
+            for item in batch:
+                by_rate[item.samplerate].append(item)
+            for samplerate, items in by_rate.items():
+                now = time.monotonic()
+                for item in items:
+                    metrics.INFERENCE_QUEUE_SECONDS.observe(now - item.queued_at)
+                metrics.INFERENCE_BATCH_SIZE.observe(len(items))
+                try:
+                    results = self.engine.transcribe_batch([item.samples for item in items], samplerate)
+                    for item, result in zip(items, results):
+                        item.result = result
+                except Exception as e:
+                    logger.exception("Inference batch of %d segments failed", len(items))
+                    for item in items:
+                        item.error = e
+                for item in items:
+                    item.done.set()
+
+    def _listen(self):
+        if os.path.exists(self.socket_path):
+            # Left behind by a previous server
+            os.unlink(self.socket_path)
+        self._server = _UnixServer(self.socket_path, _Handler)
+        self._server.inference = self
+        batcher = threading.Thread(target=self._batch_loop, name='inference-batcher', daemon=True)
+        batcher.start()
+        self._threads.append(batcher)
+
+    def serve_forever(self):
+        self._listen()
+        logger.info("Inference server listening on %s", self.socket_path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._close()
+
+    def start(self):
+        """
+        Serves from a background thread; for tests and embedding.
+        """
+        self._listen()
+        thread = threading.Thread(target=self._server.serve_forever, name='inference-server', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+        self._close()
+
+    def _close(self):
+        self._stopped.set()
+        if self._server is not None:
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
@@ -1,21 +1,49 @@
+import numpy as np
 import torch
 from transformers import pipeline
 from .base import STTEngine
 
 class WhisperEngine(STTEngine):
-    def __init__(self, model_name="openai/whisper-tiny", device=None):
+    # Whisper's receptive field; inputs are cut into chunks of this length
+    # so segments from different channels can share one padded batch. Used
+    # with and without batching, so the batch size doesn't change the output.
+    chunk_length_s = 30
+
+    def __init__(self, model_name="openai/whisper-tiny", device=None, batch_size=1):
         if device is None:
             device = 0 if torch.cuda.is_available() else -1
+        self.batch_size = batch_size
         self.asr = pipeline("automatic-speech-recognition", model=model_name, device=device)
 
     def transcribe_channel(self, channel_data, samplerate):
+        result = self.asr({"sampling_rate": samplerate, "raw": self._as_float(channel_data)}, **self._asr_kwargs())
+        return self._to_transcripts(result)
+
+    def transcribe_batch(self, channels, samplerate):
+        if self.batch_size <= 1:
+            return super().transcribe_batch(channels, samplerate)
+
+        inputs = [{"sampling_rate": samplerate, "raw": self._as_float(c)} for c in channels]
+        results = self.asr(inputs, batch_size=self.batch_size, **self._asr_kwargs())
+        return [self._to_transcripts(result) for result in results]
+
+    def _asr_kwargs(self):
+        return {"chunk_length_s": self.chunk_length_s, "return_timestamps": True}
+
+    @staticmethod
+    def _as_float(channel_data):
+        if channel_data.dtype == np.int16:
+            # The feature extractor expects float samples in [-1, 1]
+            return channel_data.astype(np.float32) / 32768.0
+        return channel_data
+
+    @staticmethod
+    def _to_transcripts(result):
         channel_transcripts = []
-        result = self.asr({"sampling_rate": samplerate, "raw": channel_data}, return_timestamps=True)
-        
         chunks = result.get('chunks', [])
         if not chunks and result.get('text'):
             chunks = [{'timestamp': (0.0, None), 'text': result['text']}]
-            
+
         for chunk in chunks:
             if chunk['timestamp'][0] is not None:
                 channel_transcripts.append({
@@ -0,0 +1,207 @@
+import struct
+from typing import NamedTuple
+
+# "fLaC" marker, one metadata block header and the STREAMINFO block, which
+# the format requires to come first
+STREAMINFO_BYTES = 4 + 4 + 34
+
+# Bytes fetched per ranged read while looking for frame boundaries; several
+# frames of any common encoding
+PROBE_BYTES = 64 * 1024
+
+_SAMPLE_RATES = {
+    1: 88200, 2: 176400, 3: 192000, 4: 8000, 5: 16000, 6: 22050,
+    7: 24000, 8: 32000, 9: 44100, 10: 48000, 11: 96000,
+}
+_SAMPLE_SIZES = {1: 8, 2: 12, 4: 16, 5: 20, 6: 24, 7: 32}
+
+
+class StreamInfo(NamedTuple):
+    samplerate: int
+    channels: int
+    bits_per_sample: int
+    # Samples per channel; 0 if the encoder didn't know it
+    frames: int
+    min_block_size: int = 0
+    max_block_size: int = 0
+
+    @property
+    def duration(self):
+        return self.frames / self.samplerate if self.samplerate else 0.0
+
+
+class Frame(NamedTuple):
+    # Byte offset of the frame header and number of its first sample
+    offset: int
+    sample: int
+
+
+def read_streaminfo(head):
+    """
+    Parses the STREAMINFO block from the first ``STREAMINFO_BYTES`` bytes
+    of a FLAC file, without decoding any audio.
+
+    :return: A ``StreamInfo``, or None if ``head`` is not a FLAC header.
+    """
+    if len(head) < STREAMINFO_BYTES or head[:4] != b'fLaC':
+        return None
+    block_type = head[4] & 0x7F
+    if block_type != 0:
+        return None
+    # After min/max block size (2+2 bytes) and min/max frame size (3+3
+    # bytes): 20 bits samplerate, 3 bits channels-1, 5 bits bits-1 and 36
+    # bits total samples
+    packed, = struct.unpack('>Q', head[18:26])
+    samplerate = packed >> 44
+    channels = ((packed >> 41) & 0x7) + 1
+    bits_per_sample = ((packed >> 36) & 0x1F) + 1
+    frames = packed & 0xFFFFFFFFF
+    min_block_size, max_block_size = struct.unpack('>HH', head[8:12])
+    return StreamInfo(samplerate, channels, bits_per_sample, frames, min_block_size, max_block_size)
+
+
+def audio_offset(read):
+    """
+    Walks the metadata block chain to the first audio frame.
+
+    :param read: ``read(start, length)`` returning bytes of the file.
+    :return: Byte offset of the first frame.
+    """
+    offset = 4
+    while True:
+        header = read(offset, 4)
+        if len(header) < 4:
+            raise ValueError('Truncated FLAC metadata')
+        offset += 4 + int.from_bytes(header[1:4], 'big')
+        if header[0] & 0x80:
+            return offset
+
+
+def _crc8(data):
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def parse_frame_header(buf, pos, info):
+    """
+    Checks for a frame header at ``buf[pos]``. Sync codes also occur in
+    compressed audio, so the header fields must agree with STREAMINFO and
+    its CRC-8 must match.
+
+    :return: Number of the frame's first sample, or None if there is no
+             valid header at ``pos``.
+    """
+    if len(buf) - pos < 6 or buf[pos] != 0xFF or buf[pos + 1] & 0xFE != 0xF8:
+        return None
+    variable = buf[pos + 1] & 0x01
+    block_code, rate_code = buf[pos + 2] >> 4, buf[pos + 2] & 0x0F
+    channel_code, size_code = buf[pos + 3] >> 4, (buf[pos + 3] >> 1) & 0x07
+    if block_code == 0 or rate_code == 15 or channel_code > 10 or size_code == 3 or buf[pos + 3] & 0x01:
+        return None
+    if rate_code in _SAMPLE_RATES and _SAMPLE_RATES[rate_code] != info.samplerate:
+        return None
+    if (channel_code + 1 if channel_code < 8 else 2) != info.channels:
+        return None
+    if size_code and _SAMPLE_SIZES[size_code] != info.bits_per_sample:
+        return None
+
+    # Frame or sample number, UTF-8 style: the leading ones of the first
+    # byte give the length in bytes
+    first = buf[pos + 4]
+    ones = 8 - (~first & 0xFF).bit_length()
+    if ones in (1, 8):
+        return None
+    length = max(1, ones)
+    if pos + 4 + length > len(buf):
+        return None
+    number = first & (0xFF >> (ones + 1))
+    for byte in buf[pos + 5:pos + 4 + length]:
+        if byte & 0xC0 != 0x80:
+            return None
+        number = (number << 6) | (byte & 0x3F)
+    end = pos + 4 + length
+    end += {6: 1, 7: 2}.get(block_code, 0)
+    end += {12: 1, 13: 2, 14: 2}.get(rate_code, 0)
+    if end >= len(buf) or _crc8(buf[pos:end]) != buf[end]:
+        return None
+
+    sample = number if variable else number * info.max_block_size
+    if info.frames and sample >= info.frames:
+        return None
+    return sample
+
+
+def iter_frames(buf, base, info):
+    """
+    Yields every ``Frame`` whose header lies entirely in ``buf``, which
+    holds the file from byte ``base``.
+    """
+    pos = buf.find(b'\xff')
+    while pos != -1:
+        sample = parse_frame_header(buf, pos, info)
+        if sample is not None:
+            yield Frame(base + pos, sample)
+        pos = buf.find(b'\xff', pos + 1)
+
+
+def locate_sample(read, lo, hi, info, sample):
+    """
+    Finds the frames around ``sample`` with a few ranged reads, guessing
+    its position from the average bitrate between the closest frames
+    seen so far.
+
+    :param read: ``read(start, length)`` returning bytes of the file.
+    :param lo: A frame at or before ``sample``, e.g. the first one (see
+               ``audio_offset``).
+    :param hi: A frame after ``sample``, or ``Frame(file_size,
+               info.frames)`` for the end of the stream.
+    :return: ``(before, after)``: the last frame starting at or before
+             ``sample`` and the next one.
+    """
+    if not lo.sample <= sample < hi.sample:
+        raise ValueError(f'Sample {sample} is outside frames {lo.sample}-{hi.sample}')
+    probe = PROBE_BYTES
+    while hi.offset - lo.offset > probe:
+        guess = lo.offset + (sample - lo.sample) * (hi.offset - lo.offset) // (hi.sample - lo.sample)
+        probe_start = min(max(lo.offset + 1, guess - probe // 2), hi.offset - probe)
+        narrowed = False
+        for frame in iter_frames(read(probe_start, probe), probe_start, info):
+            if frame.sample <= sample:
+                if frame.offset > lo.offset:
+                    lo, narrowed = frame, True
+            else:
+                if frame.offset < hi.offset:
+                    hi, narrowed = frame, True
+                break
+        if not narrowed:
+            # No frame boundary in the probe; read more at once
+            probe *= 2
+
+    # Close enough to read everything in between; a frame header takes
+    # at most 16 bytes
+    for frame in iter_frames(read(lo.offset, hi.offset - lo.offset + 16), lo.offset, info):
+        if frame.offset == lo.offset:
+            continue
+        if frame.sample > sample:
+            return lo, frame
+        lo = frame
+    return lo, hi
+
+
+def range_header(info, frames):
+    """
+    A "fLaC" marker and STREAMINFO for a run of whole frames cut from
+    ``info``'s stream, so the run decodes as a file of its own. The total
+    is set to the run's ``frames`` and the MD5 signature is cleared.
+    """
+    packed = (
+        (info.samplerate << 44) | ((info.channels - 1) << 41)
+        | ((info.bits_per_sample - 1) << 36) | frames
+    )
+    streaminfo = struct.pack('>HH', info.min_block_size, info.max_block_size) + bytes(6)
+    streaminfo += struct.pack('>Q', packed) + bytes(16)
+    return b'fLaC' + bytes([0x80]) + len(streaminfo).to_bytes(3, 'big') + streaminfo
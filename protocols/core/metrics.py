@@ -0,0 +1,518 @@
+import atexit
+import fcntl
+import glob
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; from a fraction of a second (S3 requests, small jobs) to hours
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+# How the values of one gauge in several processes are combined: one series
+# per process with a ``pid`` label, or a single min/max/sum
+GAUGE_MODES = ('all', 'min', 'max', 'sum')
+
+# Counts of processes that exited, in a METRICS_DIR
+EXITED_FILE = 'exited.json'
+
+
+class Metric:
+    """
+    A metric family in the process-wide registry; ``labels()`` returns the
+    series of one label combination. Values only live in this process,
+    see ``write_snapshot`` for prefork workers.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+        (REGISTRY if registry is None else registry).append(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            if key not in self._series:
+                self._series[key] = self._new_series()
+            return self._series[key]
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'type': self.type,
+                'help': self.documentation,
+                'labelnames': list(self.labelnames),
+                'series': [[list(key), series.value()] for key, series in self._series.items()],
+            }
+
+
+class _CounterSeries:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0.0
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self._value += amount
+
+    def value(self):
+        return self._value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def _new_series(self):
+        return _CounterSeries()
+
+    def inc(self, amount=1.0):
+        # For metrics without labels
+        self.labels().inc(amount)
+
+
+class _GaugeSeries(_CounterSeries):
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, multiprocess_mode='all'):
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError(f"Unknown gauge multiprocess mode: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_series(self):
+        return _GaugeSeries()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def snapshot(self):
+        return dict(super().snapshot(), multiprocess_mode=self.multiprocess_mode, pid=os.getpid())
+
+
+class _HistogramSeries:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self._counts = [0] * len(buckets)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def value(self):
+        # Per-bucket (not cumulative) counts, so snapshots add up
+        return {'buckets': list(self.buckets), 'counts': list(self._counts), 'sum': self._sum, 'count': self._count}
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+REGISTRY = []
+
+# Pipeline
+STAGE_SECONDS = Histogram(
+    'protoscript_stage_seconds',
+    'Wall time per pipeline stage of a job, or of one subtask of a fanned-out job.',
+    ['stage']
+)
+JOBS = Counter('protoscript_jobs_total', 'Jobs finished, by outcome.', ['status'])
+JOB_SECONDS = Histogram('protoscript_job_seconds', 'Wall time of a job attempt.', ['status'])
+AUDIO_SECONDS = Counter('protoscript_audio_seconds_total', 'Seconds of channel audio decoded for transcription.')
+
+# Worker start-up, per process
+COLD_START_SECONDS = Gauge(
+    'protoscript_worker_cold_start_seconds', 'Time to build the STT engine and load its weights.'
+)
+WARMUP_SECONDS = Gauge('protoscript_worker_warmup_seconds', 'Time of the dummy inference run before the first job.')
+FIRST_JOB_SECONDS = Gauge('protoscript_worker_first_job_seconds', 'Wall time of the first job of a worker process.')
+
+# Engines
+ASR_SECONDS = Counter('protoscript_asr_seconds_total', 'Seconds spent in STT inference.', ['engine', 'model'])
+ASR_AUDIO_SECONDS = Counter(
+    'protoscript_asr_audio_seconds_total', 'Seconds of speech handed to STT inference.', ['engine', 'model']
+)
+ASR_RTF = Histogram(
+    'protoscript_asr_rtf', 'Real-time factor (inference seconds per audio second) of each inference batch.',
+    ['engine', 'model'], buckets=RTF_BUCKETS
+)
+INFERENCE_BATCH_SIZE = Histogram(
+    'protoscript_inference_batch_size', 'Segments per batch run by the inference server.',
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+INFERENCE_QUEUE_SECONDS = Histogram(
+    'protoscript_inference_queue_seconds', 'Time segments waited in the inference server for a batch.'
+)
+TRANSCRIPT_CACHE = Counter('protoscript_transcript_cache_total', 'Transcript cache lookups.', ['result'])
+
+# Storage
+S3_REQUEST_SECONDS = Histogram('protoscript_s3_request_seconds', 'Latency of S3 calls.', ['operation'])
+S3_ERRORS = Counter('protoscript_s3_errors_total', 'S3 calls that raised.', ['operation'])
+S3_BYTES = Counter('protoscript_s3_bytes_total', 'Bytes moved to and from S3.', ['operation', 'direction'])
+
+
+class StageTimer:
+    """
+    Wall time per pipeline stage of one job. Stages may nest or interleave
+    (decoding happens while the ASR loop pulls the next window); time spent
+    in a nested stage is only counted there.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self._total = 0.0
+
+    def add(self, stage, seconds):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self._total += seconds
+
+    def _exclusive(self, stage, start, total_before):
+        elapsed = time.perf_counter() - start
+        self.add(stage, max(0.0, elapsed - (self._total - total_before)))
+
+    @contextmanager
+    def stage(self, stage):
+        start, total_before = time.perf_counter(), self._total
+        try:
+            yield
+        finally:
+            self._exclusive(stage, start, total_before)
+
+    def timed(self, iterable, stage):
+        """
+        Passes ``iterable`` through, counting the time spent producing each
+        item towards ``stage``.
+        """
+        iterator = iter(iterable)
+        while True:
+            start, total_before = time.perf_counter(), self._total
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exclusive(stage, start, total_before)
+            yield item
+
+    def observe(self):
+        for stage, seconds in self.seconds.items():
+            STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def snapshot(registry=None):
+    return {metric.name: metric.snapshot() for metric in (REGISTRY if registry is None else registry)}
+
+
+def reset(registry=None):
+    """
+    Drops every series, e.g. the counts a pool process inherited from the
+    process it was forked from, which that process still reports itself.
+    """
+    for metric in (REGISTRY if registry is None else registry):
+        metric.clear()
+
+
+def _per_process(family):
+    # A gauge kept per process gets the pid as its last label
+    pid = str(family.get('pid', ''))
+    return dict(
+        family,
+        labelnames=family['labelnames'] + ['pid'],
+        series=[[key + [pid], value] for key, value in family['series']]
+    )
+
+
+def merge(snapshots):
+    """
+    Combines snapshots of the same metrics taken in different processes:
+    counters and histograms are added up, gauges combined according to
+    their ``multiprocess_mode``.
+    """
+    merged = {}
+    for snap in snapshots:
+        for name, family in snap.items():
+            mode = family.get('multiprocess_mode', 'all')
+            if family['type'] == 'gauge' and mode == 'all':
+                family = _per_process(family)
+            target = merged.setdefault(name, dict(family, series=[]))
+            series = {tuple(key): value for key, value in target['series']}
+            for key, value in family['series']:
+                key = tuple(key)
+                if key not in series:
+                    series[key] = json.loads(json.dumps(value))
+                elif family['type'] == 'counter' or (family['type'] == 'gauge' and mode == 'sum'):
+                    series[key] += value
+                elif family['type'] == 'gauge':
+                    # The same process twice ('all') keeps its latest value
+                    series[key] = {'min': min, 'max': max}.get(mode, lambda _, new: new)(series[key], value)
+                else:
+                    current = series[key]
+                    current['counts'] = [a + b for a, b in zip(current['counts'], value['counts'])]
+                    current['sum'] += value['sum']
+                    current['count'] += value['count']
+            target['series'] = [[list(key), value] for key, value in series.items()]
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def render(snap):
+    """
+    :return: The snapshot in the Prometheus text exposition format.
+    """
+    lines = []
+    for name, family in sorted(snap.items()):
+        lines.append(f"# HELP {name} {_escape(family['help'])}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        names = family['labelnames']
+        for key, value in sorted(family['series'], key=lambda s: s[0]):
+            if family['type'] in ('counter', 'gauge'):
+                lines.append(f"{name}{_labels(names, key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(value['buckets'], value['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(names, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(names, key, [('le', '+Inf')])} {value['count']}")
+            lines.append(f"{name}_sum{_labels(names, key)} {_number(value['sum'])}")
+            lines.append(f"{name}_count{_labels(names, key)} {value['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+_write_lock = threading.Lock()
+_retired_pid = None
+
+
+@contextmanager
+def _locked(directory):
+    # Serialises reading and retiring snapshots across processes, so none
+    # is counted both on its own and in EXITED_FILE
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_json(directory, name, data, prefix):
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=prefix, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, os.path.join(directory, name))
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # Being replaced, or gone
+        return None
+
+
+def write_snapshot(directory):
+    """
+    Saves this process's metrics as ``<pid>.json`` in ``directory``, so
+    the process serving ``/metrics`` can include those of prefork pool
+    processes and other API workers (on the same host, as processes are
+    told apart by pid).
+    """
+    with _write_lock:
+        if _retired_pid != os.getpid():
+            _write_own(directory)
+
+
+def _write_own(directory):
+    os.makedirs(directory, exist_ok=True)
+    _write_json(directory, f'{os.getpid()}.json', snapshot(), f'{os.getpid()}.')
+
+
+def retire_snapshot(directory, pid):
+    """
+    Folds the counters and histograms in the snapshot of process ``pid``,
+    which exited, into ``EXITED_FILE``, so the totals keep counting them,
+    and removes the snapshot; its gauges are dropped.
+    """
+    with _locked(directory):
+        _retire(directory, pid)
+
+
+def _retire(directory, pid):
+    path = os.path.join(directory, f'{pid}.json')
+    for tmp in glob.glob(os.path.join(directory, f'{pid}.*.tmp')):
+        os.remove(tmp)
+    if not os.path.exists(path):
+        return
+    snap = _read_json(path) or {}
+    counts = {name: family for name, family in snap.items() if family['type'] != 'gauge'}
+    exited = _read_json(os.path.join(directory, EXITED_FILE)) or {}
+    _write_json(directory, EXITED_FILE, merge([exited, counts]), 'exited.')
+    os.remove(path)
+
+
+def retire_process(directory):
+    """
+    Stops sharing this process's metrics when it exits: its last counts
+    are folded into ``EXITED_FILE`` and later snapshots are skipped.
+    """
+    global _retired_pid
+    with _write_lock:
+        if _retired_pid == os.getpid():
+            return
+        _write_own(directory)
+        _retired_pid = os.getpid()
+    retire_snapshot(directory, os.getpid())
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_writer_pid = None
+
+
+def start_snapshot_writer(directory, interval=15.0):
+    """
+    Calls ``write_snapshot`` every ``interval`` seconds from a daemon
+    thread; once per process, as threads do not survive a fork. The
+    snapshot is retired when the process exits.
+    """
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(directory)
+            except OSError:
+                pass
+
+    _writer_pid = os.getpid()
+    threading.Thread(target=run, name='metrics-snapshot', daemon=True).start()
+    atexit.register(retire_process, directory)
+
+
+def collect(directory=None):
+    """
+    :return: This process's metrics combined with the snapshots of the
+             other processes in ``directory`` and the counts of those that
+             exited, in the text exposition format. Snapshots left by
+             processes that died without retiring them are retired here.
+    """
+    snapshots = [snapshot()]
+    if directory:
+        with _locked(directory):
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                name = os.path.basename(path)[:-len('.json')]
+                if not name.isdigit() or int(name) == os.getpid():
+                    continue
+                if not _alive(int(name)):
+                    _retire(directory, int(name))
+                    continue
+                snap = _read_json(path)
+                if snap is not None:
+                    snapshots.append(snap)
+            exited = _read_json(os.path.join(directory, EXITED_FILE))
+            if exited is not None:
+                snapshots.append(exited)
+    return render(merge(snapshots))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    directory = None
+
+    def do_GET(self):
+        body = collect(self.directory).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, directory=None, addr=''):
+    """
+    Serves ``collect(directory)`` over HTTP from a daemon thread, for
+    processes without a web server (Celery workers).
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'directory': directory})
+    server = ThreadingHTTPServer((addr, port), handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
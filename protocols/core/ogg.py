@@ -0,0 +1,69 @@
+import struct
+from .flac import StreamInfo
+
+# The first page holds the codec's identification header: 27 bytes of page
+# header, the one-entry segment table and the 19-byte OpusHead or 30-byte
+# Vorbis header
+HEAD_BYTES = 64
+# Enough for the whole last page (27 + 255 + 255 * 255 bytes at most),
+# whose granule position is the stream's length
+TAIL_BYTES = 65536
+
+_PAGE_HEADER = struct.Struct('<4sBBqIIIB')
+# Opus always counts granules at 48 kHz; libsndfile decodes at the rate of
+# the original input if it is one of these
+_OPUS_GRANULE_RATE = 48000
+_OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def _first_packet(head):
+    if len(head) < _PAGE_HEADER.size or head[:4] != b'OggS':
+        return None
+    segments = head[26]
+    return head[27 + segments:]
+
+
+def _last_granule(tail):
+    # The last page that ends a packet; pages without one have granule -1
+    end = len(tail)
+    while True:
+        start = tail.rfind(b'OggS', 0, end)
+        if start < 0:
+            return None
+        if start + _PAGE_HEADER.size <= len(tail):
+            _, version, _, granule, _, _, _, _ = _PAGE_HEADER.unpack_from(tail, start)
+            if version == 0 and granule >= 0:
+                return granule
+        end = start
+
+
+def read_ogg_info(head, tail):
+    """
+    Reads the length and format of an Ogg Opus or Ogg Vorbis file from its
+    first ``HEAD_BYTES`` and last ``TAIL_BYTES`` bytes, without decoding any
+    audio. ``bits_per_sample`` is 0; neither codec has one.
+
+    :return: A ``protocols.core.flac.StreamInfo``, or None if the bytes are
+             not from such a file.
+    """
+    packet = _first_packet(head)
+    if packet is None:
+        return None
+    if packet[:8] == b'OpusHead' and len(packet) >= 16:
+        channels = packet[9]
+        pre_skip, input_rate = struct.unpack('<HI', packet[10:16])
+        samplerate = input_rate if input_rate in _OPUS_RATES else _OPUS_GRANULE_RATE
+        granule = _last_granule(tail)
+        if granule is None:
+            return None
+        frames = max(0, granule - pre_skip) * samplerate // _OPUS_GRANULE_RATE
+    elif packet[:7] == b'\x01vorbis' and len(packet) >= 16:
+        channels = packet[11]
+        samplerate, = struct.unpack('<I', packet[12:16])
+        granule = _last_granule(tail)
+        if granule is None:
+            return None
+        frames = granule
+    else:
+        return None
+    return StreamInfo(samplerate, channels, 0, frames)
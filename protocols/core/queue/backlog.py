@@ -0,0 +1,149 @@
+from datetime import timedelta
+from django.conf import settings
+from protocols.core import metrics
+from .routing import get_size_classes
+
+
+def observed_rtf(store):
+    """
+    Compute seconds per second of one audio channel, as observed on
+    finished jobs; the configured estimate until there is one.
+    """
+    rtf = store.get_rtf()
+    if rtf is None:
+        return getattr(settings, 'JOB_COST_PER_AUDIO_SECOND', 0.1)
+    return rtf
+
+
+def job_channels(status_data):
+    # Mapped channels once the worker knows them, else those of the file
+    return status_data.get('channels_total') or status_data.get('audio_channels') or 1
+
+
+def remaining_audio_seconds(status_data):
+    """
+    :return: Seconds times channels of the job's audio not transcribed yet.
+    """
+    audio_seconds = status_data.get('audio_seconds') or 0.0
+    done = status_data.get('audio_seconds_done') or 0.0
+    return max(0.0, audio_seconds - done) * job_channels(status_data)
+
+
+def running_jobs(store):
+    """
+    :return: Status of every job being processed, from the store's index;
+             empty for stores that keep none.
+    """
+    jobs, cursor = [], None
+    try:
+        while True:
+            page, cursor = store.list_jobs(filters={'status': 'processing'}, limit=500, cursor=cursor)
+            jobs.extend(page)
+            if cursor is None:
+                return jobs
+    except NotImplementedError:
+        return []
+
+
+def estimate_backlog(store):
+    """
+    Work waiting for the workers per size class: queued jobs and the rest
+    of running ones, in audio seconds times channels and in compute
+    seconds at the observed real-time factor. ``drain_seconds`` is the
+    time the class's workers need for it.
+    """
+    rtf = observed_rtf(store)
+    classes = get_size_classes()
+    names = {size_class.name for size_class in classes}
+    queued = store.get_backlog()
+    estimate = {}
+    for size_class in classes:
+        entry = queued.get(size_class.name, {})
+        estimate[size_class.name] = {
+            'workers': size_class.workers,
+            'queued_jobs': max(0, entry.get('jobs', 0)),
+            'queued_audio_seconds': max(0.0, entry.get('audio_seconds', 0.0)),
+            'running_jobs': 0,
+            'running_audio_seconds': 0.0,
+        }
+    for status_data in running_jobs(store):
+        # Jobs queued under a class that no longer exists count as the catch-all
+        name = status_data.get('size_class') if status_data.get('size_class') in names else classes[-1].name
+        estimate[name]['running_jobs'] += 1
+        estimate[name]['running_audio_seconds'] += remaining_audio_seconds(status_data)
+
+    for size_class in classes:
+        entry = estimate[size_class.name]
+        entry['compute_seconds'] = (entry['queued_audio_seconds'] + entry['running_audio_seconds']) * rtf
+        entry['drain_seconds'] = entry['compute_seconds'] / size_class.workers
+    totals = {
+        field: sum(entry[field] for entry in estimate.values())
+        for field in ('queued_jobs', 'queued_audio_seconds', 'running_jobs', 'running_audio_seconds', 'compute_seconds')
+    }
+    return dict(totals, rtf=rtf, size_classes=estimate)
+
+
+def predict_completion(status_data, estimate, now):
+    """
+    Expected time until a pending or processing job is done: the rest of
+    its audio at the observed real-time factor, after (if still queued) a
+    share of its class's backlog. Every queued job of the class is assumed
+    to be ahead of it, so waits tend to be overestimated.
+
+    :return: Dict with ``predicted_remaining_seconds`` and
+             ``predicted_completion_at``, or None for finished jobs.
+    """
+    rtf = estimate['rtf']
+    classes = estimate['size_classes']
+    if status_data.get('status') == 'processing':
+        remaining = remaining_audio_seconds(status_data) * rtf
+        if status_data.get('fanout'):
+            # Its subtasks run on every free worker
+            remaining /= max(1, sum(entry['workers'] for entry in classes.values()))
+    elif status_data.get('status') == 'pending':
+        own = (status_data.get('audio_seconds') or 0.0) * job_channels(status_data) * rtf
+        entry = classes.get(status_data.get('size_class'))
+        ahead = max(0.0, entry['compute_seconds'] - own) / entry['workers'] if entry else 0.0
+        remaining = ahead + own
+    else:
+        return None
+    return {
+        'predicted_remaining_seconds': remaining,
+        'predicted_completion_at': (now + timedelta(seconds=remaining)).isoformat(),
+    }
+
+
+def backlog_metrics(estimate):
+    """
+    :return: A metrics snapshot of the estimate, for autoscalers. It is
+             computed from the shared status store on every scrape, so it
+             is not part of the per-process registry.
+    """
+    registry = []
+    jobs = metrics.Gauge(
+        'protoscript_backlog_jobs', 'Queued and running jobs.', ['size_class', 'state'], registry=registry
+    )
+    audio = metrics.Gauge(
+        'protoscript_backlog_audio_seconds', 'Audio seconds times channels left to transcribe.',
+        ['size_class', 'state'], registry=registry
+    )
+    compute = metrics.Gauge(
+        'protoscript_backlog_compute_seconds', 'Expected compute seconds of the backlog at the observed RTF.',
+        ['size_class'], registry=registry
+    )
+    drain = metrics.Gauge(
+        'protoscript_backlog_drain_seconds', "Time the class's workers need for its backlog.",
+        ['size_class'], registry=registry
+    )
+    rtf = metrics.Gauge(
+        'protoscript_observed_rtf', 'Compute seconds per second of one audio channel on finished jobs.',
+        registry=registry
+    )
+    for name, entry in estimate['size_classes'].items():
+        for state in ('queued', 'running'):
+            jobs.labels(size_class=name, state=state).set(entry[f'{state}_jobs'])
+            audio.labels(size_class=name, state=state).set(entry[f'{state}_audio_seconds'])
+        compute.labels(size_class=name).set(entry['compute_seconds'])
+        drain.labels(size_class=name).set(entry['drain_seconds'])
+    rtf.set(estimate['rtf'])
+    return metrics.snapshot(registry)
@@ -1,9 +1,26 @@
 from abc import ABC, abstractmethod
 
+class QueueFull(Exception):
+    """
+    Raised when a queue refuses a job to apply back-pressure.
+    """
+    pass
+
 class BaseQueue(ABC):
     @abstractmethod
-    def enqueue_protocol_job(self, job_id, template_name):
+    def enqueue_protocol_job(self, job_id, template_name, template_names=None, cost=None):
         """
-        Enqueues a protocol processing job.
+        Enqueues a protocol processing job. ``template_names`` optionally
+        renders several templates from the same transcription; ``cost`` is
+        the estimated compute time in seconds, if known.
+
+        :raises QueueFull: if the queue is at its depth limit.
         """
         pass
+
+    def has_capacity(self):
+        """
+        Cheap check before accepting an upload; ``enqueue_protocol_job``
+        may still raise ``QueueFull``.
+        """
+        return True
@@ -1,6 +1,15 @@
 from .base import BaseQueue
+from .routing import classify
 from protocols.worker.tasks import process_protocol_task
 
 class CeleryQueue(BaseQueue):
-    def enqueue_protocol_job(self, job_id, template_name):
-        process_protocol_task.delay(job_id, template_name=template_name)
+    def enqueue_protocol_job(self, job_id, template_name, template_names=None, cost=None):
+        # Each size class has its own queue, so short jobs don't wait
+        # behind long ones on shared workers
+        size_class = classify(cost)
+        process_protocol_task.apply_async(
+            args=(job_id,),
+            kwargs={'template_name': template_name, 'template_names': template_names},
+            queue=size_class.name,
+            priority=size_class.priority
+        )
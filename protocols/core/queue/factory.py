@@ -1,12 +1,32 @@
-import os
+import atexit
+import threading
 from django.conf import settings
-from .celery_queue import CeleryQueue
+
+_local_queue = None
+_lock = threading.Lock()
 
 def get_queue_backend():
     backend_type = getattr(settings, 'QUEUE_BACKEND', 'celery').lower()
     
     if backend_type == 'celery':
+        from .celery_queue import CeleryQueue
         return CeleryQueue()
+    elif backend_type == 'local':
+        return get_local_queue()
     else:
-        # Fallback to Celery
-        return CeleryQueue()
+        raise ValueError(f"Unknown Queue Backend: {backend_type}")
+
+def get_local_queue():
+    # One pool and journal owner per process
+    global _local_queue
+    with _lock:
+        if _local_queue is None:
+            from .local import LocalQueue
+            _local_queue = LocalQueue(
+                journal_path=getattr(settings, 'LOCAL_QUEUE_JOURNAL', '/tmp/protoscript-queue.sqlite3'),
+                workers=getattr(settings, 'LOCAL_QUEUE_WORKERS', 2),
+                max_depth=getattr(settings, 'LOCAL_QUEUE_MAX_DEPTH', 100),
+                retention_seconds=getattr(settings, 'LOCAL_QUEUE_RETENTION_SECONDS', 86400)
+            )
+            atexit.register(_local_queue.shutdown, getattr(settings, 'LOCAL_QUEUE_DRAIN_TIMEOUT', 300))
+        return _local_queue
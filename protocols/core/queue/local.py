@@ -0,0 +1,187 @@
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, wait
+from .base import BaseQueue, QueueFull
+
+logger = logging.getLogger(__name__)
+
+# Journal states; 'queued' rows (not finished, whether started or not) are
+# replayed on start-up
+QUEUED, DONE, FAILED = 'queued', 'done', 'failed'
+
+
+def _init_worker():
+    # Pool processes are spawned, so Django has to be set up again
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ProtoScript.settings')
+    django.setup()
+
+
+def run_protocol_job(job_id, template_name, template_names):
+    from protocols.worker.tasks import process_protocol_task
+    # Calling the task runs it in this process, no broker involved
+    process_protocol_task(job_id, template_name=template_name, template_names=template_names)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class LocalQueue(BaseQueue):
+    """
+    Runs jobs on a bounded local process pool, without a broker. Every job
+    is recorded in a SQLite journal before it is submitted, so jobs that
+    had not finished when their process stopped are submitted again by the
+    next LocalQueue on the same journal. Needs a status backend shared
+    between processes (redis or s3). With ``retention_seconds``, finished
+    jobs are purged from the journal that long after they finished, each
+    time a job finishes.
+    """
+
+    def __init__(self, journal_path, workers=2, max_depth=100, task=run_protocol_job, retention_seconds=None):
+        self.journal_path = journal_path
+        self.workers = workers
+        self.max_depth = max_depth
+        self.task = task
+        self.retention_seconds = retention_seconds
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._closed = False
+
+        directory = os.path.dirname(journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' job_id TEXT PRIMARY KEY, template_name TEXT NOT NULL, template_names TEXT,'
+                ' state TEXT NOT NULL, owner INTEGER, enqueued_at REAL NOT NULL, finished_at REAL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, enqueued_at)')
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+        self._recover()
+
+    def _connect(self):
+        # One short-lived connection per operation; sqlite3 connections
+        # must not be shared between threads
+        return sqlite3.connect(self.journal_path, timeout=30, isolation_level=None)
+
+    def _recover(self):
+        """
+        Takes over unfinished jobs of processes that are gone.
+        """
+        with closing(self._connect()) as db:
+            db.execute('BEGIN IMMEDIATE')
+            rows = db.execute(
+                'SELECT job_id, template_name, template_names, owner FROM jobs'
+                ' WHERE state = ? ORDER BY enqueued_at', (QUEUED,)
+            ).fetchall()
+            orphaned = [row for row in rows if row[3] != self.pid and not _pid_alive(row[3])]
+            db.executemany('UPDATE jobs SET owner = ? WHERE job_id = ?', [(self.pid, row[0]) for row in orphaned])
+            db.execute('COMMIT')
+        for job_id, template_name, template_names, _ in orphaned:
+            logger.info("Resuming journaled job %s", job_id)
+            self._submit(job_id, template_name, json.loads(template_names) if template_names else None)
+
+    def depth(self):
+        """
+        :return: Number of jobs queued or running on this queue.
+        """
+        with self._lock:
+            return len(self._futures)
+
+    def has_capacity(self):
+        return not self._closed and self.depth() < self.max_depth
+
+    def enqueue_protocol_job(self, job_id, template_name, template_names=None, cost=None):
+        # One pool serves every size class; jobs run in submission order
+        with self._lock:
+            if self._closed:
+                raise QueueFull("The local queue is shutting down")
+            if len(self._futures) >= self.max_depth:
+                raise QueueFull(f"The local queue is full ({self.max_depth} jobs)")
+            # Reserve the slot before the journal write
+            self._futures[job_id] = None
+        try:
+            with closing(self._connect()) as db:
+                db.execute(
+                    'INSERT OR REPLACE INTO jobs (job_id, template_name, template_names, state, owner, enqueued_at)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)',
+                    (job_id, template_name, json.dumps(template_names) if template_names else None,
+                     QUEUED, self.pid, time.time())
+                )
+        except Exception:
+            with self._lock:
+                self._futures.pop(job_id, None)
+            raise
+        self._submit(job_id, template_name, template_names)
+
+    def _submit(self, job_id, template_name, template_names):
+        future = self.executor.submit(self.task, job_id, template_name, template_names)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finished(job_id, f))
+
+    def _finished(self, job_id, future):
+        error = None
+        if not future.cancelled():
+            error = future.exception()
+            if error is not None:
+                logger.error("Local job %s failed: %s", job_id, error)
+        with self._lock:
+            # Journaled before the slot is freed, so once depth() drops the
+            # journal already has the outcome
+            if not future.cancelled():
+                with closing(self._connect()) as db:
+                    db.execute(
+                        'UPDATE jobs SET state = ?, finished_at = ? WHERE job_id = ?',
+                        (FAILED if error is not None else DONE, time.time(), job_id)
+                    )
+                if self.retention_seconds is not None:
+                    self.purge(self.retention_seconds)
+            # A cancelled job was not started before shutdown; it stays
+            # queued for the next start
+            self._futures.pop(job_id, None)
+
+    def shutdown(self, timeout=None):
+        """
+        Graceful drain: refuses new jobs, lets running ones finish (up to
+        ``timeout`` seconds) and leaves jobs that have not started in the
+        journal for the next start.
+        """
+        with self._lock:
+            self._closed = True
+            futures = [f for f in self._futures.values() if f is not None]
+        for future in futures:
+            future.cancel()
+        wait([f for f in futures if not f.cancelled()], timeout=timeout)
+        self.executor.shutdown(wait=timeout is None, cancel_futures=True)
+
+    def purge(self, older_than_seconds):
+        """
+        Removes finished jobs from the journal.
+        """
+        with closing(self._connect()) as db:
+            db.execute(
+                'DELETE FROM jobs WHERE state IN (?, ?) AND finished_at < ?',
+                (DONE, FAILED, time.time() - older_than_seconds)
+            )
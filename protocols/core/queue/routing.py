@@ -0,0 +1,55 @@
+from typing import NamedTuple, Optional
+from django.conf import settings
+
+
+class SizeClass(NamedTuple):
+    name: str
+    # Upper bound of the estimated cost; None for the catch-all class
+    max_cost_seconds: Optional[float]
+    priority: int
+    # Worker processes consuming the class, for start latency estimates
+    workers: int
+
+
+def get_size_classes():
+    return [
+        SizeClass(
+            name=entry['name'],
+            max_cost_seconds=entry.get('max_cost_seconds'),
+            priority=entry.get('priority', 0),
+            workers=max(1, entry.get('workers', 1))
+        )
+        for entry in getattr(settings, 'JOB_SIZE_CLASSES', [{'name': 'celery'}])
+    ]
+
+
+def estimate_cost(audio_info):
+    """
+    Estimated compute seconds for a recording, from its FLAC header.
+    """
+    if audio_info is None:
+        return None
+    per_second = getattr(settings, 'JOB_COST_PER_AUDIO_SECOND', 0.1)
+    return audio_info.duration * audio_info.channels * per_second
+
+
+def classify(cost):
+    """
+    :return: The first size class the cost fits in; jobs of unknown cost
+             go to the last class.
+    """
+    classes = get_size_classes()
+    if cost is not None:
+        for size_class in classes:
+            if size_class.max_cost_seconds is None or cost <= size_class.max_cost_seconds:
+                return size_class
+    return classes[-1]
+
+
+def expected_start_seconds(size_class, backlog):
+    """
+    Time until a job submitted now would start, if the class's workers
+    work through its queued cost in parallel.
+    """
+    queued_cost = max(0.0, (backlog or {}).get('cost_seconds', 0.0))
+    return queued_cost / size_class.workers
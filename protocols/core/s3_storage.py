@@ -1,36 +1,119 @@
 import boto3
+import functools
 import json
 import os
+import shutil
+import threading
+import time
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from django.conf import settings
+from protocols.core import metrics
+
+# S3 accepts at most 1000 keys per DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+
+# One client per process. boto3 clients are thread-safe and keep a pool of
+# keep-alive connections, so sharing one avoids credential resolution,
+# endpoint setup and TLS handshakes per request.
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def create_s3_client():
+    return boto3.session.Session().client(
+        's3',
+        endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+        aws_access_key_id=os.environ.get('S3_ACCESS_KEY'),
+        aws_secret_access_key=os.environ.get('S3_SECRET_KEY'),
+        region_name=os.environ.get('S3_REGION', 'us-east-1'),
+        config=Config(
+            max_pool_connections=int(os.environ.get('S3_MAX_POOL_CONNECTIONS', '32')),
+            tcp_keepalive=os.environ.get('S3_TCP_KEEPALIVE', 'true').lower() in ('1', 'true', 'yes'),
+            connect_timeout=float(os.environ.get('S3_CONNECT_TIMEOUT', '5')),
+            read_timeout=float(os.environ.get('S3_READ_TIMEOUT', '60')),
+            retries={
+                'max_attempts': int(os.environ.get('S3_MAX_ATTEMPTS', '5')),
+                'mode': os.environ.get('S3_RETRY_MODE', 'standard'),
+            }
+        )
+    )
+
+def get_s3_client():
+    global _client, _client_pid
+    with _client_lock:
+        # Connections must not be shared with a forked parent (Celery prefork)
+        if _client is None or _client_pid != os.getpid():
+            _client = create_s3_client()
+            _client_pid = os.getpid()
+        return _client
+
+def reset_s3_client():
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    # The lock may have been held by another thread at fork time
+    _client_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=reset_s3_client)
+
+def _instrumented(operation):
+    """
+    Records the latency of an S3Storage method, and whether it raised,
+    under ``operation``.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                metrics.S3_ERRORS.labels(operation=operation).inc()
+                raise
+            finally:
+                metrics.S3_REQUEST_SECONDS.labels(operation=operation).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def _count_bytes(operation, direction, size):
+    metrics.S3_BYTES.labels(operation=operation, direction=direction).inc(size)
+    return size
 
 class S3Storage:
+    # S3 requires every part but the last to be at least 5 MiB
+    multipart_part_size = 8 * 1024 * 1024
+
     def __init__(self):
         self.bucket_name = os.environ.get('S3_BUCKET_NAME', 'protoscript-protocols')
-        self.s3 = boto3.client(
-            's3',
-            endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
-            aws_access_key_id=os.environ.get('S3_ACCESS_KEY'),
-            aws_secret_access_key=os.environ.get('S3_SECRET_KEY'),
-            region_name=os.environ.get('S3_REGION', 'us-east-1')
-        )
+        self.s3 = get_s3_client()
 
+    @_instrumented('upload_json')
     def upload_json(self, key, data):
+        body = json.dumps(data).encode('utf-8')
         self.s3.put_object(
             Bucket=self.bucket_name,
             Key=key,
-            Body=json.dumps(data),
+            Body=body,
             ContentType='application/json'
         )
+        _count_bytes('upload_json', 'out', len(body))
 
+    @_instrumented('upload_file')
     def upload_file(self, key, file_obj):
         self.s3.upload_fileobj(file_obj, self.bucket_name, key)
 
+    @_instrumented('download_json')
     def download_json(self, key):
         response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
-        return json.loads(response['Body'].read().decode('utf-8'))
+        body = response['Body'].read()
+        _count_bytes('download_json', 'in', len(body))
+        return json.loads(body.decode('utf-8'))
 
+    @_instrumented('download_file')
     def download_file(self, key, local_path):
         self.s3.download_file(self.bucket_name, key, local_path)
+        _count_bytes('download_file', 'in', os.path.getsize(local_path))
 
     def get_status(self, job_id):
         key = f"jobs/{job_id}/status.json"
@@ -39,6 +122,10 @@ class S3Storage:
         except self.s3.exceptions.NoSuchKey:
             return None
 
+    def save_status(self, job_id, status_data):
+        # Durable snapshot of a job's final status, written without a read
+        self.upload_json(f"jobs/{job_id}/status.json", status_data)
+
     def update_status(self, job_id, status_data):
         key = f"jobs/{job_id}/status.json"
         # Merge with existing status if exists
@@ -46,20 +133,188 @@ class S3Storage:
         existing.update(status_data)
         self.upload_json(key, existing)
 
-    def save_result(self, job_id, markdown_content):
-        key = f"jobs/{job_id}/result.md"
+    @staticmethod
+    def _result_key(job_id, template_name=None):
+        if template_name is None:
+            return f"jobs/{job_id}/result.md"
+        return f"jobs/{job_id}/results/{template_name}.md"
+
+    @_instrumented('save_result')
+    def save_result(self, job_id, markdown_content, template_name=None):
+        key = self._result_key(job_id, template_name)
         self.s3.put_object(
             Bucket=self.bucket_name,
             Key=key,
             Body=markdown_content,
             ContentType='text/markdown'
         )
+        _count_bytes('save_result', 'out', len(markdown_content.encode('utf-8')))
 
-    def get_result(self, job_id):
-        key = f"jobs/{job_id}/result.md"
+    def save_result_stream(self, job_id, chunks, template_name=None):
+        """
+        Uploads an iterable of text chunks as the job result. Output that
+        fits in one part is sent with a single put_object, anything larger
+        goes through a multipart upload so only one part is held in memory.
+        """
+        key = self._result_key(job_id, template_name)
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            for chunk in chunks:
+                buffer += chunk.encode('utf-8')
+                if len(buffer) >= self.multipart_part_size:
+                    if upload_id is None:
+                        upload_id = self.create_multipart_upload(key, content_type='text/markdown')
+                    parts.append(self.upload_part(key, upload_id, len(parts) + 1, bytes(buffer)))
+                    buffer.clear()
+
+            if upload_id is None:
+                self.upload_bytes(key, bytes(buffer), content_type='text/markdown')
+                return
+
+            if buffer or not parts:
+                parts.append(self.upload_part(key, upload_id, len(parts) + 1, bytes(buffer)))
+            self.complete_multipart_upload(key, upload_id, parts)
+        except Exception:
+            if upload_id is not None:
+                self.abort_multipart_upload(key, upload_id)
+            raise
+
+    @_instrumented('upload_bytes')
+    def upload_bytes(self, key, body, content_type='binary/octet-stream'):
+        self.s3.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=body,
+            ContentType=content_type
+        )
+        _count_bytes('upload_bytes', 'out', len(body))
+
+    @_instrumented('create_multipart_upload')
+    def create_multipart_upload(self, key, content_type='binary/octet-stream'):
+        response = self.s3.create_multipart_upload(Bucket=self.bucket_name, Key=key, ContentType=content_type)
+        return response['UploadId']
+
+    @_instrumented('upload_part')
+    def upload_part(self, key, upload_id, part_number, body):
+        response = self.s3.upload_part(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+            PartNumber=part_number, Body=body
+        )
+        _count_bytes('upload_part', 'out', len(body))
+        return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+    @_instrumented('complete_multipart_upload')
+    def complete_multipart_upload(self, key, upload_id, parts):
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+
+    @_instrumented('abort_multipart_upload')
+    def abort_multipart_upload(self, key, upload_id):
+        self.s3.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+
+    def presigned_put_url(self, key, expires_in=3600):
+        return self.s3.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': self.bucket_name, 'Key': key},
+            ExpiresIn=expires_in
+        )
+
+    def presigned_part_urls(self, key, upload_id, part_count, expires_in=3600):
+        return [
+            {
+                'part_number': part_number,
+                'url': self.s3.generate_presigned_url(
+                    'upload_part',
+                    Params={'Bucket': self.bucket_name, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+                    ExpiresIn=expires_in
+                )
+            }
+            for part_number in range(1, part_count + 1)
+        ]
+
+    @_instrumented('get_range')
+    def get_range(self, key, start, length):
+        """
+        :return: Up to ``length`` bytes of the object from offset ``start``.
+        """
+        response = self.s3.get_object(Bucket=self.bucket_name, Key=key, Range=f'bytes={start}-{start + length - 1}')
+        data = response['Body'].read()
+        _count_bytes('get_range', 'in', len(data))
+        return data
+
+    @_instrumented('download_range')
+    def download_range(self, key, start, local_path):
+        """
+        Downloads the object from offset ``start`` to the end.
+        """
+        response = self.s3.get_object(Bucket=self.bucket_name, Key=key, Range=f'bytes={start}-')
+        with open(local_path, 'wb') as f:
+            shutil.copyfileobj(response['Body'], f, 1024 * 1024)
+            _count_bytes('download_range', 'in', f.tell())
+
+    @_instrumented('list_keys')
+    def list_keys(self, prefix):
+        paginator = self.s3.get_paginator('list_objects_v2')
+        return [
+            obj['Key']
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
+            for obj in page.get('Contents', [])
+        ]
+
+    @_instrumented('head_object')
+    def object_size(self, key):
+        return self.s3.head_object(Bucket=self.bucket_name, Key=key)['ContentLength']
+
+    @_instrumented('head_object')
+    def object_exists(self, key):
+        try:
+            self.s3.head_object(Bucket=self.bucket_name, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    @_instrumented('copy_result')
+    def copy_result(self, job_id, template_name):
+        """
+        Server-side copy of the primary result.md to the per-template key.
+        """
+        self.s3.copy_object(
+            Bucket=self.bucket_name,
+            Key=self._result_key(job_id, template_name),
+            CopySource={'Bucket': self.bucket_name, 'Key': self._result_key(job_id)},
+            ContentType='text/markdown',
+            MetadataDirective='REPLACE'
+        )
+
+    @_instrumented('get_result')
+    def get_result(self, job_id, template_name=None):
+        key = self._result_key(job_id, template_name)
         try:
             response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
-            return response['Body'].read().decode('utf-8')
+            body = response['Body'].read()
+            _count_bytes('get_result', 'in', len(body))
+            return body.decode('utf-8')
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def save_transcripts(self, job_id, transcriptions):
+        self.upload_json(f"jobs/{job_id}/transcripts.json", transcriptions)
+
+    def get_transcripts(self, job_id):
+        try:
+            return self.download_json(f"jobs/{job_id}/transcripts.json")
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def get_meta(self, job_id):
+        try:
+            return self.download_json(f"jobs/{job_id}/meta.json")
         except self.s3.exceptions.NoSuchKey:
             return None
 
@@ -75,6 +330,37 @@ class S3Storage:
                     job_ids.add(job_id)
         return list(job_ids)
 
+    def iter_job_objects(self):
+        """
+        Yields ``(job_id, key, last_modified)`` for every object below
+        ``jobs/`` from one flat listing. Keys come in order, so the objects
+        of a job are adjacent.
+        """
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix='jobs/'):
+            for obj in page.get('Contents', []):
+                job_id = obj['Key'].split('/')[1]
+                if job_id:
+                    yield job_id, obj['Key'], obj['LastModified']
+
+    @_instrumented('delete_keys')
+    def delete_keys(self, keys):
+        """
+        Deletes keys with one request per ``DELETE_BATCH_SIZE`` of them.
+
+        :return: The keys S3 reported as not deleted.
+        """
+        keys = list(keys)
+        failed = []
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            response = self.s3.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + DELETE_BATCH_SIZE]], 'Quiet': True}
+            )
+            failed.extend(error['Key'] for error in response.get('Errors', []))
+        return failed
+
+    @_instrumented('delete_job')
     def delete_job(self, job_id):
         # Delete all objects with the job prefix
         paginator = self.s3.get_paginator('list_objects_v2')
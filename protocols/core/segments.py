@@ -0,0 +1,147 @@
+import math
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import NamedTuple, Optional
+from . import flac
+
+
+class AudioSegment(NamedTuple):
+    index: int
+    # Seconds of the recording the segment owns; None for the last one
+    start_seconds: float
+    end_seconds: Optional[float]
+    # Byte range of whole FLAC frames covering the owned time plus the
+    # overlap on both sides, and the samples it decodes to
+    offset: int
+    length: int
+    first_sample: int
+    frames: int
+
+
+def plan_segments(read, size, info, segment_seconds, overlap_seconds):
+    """
+    Splits a FLAC stream into segments of ``segment_seconds`` whose byte
+    ranges overlap by ``overlap_seconds`` on each side, so speech cut at a
+    seam is heard whole by one of the two neighbours.
+
+    :param read: ``read(start, length)`` returning bytes of the file.
+    :param size: File size in bytes.
+    :param info: The file's ``StreamInfo``; the total samples must be known.
+    """
+    if not info.frames:
+        raise ValueError('The FLAC header has no sample count')
+    first = flac.Frame(flac.audio_offset(read), 0)
+    last = flac.Frame(size, info.frames)
+    count = max(1, math.ceil(info.duration / segment_seconds))
+
+    segments = []
+    for i in range(count):
+        start_seconds = i * segment_seconds
+        end_seconds = (i + 1) * segment_seconds if i < count - 1 else None
+
+        lo = first
+        lo_sample = int((start_seconds - overlap_seconds) * info.samplerate)
+        if lo_sample > 0:
+            lo, _ = flac.locate_sample(read, first, last, info, lo_sample)
+        hi = last
+        if end_seconds is not None:
+            hi_sample = int((end_seconds + overlap_seconds) * info.samplerate)
+            if hi_sample < info.frames:
+                _, hi = flac.locate_sample(read, first, last, info, hi_sample - 1)
+
+        segments.append(AudioSegment(
+            index=i,
+            start_seconds=start_seconds,
+            end_seconds=end_seconds,
+            offset=lo.offset,
+            length=hi.offset - lo.offset,
+            first_sample=lo.sample,
+            frames=hi.sample - lo.sample
+        ))
+    return segments
+
+
+def _words(text):
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def _same_utterance(a, b, similarity):
+    a, b = _words(a['text']), _words(b['text'])
+    if not a or not b:
+        return a == b
+    return a in b or b in a or SequenceMatcher(None, a, b).ratio() >= similarity
+
+
+def _find_repeat(kept, t, since, similarity):
+    # ``kept`` is in time order, so only its tail needs checking
+    for k in reversed(kept):
+        if k['timestamp'] < since:
+            return None
+        if k['user_id'] == t['user_id'] and _same_utterance(k, t, similarity):
+            return k
+    return None
+
+
+def merge_segment_transcripts(partials, overlap_seconds, similarity=0.6):
+    """
+    Joins the transcripts of segment × channel subtasks into one list,
+    each user's transcripts in time order.
+
+    A transcript belongs to the segment its timestamp falls in. Just after
+    a seam, one repeating what the previous segment heard in its trailing
+    overlap is the same utterance cut differently and is dropped; its text
+    replaces the earlier one if it is longer, as the earlier one may have
+    been cut off at the end of the previous range.
+
+    :param partials: Dicts with the ``segment`` (an ``AudioSegment`` as a
+                     dict), the ``channel`` and its ``transcripts``.
+    """
+    by_channel = defaultdict(list)
+    for partial in partials:
+        by_channel[partial['channel']].append(partial)
+
+    merged = []
+    for channel in sorted(by_channel):
+        kept = []
+        for partial in sorted(by_channel[channel], key=lambda p: p['segment']['start_seconds']):
+            start = partial['segment']['start_seconds']
+            end = partial['segment']['end_seconds']
+            for t in sorted(partial['transcripts'], key=lambda t: t['timestamp']):
+                if t['timestamp'] < start or (end is not None and t['timestamp'] >= end):
+                    continue
+                if start and t['timestamp'] < start + overlap_seconds:
+                    earlier = _find_repeat(kept, t, start - overlap_seconds, similarity)
+                    if earlier is not None:
+                        if len(t['text']) > len(earlier['text']):
+                            earlier['text'] = t['text']
+                        continue
+                kept.append(dict(t))
+        merged.extend(kept)
+    return merged
+
+
+def merge_window_transcripts(windows, overlap_seconds, similarity=0.6):
+    """
+    ``merge_segment_transcripts`` for the overlapping windows of
+    ``protocols.core.audio``: every window owns the time up to the start
+    of the next one, the last the rest of the recording, and repeats of
+    an utterance at a seam are dropped the same way.
+
+    :param windows: ``(start_seconds, transcripts)`` per window, in order.
+    """
+    if not overlap_seconds:
+        return [t for _, transcripts in windows for t in transcripts]
+    partials = []
+    for i, (start, transcripts) in enumerate(windows):
+        end = windows[i + 1][0] if i + 1 < len(windows) else None
+        by_user = defaultdict(list)
+        for t in transcripts:
+            by_user[t['user_id']].append(t)
+        for user_id, user_transcripts in by_user.items():
+            partials.append({
+                'segment': {'start_seconds': start, 'end_seconds': end},
+                'channel': user_id,
+                'transcripts': user_transcripts,
+            })
+    return merge_segment_transcripts(partials, overlap_seconds, similarity)
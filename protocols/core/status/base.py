@@ -0,0 +1,106 @@
+import asyncio
+from abc import ABC, abstractmethod
+
+class StatusStore(ABC):
+    # True if the store itself is durable; otherwise the worker writes a
+    # final status.json snapshot to S3 when a job finishes.
+    durable = False
+    # Seconds between reads for stores without change notifications
+    poll_interval = 2.0
+
+    @abstractmethod
+    def get(self, job_id):
+        """
+        :return: The job's status dict, or None if unknown.
+        """
+        pass
+
+    @abstractmethod
+    def update(self, job_id, status_data):
+        """
+        Atomically merges ``status_data`` into the job's status.
+        """
+        pass
+
+    def increment(self, job_id, counters):
+        """
+        Adds to numeric fields of the job's status, e.g. progress counters
+        bumped by concurrent subtasks. This default reads and merges, which
+        is not atomic between processes.
+        """
+        current = self.get(job_id) or {}
+        self.update(job_id, {field: (current.get(field) or 0) + value for field, value in counters.items()})
+
+    def get_many(self, job_ids):
+        """
+        :return: Dict of job_id to status dict (or None).
+        """
+        return {job_id: self.get(job_id) for job_id in job_ids}
+
+    @abstractmethod
+    def delete(self, job_id):
+        pass
+
+    def delete_many(self, job_ids):
+        for job_id in job_ids:
+            self.delete(job_id)
+
+    def adjust_backlog(self, size_class, jobs, cost_seconds, audio_seconds=0.0):
+        """
+        Adds to the number, estimated cost and audio (seconds times
+        channels) of queued, not yet started jobs of a size class. Stores
+        without shared counters ignore it.
+        """
+        pass
+
+    def get_backlog(self):
+        """
+        :return: Dict of size class to ``{'jobs', 'cost_seconds', 'audio_seconds'}``.
+        """
+        return {}
+
+    def record_rtf(self, rtf, smoothing):
+        """
+        Folds the real-time factor of a finished job (compute seconds per
+        second of one channel) into the moving average returned by
+        ``get_rtf``; ``smoothing`` is the weight of the new value. Stores
+        without shared counters ignore it.
+        """
+        pass
+
+    def get_rtf(self):
+        """
+        :return: The observed real-time factor, or None before the first job.
+        """
+        return None
+
+    def list_jobs(self, filters=None, limit=50, cursor=None, created_after=None, created_before=None):
+        """
+        Jobs newest first, from the store's index.
+
+        :param filters: Dict of ``INDEX_FIELDS`` values to match.
+        :return: Tuple of (list of status dicts with ``id``, next cursor or None).
+        :raises NotImplementedError: if the store keeps no index.
+        :raises ValueError: for an invalid cursor.
+        """
+        raise NotImplementedError(f"{type(self).__name__} keeps no job index")
+
+    async def listen(self, job_id, heartbeat=None):
+        """
+        Async generator of the job's status: the current one first, then
+        one per update. If ``heartbeat`` seconds pass without an update the
+        current status is yielded again. Stores without notifications poll.
+        """
+        interval = self.poll_interval if heartbeat is None else min(self.poll_interval, heartbeat)
+        loop = asyncio.get_running_loop()
+        last = await asyncio.to_thread(self.get, job_id)
+        yield last
+        idle = 0.0
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            current = await asyncio.to_thread(self.get, job_id)
+            idle += loop.time() - started
+            if current != last or (heartbeat is not None and idle >= heartbeat):
+                last, idle = current, 0.0
+                yield current
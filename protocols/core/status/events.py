@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+class Subscribers:
+    """
+    Per-job asyncio queues of waiting listeners. ``publish`` may be called
+    from any thread; each status is handed to the listener's own loop.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def add(self, job_id):
+        queue = asyncio.Queue()
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._queues.setdefault(job_id, set()).add(entry)
+        return entry
+
+    def remove(self, job_id, entry):
+        with self._lock:
+            entries = self._queues.get(job_id)
+            if entries is not None:
+                entries.discard(entry)
+                if not entries:
+                    del self._queues[job_id]
+
+    def has(self, job_id):
+        with self._lock:
+            return job_id in self._queues
+
+    def publish(self, job_id, status_data):
+        with self._lock:
+            entries = list(self._queues.get(job_id, ()))
+        for loop, queue in entries:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, status_data)
+            except RuntimeError:
+                # The listener's loop is already closed
+                pass
+
+
+async def next_event(queue, timeout):
+    """
+    :return: The next queued item, or None once ``timeout`` seconds pass.
+    """
+    try:
+        return await asyncio.wait_for(queue.get(), timeout)
+    except asyncio.TimeoutError:
+        return None
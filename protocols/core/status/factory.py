@@ -0,0 +1,29 @@
+import threading
+from django.conf import settings
+
+_stores = {}
+_lock = threading.Lock()
+
+def get_status_store():
+    backend_type = getattr(settings, 'STATUS_BACKEND', 'redis').lower()
+    ttl = getattr(settings, 'STATUS_TTL_SECONDS', None)
+
+    # Stores are shared per process so in-memory state and Redis connection
+    # pools survive between requests
+    with _lock:
+        if backend_type not in _stores:
+            _stores[backend_type] = _build_store(backend_type, ttl)
+        return _stores[backend_type]
+
+def _build_store(backend_type, ttl):
+    if backend_type == 'redis':
+        from .redis_store import RedisStatusStore
+        return RedisStatusStore(getattr(settings, 'STATUS_REDIS_URL', 'redis://localhost:6379/1'), ttl=ttl)
+    elif backend_type == 'memory':
+        from .memory import MemoryStatusStore
+        return MemoryStatusStore(ttl=ttl)
+    elif backend_type == 's3':
+        from .s3 import S3StatusStore
+        return S3StatusStore()
+    else:
+        raise ValueError(f"Unknown Status Backend: {backend_type}")
@@ -0,0 +1,63 @@
+import base64
+import itertools
+import json
+from datetime import datetime, timezone
+
+# Status fields jobs can be filtered by; each job is indexed under every
+# combination of them, so any combination is a single sorted-set range
+INDEX_FIELDS = ('status', 'guild_id', 'template_name')
+
+
+def created_score(status_data):
+    """
+    :return: ``created_at`` as a Unix timestamp, or None if unset.
+    """
+    created_at = status_data.get('created_at')
+    if not created_at:
+        return None
+    return to_score(datetime.fromisoformat(created_at))
+
+
+def to_score(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def index_suffix(filters):
+    return ''.join(f':{field}={filters[field]}' for field in INDEX_FIELDS if filters.get(field) is not None)
+
+
+def index_suffixes(status_data):
+    """
+    :return: The suffixes of every index the job belongs to.
+    """
+    fields = [field for field in INDEX_FIELDS if status_data.get(field) is not None]
+    return {
+        index_suffix({field: status_data[field] for field in combination})
+        for n in range(len(fields) + 1)
+        for combination in itertools.combinations(fields, n)
+    }
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    :raises ValueError: for cursors not made by ``encode_cursor``.
+    """
+    try:
+        score, skip = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(score), int(skip)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def advance(position, score):
+    """
+    Moves a ``(score, skip)`` listing position past one entry with
+    ``score``; entries come newest first.
+    """
+    return (score, position[1] + 1) if score == position[0] else (score, 1)
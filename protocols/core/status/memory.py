@@ -0,0 +1,118 @@
+import copy
+import threading
+import time
+from .base import StatusStore
+from .events import Subscribers, next_event
+from .index import INDEX_FIELDS, advance, created_score, decode_cursor, encode_cursor, to_score
+
+class MemoryStatusStore(StatusStore):
+    """
+    Process-local store for tests and single-process setups.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+        self._subscribers = Subscribers()
+        self._backlog = {}
+        self._rtf = None
+
+    def _expired(self, job_id):
+        expires = self._expires.get(job_id)
+        return expires is not None and expires < time.monotonic()
+
+    def get(self, job_id):
+        with self._lock:
+            if job_id not in self._data or self._expired(job_id):
+                return None
+            return copy.deepcopy(self._data[job_id])
+
+    def update(self, job_id, status_data):
+        with self._lock:
+            if self._expired(job_id):
+                self._data.pop(job_id, None)
+            self._data.setdefault(job_id, {}).update(copy.deepcopy(status_data))
+            if self.ttl:
+                self._expires[job_id] = time.monotonic() + self.ttl
+            current = copy.deepcopy(self._data[job_id])
+        self._subscribers.publish(job_id, current)
+
+    def increment(self, job_id, counters):
+        with self._lock:
+            if self._expired(job_id):
+                self._data.pop(job_id, None)
+            data = self._data.setdefault(job_id, {})
+            for field, value in counters.items():
+                data[field] = (data.get(field) or 0) + value
+            if self.ttl:
+                self._expires[job_id] = time.monotonic() + self.ttl
+            current = copy.deepcopy(data)
+        self._subscribers.publish(job_id, current)
+
+    def delete(self, job_id):
+        with self._lock:
+            self._data.pop(job_id, None)
+            self._expires.pop(job_id, None)
+
+    def adjust_backlog(self, size_class, jobs, cost_seconds, audio_seconds=0.0):
+        with self._lock:
+            entry = self._backlog.setdefault(size_class, {'jobs': 0, 'cost_seconds': 0.0, 'audio_seconds': 0.0})
+            entry['jobs'] += jobs
+            entry['cost_seconds'] += cost_seconds
+            entry['audio_seconds'] += audio_seconds
+
+    def get_backlog(self):
+        with self._lock:
+            return copy.deepcopy(self._backlog)
+
+    def record_rtf(self, rtf, smoothing):
+        with self._lock:
+            self._rtf = rtf if self._rtf is None else self._rtf + smoothing * (rtf - self._rtf)
+
+    def get_rtf(self):
+        return self._rtf
+
+    def list_jobs(self, filters=None, limit=50, cursor=None, created_after=None, created_before=None):
+        # Scans everything; fine for the sizes this store is meant for
+        filters = {field: value for field, value in (filters or {}).items() if value is not None}
+        min_score = to_score(created_after) if created_after else float('-inf')
+        position = decode_cursor(cursor) if cursor else (to_score(created_before) if created_before else float('inf'), 0)
+        with self._lock:
+            rows = [
+                (created_score(data), job_id, data) for job_id, data in self._data.items()
+                if not self._expired(job_id) and created_score(data) is not None
+                and all(data.get(field) == filters[field] for field in INDEX_FIELDS if field in filters)
+            ]
+        # Same order as a reversed sorted set: score, then member, descending
+        rows.sort(key=lambda row: (row[0], row[1]), reverse=True)
+        rows = [row for row in rows if min_score <= row[0] <= position[0]]
+
+        jobs = []
+        for score, job_id, data in rows[position[1]:]:
+            if len(jobs) == limit:
+                return jobs, encode_cursor(position)
+            position = advance(position, score)
+            jobs.append(dict(copy.deepcopy(data), id=job_id))
+        return jobs, None
+
+    async def listen(self, job_id, heartbeat=None):
+        entry = self._subscribers.add(job_id)
+        try:
+            current = self.get(job_id)
+            yield current
+            while True:
+                update = await next_event(entry[1], heartbeat)
+                if update is not None:
+                    current = update
+                yield current
+        finally:
+            self._subscribers.remove(job_id, entry)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+            self._backlog.clear()
+            self._rtf = None
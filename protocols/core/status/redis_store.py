@@ -0,0 +1,235 @@
+import asyncio
+import json
+import weakref
+import redis
+import redis.asyncio
+from .base import StatusStore
+from .events import Subscribers, next_event
+from .index import advance, created_score, decode_cursor, encode_cursor, index_suffix, index_suffixes, to_score
+
+# Exponential moving average updated in one round trip, so concurrent
+# workers don't overwrite each other's observations
+RECORD_RTF = """
+local current = redis.call('HGET', KEYS[1], 'rtf')
+local value = tonumber(ARGV[1])
+if current then
+    value = tonumber(current) + tonumber(ARGV[2]) * (value - tonumber(current))
+end
+redis.call('HSET', KEYS[1], 'rtf', value)
+return tostring(value)
+"""
+
+class RedisStatusStore(StatusStore):
+    """
+    Keeps each job's status in a Redis hash with one JSON-encoded value per
+    field, so a transition is a single atomic HSET (plus EXPIRE) instead of
+    an S3 read-modify-write. Every update is also published on the job's
+    ``<key>:events`` channel for ``listen``, and the job is kept in sorted
+    sets (scored by ``created_at``) for each combination of its
+    ``INDEX_FIELDS``, so listings are a range read.
+    """
+
+    def __init__(self, url, ttl=None, prefix='protoscript:job:'):
+        # redis-py pools connections and is safe to share between threads
+        self.redis = redis.Redis.from_url(url)
+        self.url = url
+        self.ttl = ttl
+        self.prefix = prefix
+        self._hubs = weakref.WeakKeyDictionary()
+
+    def _key(self, job_id):
+        return f'{self.prefix}{job_id}'
+
+    def _channel(self, job_id):
+        return f'{self._key(job_id)}:events'
+
+    def _index_key(self, suffix):
+        return f'{self.prefix}index{suffix}'
+
+    @staticmethod
+    def _decode(fields):
+        if not fields:
+            return None
+        return {k.decode('utf-8'): json.loads(v) for k, v in fields.items()}
+
+    def get(self, job_id):
+        return self._decode(self.redis.hgetall(self._key(job_id)))
+
+    def update(self, job_id, status_data):
+        key = self._key(job_id)
+        pipe = self.redis.pipeline(transaction=True)
+        try:
+            while True:
+                try:
+                    # The index entries depend on the merged status, so the
+                    # hash is watched between reading it and the transaction
+                    pipe.watch(key)
+                    current = self._decode(pipe.hgetall(key)) or {}
+                    pipe.multi()
+                    pipe.hset(key, mapping={k: json.dumps(v) for k, v in status_data.items()})
+                    if self.ttl:
+                        pipe.expire(key, self.ttl)
+                    self._reindex(pipe, job_id, current, dict(current, **status_data))
+                    pipe.publish(self._channel(job_id), json.dumps(status_data))
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+        finally:
+            pipe.reset()
+
+    def increment(self, job_id, counters):
+        # HINCRBYFLOAT leaves plain numbers, which are valid JSON values;
+        # the counters are not indexed fields, so no WATCH is needed
+        key = self._key(job_id)
+        fields = list(counters)
+        pipe = self.redis.pipeline(transaction=True)
+        for field in fields:
+            pipe.hincrbyfloat(key, field, counters[field])
+        if self.ttl:
+            pipe.expire(key, self.ttl)
+        values = pipe.execute()[:len(fields)]
+        self.redis.publish(self._channel(job_id), json.dumps(dict(zip(fields, map(float, values)))))
+
+    def _reindex(self, pipe, job_id, old, new):
+        score = created_score(new)
+        if score is None:
+            return
+        stale = index_suffixes(old) - index_suffixes(new) if old else set()
+        for suffix in stale:
+            pipe.zrem(self._index_key(suffix), job_id)
+        for suffix in index_suffixes(new):
+            pipe.zadd(self._index_key(suffix), {job_id: score})
+
+    def get_many(self, job_ids):
+        job_ids = list(job_ids)
+        pipe = self.redis.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(self._key(job_id))
+        return {job_id: self._decode(fields) for job_id, fields in zip(job_ids, pipe.execute())}
+
+    def delete(self, job_id):
+        self.delete_many([job_id])
+
+    def delete_many(self, job_ids):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        statuses = self.get_many(job_ids)
+        pipe = self.redis.pipeline(transaction=False)
+        for job_id, status_data in statuses.items():
+            for suffix in index_suffixes(status_data or {}):
+                pipe.zrem(self._index_key(suffix), job_id)
+        pipe.delete(*[self._key(job_id) for job_id in job_ids])
+        pipe.execute()
+
+    def adjust_backlog(self, size_class, jobs, cost_seconds, audio_seconds=0.0):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hincrby(f'{self.prefix}backlog', f'{size_class}:jobs', jobs)
+        pipe.hincrbyfloat(f'{self.prefix}backlog', f'{size_class}:cost_seconds', cost_seconds)
+        pipe.hincrbyfloat(f'{self.prefix}backlog', f'{size_class}:audio_seconds', audio_seconds)
+        pipe.execute()
+
+    def get_backlog(self):
+        backlog = {}
+        for field, value in self.redis.hgetall(f'{self.prefix}backlog').items():
+            size_class, _, name = field.decode('utf-8').rpartition(':')
+            backlog.setdefault(size_class, {})[name] = int(value) if name == 'jobs' else float(value)
+        return backlog
+
+    def record_rtf(self, rtf, smoothing):
+        self.redis.eval(RECORD_RTF, 1, f'{self.prefix}throughput', rtf, smoothing)
+
+    def get_rtf(self):
+        value = self.redis.hget(f'{self.prefix}throughput', 'rtf')
+        return float(value) if value is not None else None
+
+    def list_jobs(self, filters=None, limit=50, cursor=None, created_after=None, created_before=None):
+        key = self._index_key(index_suffix(filters or {}))
+        min_score = to_score(created_after) if created_after else float('-inf')
+        position = decode_cursor(cursor) if cursor else (to_score(created_before) if created_before else float('inf'), 0)
+
+        jobs, expired = [], []
+        try:
+            while True:
+                # One entry beyond the page tells whether there is a next one
+                want = limit - len(jobs) + 1
+                batch = self.redis.zrevrangebyscore(
+                    key, position[0], min_score, start=position[1], num=want, withscores=True
+                )
+                statuses = self.get_many(member.decode('utf-8') for member, _ in batch)
+                for member, score in batch:
+                    if len(jobs) == limit:
+                        return jobs, encode_cursor(position)
+                    job_id = member.decode('utf-8')
+                    position = advance(position, score)
+                    if statuses[job_id] is None:
+                        # The status hash expired
+                        expired.append(job_id)
+                        continue
+                    jobs.append(dict(statuses[job_id], id=job_id))
+                if len(batch) < want:
+                    return jobs, None
+        finally:
+            if expired:
+                self.redis.zrem(key, *expired)
+
+    async def listen(self, job_id, heartbeat=None):
+        # One pattern subscription per event loop is shared by all of its
+        # listeners, so waiting clients don't each hold a Redis connection
+        loop = asyncio.get_running_loop()
+        hub = self._hubs.get(loop)
+        if hub is None:
+            hub = self._hubs[loop] = _RedisHub(self)
+        hub.listeners += 1
+        entry = hub.subscribers.add(job_id)
+        try:
+            await hub.started
+            current = self._decode(await hub.redis.hgetall(self._key(job_id)))
+            yield current
+            while True:
+                update = await next_event(entry[1], heartbeat)
+                if update is not None:
+                    current = update
+                yield current
+        finally:
+            hub.subscribers.remove(job_id, entry)
+            hub.listeners -= 1
+            if hub.listeners == 0 and self._hubs.get(loop) is hub:
+                del self._hubs[loop]
+                await hub.close()
+
+
+class _RedisHub:
+    def __init__(self, store):
+        self.store = store
+        self.subscribers = Subscribers()
+        self.listeners = 0
+        self.redis = redis.asyncio.Redis.from_url(store.url)
+        self.pubsub = self.redis.pubsub()
+        self.started = asyncio.ensure_future(self._start())
+        self.task = None
+
+    async def _start(self):
+        await self.pubsub.psubscribe(self.store._channel('*'))
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        prefix, suffix = self.store.prefix, ':events'
+        async for message in self.pubsub.listen():
+            if message['type'] != 'pmessage':
+                continue
+            job_id = message['channel'].decode('utf-8')[len(prefix):-len(suffix)]
+            if self.subscribers.has(job_id):
+                fields = await self.redis.hgetall(self.store._key(job_id))
+                self.subscribers.publish(job_id, self.store._decode(fields))
+
+    async def close(self):
+        self.started.cancel()
+        if self.task is not None:
+            self.task.cancel()
+        try:
+            await self.pubsub.aclose()
+            await self.redis.aclose()
+        except Exception:
+            pass
@@ -0,0 +1,21 @@
+from protocols.core.s3_storage import S3Storage
+from .base import StatusStore
+
+class S3StatusStore(StatusStore):
+    """
+    The original status.json read-modify-write, for deployments without Redis.
+    """
+    durable = True
+
+    def get(self, job_id):
+        return S3Storage().get_status(job_id)
+
+    def update(self, job_id, status_data):
+        S3Storage().update_status(job_id, status_data)
+
+    def delete(self, job_id):
+        # status.json goes away with the rest of the job prefix
+        pass
+
+    def delete_many(self, job_ids):
+        pass
@@ -0,0 +1,65 @@
+import os
+import threading
+import jinja2
+from django.conf import settings
+
+TEMPLATE_SUFFIX = '.j2'
+
+
+class TemplateRegistry:
+    """
+    Compiled protocol templates from one directory. Templates are compiled
+    once and kept in the environment's cache; ``auto_reload`` re-checks the
+    file mtime on every lookup so edited templates are picked up, and the
+    optional bytecode cache lets restarted processes skip recompiling.
+    """
+
+    def __init__(self, directory, bytecode_cache_dir=None):
+        self.directory = directory
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+        self.env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(directory),
+            bytecode_cache=bytecode_cache,
+            auto_reload=True,
+            # Keep every template compiled, there are only a handful
+            cache_size=-1
+        )
+
+    def names(self):
+        return sorted(self.env.list_templates(filter_func=lambda name: name.endswith(TEMPLATE_SUFFIX)))
+
+    def exists(self, name):
+        return name in self.names()
+
+    def get(self, name):
+        """
+        :raises jinja2.TemplateNotFound: for names outside the registry.
+        """
+        if not self.exists(name):
+            raise jinja2.TemplateNotFound(name)
+        return self.env.get_template(name)
+
+    def from_string(self, template_content):
+        return self.env.from_string(template_content)
+
+    def preload(self):
+        for name in self.names():
+            self.env.get_template(name)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_template_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TemplateRegistry(
+                directory=str(settings.PROTOCOL_TEMPLATE_DIR),
+                bytecode_cache_dir=getattr(settings, 'TEMPLATE_BYTECODE_CACHE_DIR', None)
+            )
+        return _registry
@@ -0,0 +1,90 @@
+import os
+import re
+from .flac import STREAMINFO_BYTES, StreamInfo, read_streaminfo
+from .ogg import HEAD_BYTES, TAIL_BYTES, read_ogg_info
+
+# Per-user audio files a job can be uploaded as instead of one multi-channel
+# audio.flac, with their content types; they are kept below jobs/<id>/tracks/
+TRACK_FORMATS = {
+    '.ogg': 'audio/ogg',
+    '.opus': 'audio/ogg',
+    '.flac': 'audio/flac',
+}
+TRACK_HEAD_BYTES = max(HEAD_BYTES, STREAMINFO_BYTES)
+TRACK_TAIL_BYTES = TAIL_BYTES
+
+_USER_ID = re.compile(r'^[A-Za-z0-9-]+$')
+
+
+def track_name(file_name):
+    """
+    Normalizes an uploaded file name to ``<user_id>.<ext>``. The stem is
+    the user ID, or ends with ``_<user_id>`` as in the recorder's
+    ``<name>_<user_id>.ogg`` files.
+
+    :raises ValueError: If the extension or user ID is not accepted.
+    """
+    stem, ext = os.path.splitext(os.path.basename(file_name or ''))
+    ext = ext.lower()
+    if ext not in TRACK_FORMATS:
+        raise ValueError(f"Unsupported audio track '{file_name}'; expected one of {', '.join(TRACK_FORMATS)}")
+    user_id = stem.rsplit('_', 1)[-1]
+    if not _USER_ID.match(user_id):
+        raise ValueError(f"Audio track '{file_name}' is not named after a user ID")
+    return f"{user_id}{ext}"
+
+
+def track_user_id(name):
+    return os.path.splitext(name)[0]
+
+
+def track_key(job_id, name):
+    return f"jobs/{job_id}/tracks/{name}"
+
+
+def track_content_type(name):
+    return TRACK_FORMATS[os.path.splitext(name)[1].lower()]
+
+
+def read_track_info(head, tail=b''):
+    """
+    :return: The ``StreamInfo`` of a track from its first
+             ``TRACK_HEAD_BYTES`` and last ``TRACK_TAIL_BYTES`` bytes, or
+             None if the format is not recognized.
+    """
+    return read_streaminfo(head[:STREAMINFO_BYTES]) or read_ogg_info(head, tail)
+
+
+def combine_track_info(infos):
+    """
+    One ``StreamInfo`` for a job's tracks, as if they were the channels of
+    a single file: the longest track's length, one channel per track. Cost
+    estimates and the backlog only use duration and channel count.
+
+    :return: None if any track's info is unknown.
+    """
+    if not infos or any(info is None for info in infos):
+        return None
+    longest = max(infos, key=lambda info: info.duration)
+    return StreamInfo(longest.samplerate, len(infos), 0, longest.frames)
+
+
+def map_tracks(users, names):
+    """
+    Gives each user with a track a channel index of its own, in the order
+    of ``users``; tracks of unknown users are left out.
+
+    :return: ``(users, {channel_idx: track name})`` with ``users`` reduced
+             to those with a track and their ``channel`` set.
+    """
+    by_user = {track_user_id(name): name for name in names}
+    mapped_users = {}
+    channel_tracks = {}
+    for user_id, user_info in users.items():
+        name = by_user.get(str(user_id))
+        if name is None:
+            continue
+        channel = len(channel_tracks)
+        mapped_users[user_id] = dict(user_info, channel=channel)
+        channel_tracks[channel] = name
+    return mapped_users, channel_tracks
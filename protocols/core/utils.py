@@ -1,9 +1,15 @@
+import heapq
 import jinja2
 import soundfile as sf
 import os
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.utils import timezone
+from . import metrics
+from .audio import iter_channel_windows, iter_flac_range_windows, mapped_channels
 from .engines.factory import get_stt_engine
+from .segments import merge_window_transcripts
+from .templates import get_template_registry
 
 _engine = None
 
@@ -13,61 +19,147 @@ def get_engine():
         _engine = get_stt_engine()
     return _engine
 
-def transcribe_audio(audio_file_path, users):
-    # Read audio with soundfile
-    data, samplerate = sf.read(audio_file_path)
-    
+def window_overlap_seconds():
+    return getattr(settings, 'AUDIO_WINDOW_OVERLAP_SECONDS', 2.0)
+
+def transcribe_overlapping(windows, samplerate, users, stats=None, timer=None):
+    """
+    Transcribes overlapping ``(start_seconds, {channel_idx: samples})``
+    windows one by one and drops what two windows heard twice at a seam.
+    """
+    timer = timer or metrics.StageTimer()
+    engine = get_engine()
+    parts = []
+    with timer.stage('asr'):
+        for start, channels in timer.timed(windows, 'decode'):
+            parts.append((start, engine.transcribe_windows([(start, channels)], samplerate, users, stats=stats)))
+    return merge_window_transcripts(parts, window_overlap_seconds())
+
+def transcribe_audio(audio_file_path, users, stats=None, timer=None):
+    # Stream the audio window by window instead of decoding the whole file,
+    # keeping only the channels that are mapped to a user. ``timer`` (a
+    # metrics.StageTimer) gets the decode and ASR time.
+    info = sf.info(audio_file_path)
+    channels = mapped_channels(users, info.channels)
+    windows = iter_channel_windows(
+        audio_file_path,
+        channels,
+        window_seconds=getattr(settings, 'AUDIO_WINDOW_SECONDS', 120.0),
+        dtype=getattr(settings, 'AUDIO_DECODE_DTYPE', 'float32'),
+        overlap_seconds=window_overlap_seconds()
+    )
+    return transcribe_overlapping(windows, info.samplerate, users, stats=stats, timer=timer)
+
+def transcribe_each_window(windows, samplerate, users, timer=None):
+    """
+    Yields ``(window, transcripts, stats)`` per window, for callers that
+    keep each window's result as it completes.
+    """
+    timer = timer or metrics.StageTimer()
     engine = get_engine()
-    return engine.transcribe(data, samplerate, users)
+    for window in timer.timed(windows, 'decode'):
+        stats = {}
+        with timer.stage('asr'):
+            transcripts = engine.transcribe_windows([window], samplerate, users, stats=stats)
+        yield window, transcripts, stats
+
+def transcribe_flac_range(data, info, first_sample, frames, users, stats=None, timer=None):
+    """
+    ``transcribe_audio`` for a run of whole FLAC frames starting at sample
+    ``first_sample`` of the stream described by ``info``; timestamps stay
+    relative to the start of the recording.
+    """
+    offset = first_sample / info.samplerate
+    windows = iter_flac_range_windows(
+        data,
+        info,
+        frames,
+        mapped_channels(users, info.channels),
+        window_seconds=getattr(settings, 'AUDIO_WINDOW_SECONDS', 120.0),
+        dtype=getattr(settings, 'AUDIO_DECODE_DTYPE', 'float32'),
+        overlap_seconds=window_overlap_seconds()
+    )
+    return transcribe_overlapping(
+        ((offset + start, channels) for start, channels in windows), info.samplerate, users,
+        stats=stats, timer=timer
+    )
+
+def parse_dt(dt_str):
+    try:
+        return datetime.fromisoformat(dt_str)
+    except ValueError:
+        # If the format is slightly different
+        return datetime.strptime(dt_str, "%Y-%m-%dT%H:%M:%S.%f")
+
+def iter_timeline(meta_data, transcriptions, start_time):
+    """
+    Yields events and transcripts in timestamp order without building and
+    sorting one big list: every stream (the events, and each user's
+    transcripts, which the engine already emits in time order) is ordered
+    on its own and the streams are combined with a k-way heap merge.
 
-def generate_protocol(meta_data, transcriptions, template_content):
-    # Parse date formats
-    def parse_dt(dt_str):
-        try:
-            return datetime.fromisoformat(dt_str)
-        except ValueError:
-            # If the format is slightly different
-            return datetime.strptime(dt_str, "%Y-%m-%dT%H:%M:%S.%f")
+    Ties are broken exactly like a stable sort of the events followed by
+    ``transcriptions``, so the rendered output does not change.
+    """
+    def events():
+        for i, event in enumerate(meta_data.get('events', [])):
+            ts = parse_dt(event['timestamp'])
+            yield (ts, 0, i), {
+                'type': 'event',
+                'timestamp': ts,
+                'content': event['message']
+            }
 
+    def transcripts(indexed):
+        for i, t in indexed:
+            ts = start_time + timedelta(seconds=t['timestamp'])
+            yield (ts, 1, i), {
+                'type': 'transcript',
+                'timestamp': ts,
+                'user_id': t['user_id'],
+                'user_name': t['user_name'],
+                'text': t['text']
+            }
+
+    per_user = {}
+    for i, t in enumerate(transcriptions):
+        per_user.setdefault(t['user_id'], []).append((i, t))
+
+    # Keys are unique, so the (key, item) tuples never compare the dicts
+    streams = [sorted(events(), key=lambda x: x[0])]
+    for indexed in per_user.values():
+        # A no-op pass for the already ordered engine output
+        indexed.sort(key=lambda x: x[1]['timestamp'])
+        streams.append(transcripts(indexed))
+
+    for _, item in heapq.merge(*streams):
+        yield item
+
+def render_protocol_stream(meta_data, transcriptions, template):
+    """
+    Renders the protocol as a generator of text chunks (``Template.generate``),
+    so it can be streamed to storage without holding the whole document.
+    ``template`` is a compiled jinja2.Template (see protocols.core.templates)
+    or template source.
+    """
     start_time = parse_dt(meta_data['start_time'])
     end_time = parse_dt(meta_data['end_time'])
-    
-    timeline = []
-    
-    # Add events
-    for event in meta_data.get('events', []):
-        timeline.append({
-            'type': 'event',
-            'timestamp': parse_dt(event['timestamp']),
-            'content': event['message']
-        })
-    
-    # Add transcriptions
-    for t in transcriptions:
-        abs_ts = start_time + timedelta(seconds=t['timestamp'])
-        timeline.append({
-            'type': 'transcript',
-            'timestamp': abs_ts,
-            'user_id': t['user_id'],
-            'user_name': t['user_name'],
-            'text': t['text']
-        })
-    
-    # Sort by timestamp
-    timeline.sort(key=lambda x: x['timestamp'])
-    
-    # Render template
-    env = jinja2.Environment()
-    template = env.from_string(template_content)
-    
+
+    if not isinstance(template, jinja2.Template):
+        template = get_template_registry().from_string(template)
+
     # Prepare meta data
     meta_for_template = meta_data.copy()
     meta_for_template['start_time'] = start_time
     meta_for_template['end_time'] = end_time
-    
+
     # Insert User IDs into the user object
     for uid, uinfo in meta_for_template['users'].items():
         uinfo['id'] = uid
 
-    return template.render(meta=meta_for_template, timeline=timeline)
+    timeline = iter_timeline(meta_data, transcriptions, start_time)
+    return template.generate(meta=meta_for_template, timeline=timeline)
 
+def generate_protocol(meta_data, transcriptions, template):
+    with metrics.STAGE_SECONDS.labels(stage='render').time():
+        return ''.join(render_protocol_stream(meta_data, transcriptions, template))
@@ -0,0 +1,10 @@
+from abc import ABC, abstractmethod
+
+class VAD(ABC):
+    @abstractmethod
+    def detect(self, channel_data, samplerate):
+        """
+        Detects speech in a single audio channel.
+        :return: Sorted, non-overlapping list of (start_sample, end_sample) speech islands.
+        """
+        pass
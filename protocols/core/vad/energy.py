@@ -0,0 +1,60 @@
+import numpy as np
+from .base import VAD
+
+class EnergyVAD(VAD):
+    """
+    Frame-energy speech detector. A frame counts as speech when its RMS level
+    exceeds ``threshold_db`` dBFS; short gaps are bridged, short islands are
+    dropped and the remaining islands are padded on both sides.
+    """
+
+    def __init__(self, threshold_db=-45.0, frame_ms=30, padding_ms=300, min_speech_ms=250, min_silence_ms=500):
+        self.threshold_db = threshold_db
+        self.frame_ms = frame_ms
+        self.padding_ms = padding_ms
+        self.min_speech_ms = min_speech_ms
+        self.min_silence_ms = min_silence_ms
+
+    def detect(self, channel_data, samplerate):
+        total = len(channel_data)
+        frame = max(1, int(samplerate * self.frame_ms / 1000))
+        n_frames = total // frame + (1 if total % frame else 0)
+        if n_frames == 0:
+            return []
+
+        samples = channel_data.astype(np.float32)
+        if channel_data.dtype == np.int16:
+            samples /= 32768.0
+        padded = np.zeros(n_frames * frame, dtype=np.float32)
+        padded[:total] = samples
+        rms = np.sqrt(np.mean(padded.reshape(n_frames, frame) ** 2, axis=1))
+        level_db = 20 * np.log10(np.maximum(rms, 1e-10))
+        speech = level_db > self.threshold_db
+
+        # Rising/falling edges of the speech mask, in frames
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+        islands = list(zip(edges[::2], edges[1::2]))
+
+        # Bridge short pauses
+        min_silence = self.min_silence_ms / self.frame_ms
+        merged = []
+        for start, end in islands:
+            if merged and start - merged[-1][1] < min_silence:
+                merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+
+        # Drop blips, pad, and convert to samples
+        min_speech = self.min_speech_ms / self.frame_ms
+        pad = int(samplerate * self.padding_ms / 1000)
+        result = []
+        for start, end in merged:
+            if end - start < min_speech:
+                continue
+            s = max(0, start * frame - pad)
+            e = min(total, end * frame + pad)
+            if result and s <= result[-1][1]:
+                result[-1] = (result[-1][0], e)
+            else:
+                result.append((s, e))
+        return result
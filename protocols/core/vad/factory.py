@@ -0,0 +1,17 @@
+from django.conf import settings
+
+def get_vad():
+    vad_type = getattr(settings, 'VAD_ENGINE', 'none').lower()
+
+    if vad_type == 'none':
+        return None
+    elif vad_type == 'energy':
+        from .energy import EnergyVAD
+        return EnergyVAD(
+            threshold_db=getattr(settings, 'VAD_THRESHOLD_DB', -45.0),
+            padding_ms=getattr(settings, 'VAD_PADDING_MS', 300),
+            min_speech_ms=getattr(settings, 'VAD_MIN_SPEECH_MS', 250),
+            min_silence_ms=getattr(settings, 'VAD_MIN_SILENCE_MS', 500)
+        )
+    else:
+        raise ValueError(f"Unknown VAD Engine: {vad_type}")
@@ -0,0 +1,100 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from protocols.bench.s3stub import S3Stub
+from protocols.core import s3_storage
+from protocols.core.s3_storage import S3Storage
+
+OBJECTS_PER_JOB = ('meta.json', 'audio.flac', 'transcripts.json', 'result.md', 'status.json')
+
+
+def populate(stub, bucket, jobs, prefix, created_at):
+    status = json.dumps({'status': 'completed', 'created_at': created_at.isoformat()})
+    for i in range(jobs):
+        job_id = f'{prefix}{i:08d}'
+        for name in OBJECTS_PER_JOB:
+            body = status if name == 'status.json' else b'x'
+            stub.put(bucket, f'jobs/{job_id}/{name}', body, last_modified=created_at)
+
+
+def legacy_cleanup(storage, threshold):
+    # The previous command: one status download and one delete_job per job
+    count = 0
+    for job_id in storage.list_job_ids():
+        status = storage.get_status(job_id)
+        if status and datetime.fromisoformat(status['created_at']) < threshold:
+            storage.delete_job(job_id)
+            count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = 'Time cleanup_jobs against a local S3 stand-in with many synthetic jobs, compared to the per-job loop.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=100000, help='Old jobs for the batched run (default: 100000)')
+        parser.add_argument('--legacy-jobs', type=int, default=5000,
+                            help='Old jobs for the per-job run, which is much slower (default: 5000)')
+        parser.add_argument('--workers', type=int, default=8, help='cleanup_jobs --workers (default: 8)')
+
+    def handle(self, *args, **options):
+        bucket = 'protoscript-bench'
+        old = datetime.now(timezone.utc) - timedelta(days=2)
+        results = {}
+
+        with S3Stub() as stub:
+            stub.create_bucket(bucket)
+            env = {
+                'S3_ENDPOINT_URL': stub.endpoint_url,
+                'S3_BUCKET_NAME': bucket,
+                'S3_ACCESS_KEY': 'bench',
+                'S3_SECRET_KEY': 'bench',
+            }
+            with patch.dict(os.environ, env), override_settings(STATUS_BACKEND='memory'):
+                s3_storage.reset_s3_client()
+
+                if options['legacy_jobs']:
+                    populate(stub, bucket, options['legacy_jobs'], 'legacy-', old)
+                    requests = stub.request_count
+                    start = time.perf_counter()
+                    deleted = legacy_cleanup(S3Storage(), datetime.now(timezone.utc) - timedelta(hours=1))
+                    results['per_job'] = self._result(deleted, time.perf_counter() - start, stub.request_count - requests)
+                    self._print('per_job', results['per_job'])
+
+                populate(stub, bucket, options['jobs'], 'batched-', old)
+                requests = stub.request_count
+                start = time.perf_counter()
+                call_command('cleanup_jobs', '--minutes', '60', '--workers', str(options['workers']),
+                             '--progress-interval', '0', stdout=StringIO())
+                elapsed = time.perf_counter() - start
+                if stub.buckets[bucket]:
+                    raise RuntimeError(f'{len(stub.buckets[bucket])} objects were left behind')
+                results['batched'] = self._result(options['jobs'], elapsed, stub.request_count - requests)
+                self._print('batched', results['batched'])
+            s3_storage.reset_s3_client()
+
+        if 'per_job' in results:
+            results['speedup'] = results['batched']['jobs_per_second'] / results['per_job']['jobs_per_second']
+        self.stdout.write(json.dumps(results, indent=2))
+
+    @staticmethod
+    def _result(jobs, seconds, requests):
+        return {
+            'jobs': jobs,
+            'objects': jobs * len(OBJECTS_PER_JOB),
+            'seconds': seconds,
+            'jobs_per_second': jobs / seconds,
+            's3_requests': requests,
+        }
+
+    def _print(self, mode, result):
+        self.stdout.write(
+            f"{mode:>8}: {result['jobs']} jobs in {result['seconds']:.1f}s "
+            f"({result['jobs_per_second']:.0f} jobs/s, {result['s3_requests']} S3 requests)"
+        )
@@ -0,0 +1,76 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from protocols.bench.synthetic import write_synthetic_flac, peak_rss_mb
+
+
+def _measure_decode(audio_path, channels, window_seconds, dtype, legacy):
+    # Runs in a fresh interpreter so ru_maxrss only reflects this decode.
+    import numpy as np
+    import soundfile as sf
+    from protocols.core.audio import iter_channel_windows
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if legacy:
+        data, _ = sf.read(audio_path)
+        for idx in channels:
+            np.abs(data[:, idx]).max()
+    else:
+        for _, window in iter_channel_windows(audio_path, channels, window_seconds, dtype=dtype):
+            for samples in window.values():
+                np.abs(samples).max()
+    return {
+        'seconds': time.perf_counter() - start,
+        'baseline_rss_mb': baseline,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measures peak RSS of decoding synthetic multi-channel FLAC sessions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, nargs='+', default=[1.0, 4.0],
+                            help='Session lengths to benchmark (default: 1 4)')
+        parser.add_argument('--speakers', type=int, default=4, help='Number of channels (default: 4)')
+        parser.add_argument('--samplerate', type=int, default=48000, help='Sample rate (default: 48000)')
+        parser.add_argument('--window-seconds', type=float, default=120.0,
+                            help='Decode window in seconds (default: 120)')
+        parser.add_argument('--dtype', choices=['float32', 'int16'], default='float32')
+        parser.add_argument('--legacy', action='store_true',
+                            help='Also measure the old whole-file sf.read path (needs a lot of memory)')
+
+    def handle(self, *args, **options):
+        ctx = multiprocessing.get_context('spawn')
+        channels = list(range(options['speakers']))
+        results = []
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for hours in options['hours']:
+                audio_path = os.path.join(tmpdir, f'session_{hours}h.flac')
+                self.stdout.write(f'Generating {hours}h x {len(channels)} channels...')
+                write_synthetic_flac(audio_path, hours * 3600, len(channels), options['samplerate'])
+
+                modes = [False, True] if options['legacy'] else [False]
+                for legacy in modes:
+                    with ctx.Pool(1) as pool:
+                        result = pool.apply(_measure_decode, (
+                            audio_path, channels, options['window_seconds'], options['dtype'], legacy
+                        ))
+                    result.update({
+                        'hours': hours,
+                        'channels': len(channels),
+                        'mode': 'sf.read' if legacy else 'streaming',
+                        'file_mb': os.path.getsize(audio_path) / (1024 * 1024),
+                    })
+                    results.append(result)
+                    self.stdout.write(
+                        f"{result['mode']:>9} {hours:>5}h: peak RSS {result['peak_rss_mb']:.1f} MiB "
+                        f"(baseline {result['baseline_rss_mb']:.1f} MiB), {result['seconds']:.1f}s"
+                    )
+
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,59 @@
+import json
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from protocols.core.engines.factory import create_engine
+from protocols.core.engines.parallel import ParallelEngine, available_cores
+
+
+class Command(BaseCommand):
+    help = 'Measures channel transcription wall time with a process pool, using MockEngine latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--speakers', type=int, default=8, help='Number of channels (default: 8)')
+        parser.add_argument('--seconds', type=float, default=60.0, help='Audio per channel (default: 60)')
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help='Mock inference seconds per audio second (default: 0.05)')
+        parser.add_argument('--workers', type=int, nargs='+', default=None,
+                            help='Pool sizes to compare (default: 1, 2, 4 ... up to the core count)')
+
+    def handle(self, *args, **options):
+        samplerate = 16000
+        speakers = options['speakers']
+        data = np.zeros((int(options['seconds'] * samplerate), speakers), dtype=np.float32)
+        users = {str(i): {'name': f'Speaker{i}', 'channel': i} for i in range(speakers)}
+        engine_options = {'model_name': None, 'batch_size': 1, 'mock_latency': options['latency']}
+
+        worker_counts = options['workers']
+        if not worker_counts:
+            worker_counts, n = [], 1
+            while n <= available_cores():
+                worker_counts.append(n)
+                n *= 2
+
+        results = []
+        for workers in worker_counts:
+            if workers <= 1:
+                engine = create_engine('mock', engine_options)
+            else:
+                engine = ParallelEngine('mock', engine_options, workers=workers)
+                # Start the pool outside the timed region, like a warm worker
+                engine.transcribe_batch([data[:1, 0]] * workers, samplerate)
+
+            start = time.perf_counter()
+            transcripts = engine.transcribe(data, samplerate, users)
+            elapsed = time.perf_counter() - start
+            if workers > 1:
+                engine.shutdown()
+
+            results.append({'workers': workers, 'seconds': elapsed, 'segments': len(transcripts)})
+            speedup = results[0]['seconds'] / elapsed
+            self.stdout.write(f'{workers:>3} workers: {elapsed:.2f}s (speedup x{speedup:.2f})')
+
+        self.stdout.write(json.dumps({
+            'speakers': speakers,
+            'audio_seconds': options['seconds'],
+            'latency': options['latency'],
+            'cores': available_cores(),
+            'results': results,
+        }, indent=2))
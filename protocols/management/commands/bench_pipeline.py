@@ -0,0 +1,285 @@
+import json
+import multiprocessing
+import os
+import platform
+import tempfile
+import time
+from unittest.mock import patch
+from django.core.management.base import BaseCommand, CommandError
+from protocols.bench.s3stub import S3Stub
+from protocols.bench.synthetic import peak_rss_mb, synthetic_meta, write_synthetic_flac, write_synthetic_tracks
+from protocols.core.tracks import track_content_type, track_key
+
+STAGES = ('download', 'decode', 'channel_split', 'asr', 'timeline', 'render', 'upload')
+BUCKET = 'protoscript-bench'
+JOB_ID = 'bench-pipeline'
+# Options that define a run; reports are only compared if they match
+CONFIG_OPTIONS = (
+    'speakers', 'duration', 'samplerate', 'events_per_minute', 'engine', 'latency', 'vad',
+    'window_seconds', 'dtype', 'template', 'repeat', 'format',
+)
+# Stages faster than this are too noisy to flag as regressions
+NOISE_FLOOR_SECONDS = 0.05
+
+
+def timed(iterable, timings, stage):
+    """
+    Passes ``iterable`` through, adding the time spent producing each item
+    to ``timings[stage]``.
+    """
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timings[stage] += time.perf_counter() - start
+            return
+        timings[stage] += time.perf_counter() - start
+        yield item
+
+
+def _run_pipeline(config):
+    # Runs in a fresh interpreter so ru_maxrss only reflects this run
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ProtoScript.settings')
+    django.setup()
+
+    import soundfile as sf
+    from django.test import override_settings
+    from protocols.core import audio
+    from protocols.core.engines.factory import get_stt_engine
+    from protocols.core.s3_storage import S3Storage
+    from protocols.core.templates import get_template_registry
+    from protocols.core.tracks import map_tracks
+    from protocols.core.utils import iter_timeline, parse_dt, render_protocol_stream
+    from protocols.worker.tasks import fetch_tracks
+
+    timings = dict.fromkeys(STAGES, 0.0)
+    rss = {}
+    storage = S3Storage()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = time.perf_counter()
+        meta_data = storage.download_json(f'jobs/{JOB_ID}/meta.json')
+        users = meta_data['users']
+        if config['format'] == 'opus':
+            # One file per speaker, fetched in parallel as in the worker
+            users, channel_tracks = map_tracks(users, [f'{user_id}.ogg' for user_id in users])
+            track_paths = fetch_tracks(storage, JOB_ID, channel_tracks, tmpdir)
+        else:
+            audio_path = os.path.join(tmpdir, 'audio.flac')
+            storage.download_file(f'jobs/{JOB_ID}/audio.flac', audio_path)
+        timings['download'] = time.perf_counter() - start
+        rss['download'] = peak_rss_mb()
+
+        overrides = {}
+        if config['engine'] == 'mock':
+            overrides.update(STT_ENGINE='mock', STT_MOCK_LATENCY=config['latency'])
+        if config['vad']:
+            overrides['VAD_ENGINE'] = config['vad']
+        with override_settings(**overrides):
+            engine = get_stt_engine()
+        # Keeping every segment would inflate the peak RSS
+        engine.record = False
+
+        # Decode, split and ASR are interleaved window by window as in the
+        # worker; each gets the time spent in its own code
+        stats = {}
+        transcriptions = []
+        if config['format'] == 'opus':
+            # The tracks decode on their own threads, ahead of the ASR; only
+            # the time ASR waits for them counts, and there is nothing to split
+            samplerate = sf.info(next(iter(track_paths.values()))).samplerate
+            windows = timed(
+                audio.iter_track_windows(track_paths, config['window_seconds'], dtype=config['dtype']),
+                timings, 'decode'
+            )
+            for window in windows:
+                start = time.perf_counter()
+                transcriptions.extend(engine.transcribe_windows([window], samplerate, users, stats=stats))
+                timings['asr'] += time.perf_counter() - start
+        else:
+            with sf.SoundFile(audio_path) as f:
+                channels = audio.mapped_channels(users, f.channels)
+                window_frames = max(1, int(config['window_seconds'] * f.samplerate))
+                blocks = timed(
+                    f.blocks(blocksize=min(audio.READ_BLOCK_FRAMES, window_frames), dtype=config['dtype'],
+                             always_2d=True),
+                    timings, 'decode'
+                )
+                windows = timed(
+                    audio._collect_windows(blocks, f.samplerate, channels, window_frames, config['dtype']),
+                    timings, 'channel_split'
+                )
+                for window in windows:
+                    start = time.perf_counter()
+                    transcriptions.extend(engine.transcribe_windows([window], f.samplerate, users, stats=stats))
+                    timings['asr'] += time.perf_counter() - start
+            timings['channel_split'] -= timings['decode']
+        rss['decode'] = rss['channel_split'] = rss['asr'] = peak_rss_mb()
+
+        start = time.perf_counter()
+        timeline_items = sum(1 for _ in iter_timeline(meta_data, transcriptions, parse_dt(meta_data['start_time'])))
+        timings['timeline'] = time.perf_counter() - start
+        rss['timeline'] = peak_rss_mb()
+
+        # The render streams from the same merge; its own share is the rest
+        start = time.perf_counter()
+        template = get_template_registry().get(config['template'])
+        chunks = list(render_protocol_stream(meta_data, transcriptions, template))
+        timings['render'] = max(0.0, time.perf_counter() - start - timings['timeline'])
+        rss['render'] = peak_rss_mb()
+
+        start = time.perf_counter()
+        storage.save_transcripts(JOB_ID, transcriptions)
+        storage.save_result_stream(JOB_ID, iter(chunks))
+        timings['upload'] = time.perf_counter() - start
+        rss['upload'] = peak_rss_mb()
+
+    return {
+        'timings': timings,
+        'peak_rss_mb': rss,
+        'transcripts': len(transcriptions),
+        'timeline_items': timeline_items,
+        'protocol_bytes': sum(len(chunk.encode('utf-8')) for chunk in chunks),
+        'speech_ratio': stats.get('speech_ratio'),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs the processing pipeline on a synthetic session against a local S3 stand-in and reports wall '
+        'time, peak RSS and real-time factor per stage as JSON, optionally compared with an earlier run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--speakers', type=int, default=4, help='Channels, one speaker each (default: 4)')
+        parser.add_argument('--duration', type=float, default=600.0, help='Session length in seconds (default: 600)')
+        parser.add_argument('--samplerate', type=int, default=48000, help='Sample rate (default: 48000)')
+        parser.add_argument('--events-per-minute', type=float, default=2.0,
+                            help='Bot events in meta.json per minute (default: 2)')
+        parser.add_argument('--engine', choices=['mock', 'configured'], default='mock',
+                            help="'mock' or the engine configured by STT_ENGINE (default: mock)")
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Mock engine seconds per second of speech (default: 0)')
+        parser.add_argument('--vad', choices=['none', 'energy'], help='VAD_ENGINE for the run (default: settings)')
+        parser.add_argument('--window-seconds', type=float, default=120.0, help='Decode window (default: 120)')
+        parser.add_argument('--dtype', choices=['float32', 'int16'], default='float32')
+        parser.add_argument('--format', choices=['flac', 'opus'], default='flac',
+                            help="Upload one multi-channel FLAC file or an Ogg Opus track per speaker (default: flac)")
+        parser.add_argument('--template', default='default.md.j2')
+        parser.add_argument('--repeat', type=int, default=1,
+                            help='Runs; the fastest time of each stage is reported (default: 1)')
+        parser.add_argument('--output', help='Also write the JSON report to this file')
+        parser.add_argument('--compare', help='JSON report of an earlier run to check for regressions')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed slowdown per stage against --compare (default: 0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        config = {key: options[key] for key in CONFIG_OPTIONS}
+        duration = config['duration']
+        ctx = multiprocessing.get_context('spawn')
+
+        with tempfile.TemporaryDirectory() as tmpdir, S3Stub() as stub:
+            start = time.perf_counter()
+            meta_data = synthetic_meta(duration, options['speakers'], options['events_per_minute'])
+            if config['format'] == 'opus':
+                uploads = {
+                    track_key(JOB_ID, f'{user_id}.ogg'): os.path.join(tmpdir, f'{user_id}.ogg')
+                    for user_id in meta_data['users']
+                }
+                write_synthetic_tracks(list(uploads.values()), duration, options['samplerate'])
+            else:
+                uploads = {f'jobs/{JOB_ID}/audio.flac': os.path.join(tmpdir, 'audio.flac')}
+                write_synthetic_flac(uploads[f'jobs/{JOB_ID}/audio.flac'], duration, options['speakers'],
+                                     options['samplerate'])
+            generate_seconds = time.perf_counter() - start
+
+            stub.create_bucket(BUCKET)
+            for key, path in uploads.items():
+                with open(path, 'rb') as f:
+                    stub.put(BUCKET, key, f.read(), content_type=track_content_type(path))
+            stub.put(BUCKET, f'jobs/{JOB_ID}/meta.json', json.dumps(meta_data), content_type='application/json')
+
+            env = {
+                'S3_ENDPOINT_URL': stub.endpoint_url,
+                'S3_BUCKET_NAME': BUCKET,
+                'S3_ACCESS_KEY': 'bench',
+                'S3_SECRET_KEY': 'bench',
+            }
+            runs = []
+            with patch.dict(os.environ, env):
+                for _ in range(max(1, options['repeat'])):
+                    with ctx.Pool(1) as pool:
+                        runs.append(pool.apply(_run_pipeline, (config,)))
+            # What a client uploads and the worker downloads
+            file_mb = sum(os.path.getsize(path) for path in uploads.values()) / (1024 * 1024)
+
+        stages = {
+            stage: {
+                'seconds': min(run['timings'][stage] for run in runs),
+                'peak_rss_mb': max(run['peak_rss_mb'][stage] for run in runs),
+            }
+            for stage in STAGES
+        }
+        for result in stages.values():
+            result['rtf'] = result['seconds'] / duration
+        total = sum(result['seconds'] for result in stages.values())
+        report = {
+            'config': config,
+            'environment': {
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+            },
+            'generate_seconds': generate_seconds,
+            'file_mb': file_mb,
+            'stages': stages,
+            'total_seconds': total,
+            'rtf': total / duration,
+            'peak_rss_mb': max(result['peak_rss_mb'] for result in stages.values()),
+            'transcripts': runs[0]['transcripts'],
+            'timeline_items': runs[0]['timeline_items'],
+            'protocol_bytes': runs[0]['protocol_bytes'],
+        }
+
+        for stage, result in stages.items():
+            self.stdout.write(
+                f"{stage:>13}: {result['seconds']:8.3f}s  RTF {result['rtf']:.4f}  "
+                f"peak RSS {result['peak_rss_mb']:.1f} MiB"
+            )
+        self.stdout.write(f"{'total':>13}: {total:8.3f}s  RTF {report['rtf']:.4f} for {duration:.0f}s of audio")
+        self.stdout.write(f"{'audio size':>13}: {file_mb:8.2f} MiB of {config['format']}")
+
+        regressions = []
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = self._regressions(baseline, report, options['tolerance'])
+            report['regressions'] = regressions
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+        if regressions:
+            raise CommandError('Slower than the baseline: ' + ', '.join(
+                f"{r['stage']} {r['baseline_seconds']:.3f}s -> {r['seconds']:.3f}s" for r in regressions
+            ))
+
+    @staticmethod
+    def _regressions(baseline, report, tolerance):
+        if baseline.get('config') != report['config']:
+            raise CommandError('The baseline was run with a different configuration.')
+        pairs = [
+            (stage, baseline['stages'][stage]['seconds'], result['seconds'])
+            for stage, result in report['stages'].items() if stage in baseline.get('stages', {})
+        ]
+        pairs.append(('total', baseline['total_seconds'], report['total_seconds']))
+        return [
+            {'stage': stage, 'baseline_seconds': before, 'seconds': after}
+            for stage, before, after in pairs
+            if after > NOISE_FLOOR_SECONDS and after > before * (1 + tolerance)
+        ]
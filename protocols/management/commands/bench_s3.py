@@ -0,0 +1,62 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from protocols.bench.s3stub import S3Stub
+from protocols.core import s3_storage
+
+
+class Command(BaseCommand):
+    help = 'Requests per second of the result endpoint against a local S3 stand-in, with and without the shared client.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Requests per mode (default: 300)')
+        parser.add_argument('--threads', type=int, default=4, help='Concurrent clients (default: 4)')
+        parser.add_argument('--result-kb', type=int, default=32, help='Size of result.md in KiB (default: 32)')
+
+    def handle(self, *args, **options):
+        bucket = 'protoscript-bench'
+        job_id = '550e8400-e29b-41d4-a716-446655440000'
+
+        with S3Stub() as stub:
+            stub.create_bucket(bucket)
+            stub.put(bucket, f'jobs/{job_id}/status.json', json.dumps({'id': job_id, 'status': 'completed'}))
+            stub.put(bucket, f'jobs/{job_id}/result.md', 'x' * options['result_kb'] * 1024)
+
+            env = {
+                'S3_ENDPOINT_URL': stub.endpoint_url,
+                'S3_BUCKET_NAME': bucket,
+                'S3_ACCESS_KEY': 'bench',
+                'S3_SECRET_KEY': 'bench',
+            }
+            url = reverse('protocol_result', kwargs={'job_id': job_id})
+            results = {}
+            with patch.dict(os.environ, env):
+                for mode in ('client_per_request', 'shared_client'):
+                    s3_storage.reset_s3_client()
+                    factory = s3_storage.create_s3_client if mode == 'client_per_request' else s3_storage.get_s3_client
+                    with patch.object(s3_storage, 'get_s3_client', factory):
+                        results[mode] = self._run(url, options['requests'], options['threads'])
+                    self.stdout.write(f"{mode:>18}: {results[mode]['requests_per_second']:.1f} req/s")
+            s3_storage.reset_s3_client()
+
+        results['speedup'] = results['shared_client']['requests_per_second'] / results['client_per_request']['requests_per_second']
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def _run(self, url, requests, threads):
+        def fetch(_):
+            response = Client().get(url, HTTP_HOST='localhost')
+            if response.status_code != 200:
+                raise RuntimeError(f'Unexpected status {response.status_code}')
+
+        # Warm up imports and, for the shared client, its connection pool
+        fetch(None)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - start
+        return {'requests': requests, 'threads': threads, 'seconds': elapsed, 'requests_per_second': requests / elapsed}
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand
+from protocols.core.templates import get_template_registry
+from protocols.core.utils import parse_dt, render_protocol_stream
+
+
+def synthetic_session(items, speakers, event_ratio=0.02):
+    """
+    Builds meta.json data and engine-ordered transcriptions (channel by
+    channel, each in time order) with ``items`` timeline entries in total.
+    """
+    start = datetime(2026, 1, 30, 20, 0, 0)
+    n_events = max(1, int(items * event_ratio))
+    n_transcripts = items - n_events
+    duration = max(60.0, n_transcripts * 2.0 / speakers)
+    meta_data = {
+        'guild_id': 1,
+        'start_time': start.isoformat(),
+        'end_time': (start + timedelta(seconds=duration)).isoformat(),
+        'users': {str(u): {'name': f'Speaker{u}', 'channel': u} for u in range(speakers)},
+        'events': [
+            {'timestamp': (start + timedelta(seconds=duration * i / n_events)).isoformat(), 'message': f'Event {i}'}
+            for i in range(n_events)
+        ],
+    }
+    per_speaker = n_transcripts // speakers
+    transcriptions = [
+        {'type': 'transcript', 'timestamp': (i + u / speakers) * duration / max(1, per_speaker),
+         'user_id': str(u), 'user_name': f'Speaker{u}', 'text': f'Segment {i} of speaker {u}, some words here.'}
+        for u in range(speakers) for i in range(per_speaker)
+    ]
+    return meta_data, transcriptions
+
+
+def sorted_list_render(meta_data, transcriptions, template):
+    # The previous implementation: one list, one sort, one string
+    start_time = parse_dt(meta_data['start_time'])
+    timeline = [
+        {'type': 'event', 'timestamp': parse_dt(e['timestamp']), 'content': e['message']}
+        for e in meta_data['events']
+    ]
+    for t in transcriptions:
+        timeline.append({
+            'type': 'transcript', 'timestamp': start_time + timedelta(seconds=t['timestamp']),
+            'user_id': t['user_id'], 'user_name': t['user_name'], 'text': t['text']
+        })
+    timeline.sort(key=lambda x: x['timestamp'])
+    meta = dict(meta_data, start_time=start_time, end_time=parse_dt(meta_data['end_time']))
+    for uid, uinfo in meta['users'].items():
+        uinfo['id'] = uid
+    return [template.render(meta=meta, timeline=timeline)]
+
+
+def consume(render):
+    digest = hashlib.sha256()
+    size = 0
+    start = time.perf_counter()
+    first_byte = None
+    for chunk in render():
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        data = chunk.encode('utf-8')
+        digest.update(data)
+        size += len(data)
+    return time.perf_counter() - start, first_byte, size, digest.hexdigest()
+
+
+def measure(render):
+    # Timed without tracemalloc, which would skew the comparison
+    elapsed, first_byte, size, sha256 = consume(render)
+    tracemalloc.start()
+    consume(render)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'seconds': elapsed,
+        'first_byte_seconds': first_byte,
+        'peak_mb': peak / (1024 * 1024),
+        'bytes': size,
+        'sha256': sha256,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compares sorted-list rendering with the streaming timeline merge and render.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='Timeline sizes (default: 10k 100k 1M)')
+        parser.add_argument('--speakers', type=int, default=10, help='Number of speakers (default: 10)')
+        parser.add_argument('--template', default='default.md.j2')
+
+    def handle(self, *args, **options):
+        template = get_template_registry().get(options['template'])
+        results = []
+        for items in options['items']:
+            meta_data, transcriptions = synthetic_session(items, options['speakers'])
+            legacy = measure(lambda: sorted_list_render(meta_data, transcriptions, template))
+            streaming = measure(lambda: render_protocol_stream(meta_data, transcriptions, template))
+            if legacy['sha256'] != streaming['sha256']:
+                raise AssertionError(f'Rendered output differs for {items} items')
+
+            results.append({'items': items, 'sorted_list': legacy, 'streaming': streaming})
+            self.stdout.write(
+                f"{items:>9} items: sorted list {legacy['seconds']:.2f}s / {legacy['peak_mb']:.1f} MiB peak, "
+                f"streaming {streaming['seconds']:.2f}s / {streaming['peak_mb']:.1f} MiB peak, "
+                f"first byte after {streaming['first_byte_seconds'] * 1000:.1f} ms"
+            )
+
+        self.stdout.write(json.dumps(results, indent=2))
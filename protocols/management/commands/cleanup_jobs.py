@@ -1,7 +1,21 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import timedelta, datetime
-from protocols.core.s3_storage import S3Storage
+from protocols.core.s3_storage import DELETE_BATCH_SIZE, S3Storage
+from protocols.core.status.factory import get_status_store
+
+def iter_jobs(job_objects):
+    """
+    Groups the adjacent ``(job_id, key, last_modified)`` tuples of a listing
+    into ``(job_id, keys, newest_last_modified)``.
+    """
+    for job_id, objects in itertools.groupby(job_objects, key=lambda obj: obj[0]):
+        objects = list(objects)
+        yield job_id, [obj[1] for obj in objects], max(obj[2] for obj in objects)
 
 class Command(BaseCommand):
     help = 'Deletes old protocol jobs from S3.'
@@ -11,35 +25,118 @@ class Command(BaseCommand):
             '--minutes',
             type=int,
             default=60,
-            help='Delete jobs older than this many minutes (default: 60)'
+            help='Delete jobs whose newest object is older than this many minutes (default: 60)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Concurrent DeleteObjects requests (default: 8)'
+        )
+        parser.add_argument(
+            '--max-rate',
+            type=float,
+            default=0,
+            help='Maximum DeleteObjects requests per second, 0 for no limit (default: 0)'
+        )
+        parser.add_argument(
+            '--progress-interval',
+            type=float,
+            default=10,
+            help='Seconds between progress reports, 0 to disable (default: 10)'
         )
 
     def handle(self, *args, **options):
-        minutes = options['minutes']
-        threshold = timezone.now() - timedelta(minutes=minutes)
+        # Age comes from LastModified in one flat listing of jobs/, so no
+        # status is downloaded per job. A job counts as old once its newest
+        # object (usually the final status.json) is past the threshold.
+        threshold = timezone.now() - timedelta(minutes=options['minutes'])
+        dry_run = options['dry_run']
         storage = S3Storage()
-        
-        job_ids = storage.list_job_ids()
-        count = 0
-        
-        for job_id in job_ids:
-            status = storage.get_status(job_id)
-            if not status:
-                # If no status file, maybe it's broken or partially uploaded, delete it?
-                # For safety, let's only delete if it's really old based on S3 metadata?
-                # Actually, let's just skip it if we can't determine age.
-                continue
-            
-            created_at_str = status.get('created_at')
-            if created_at_str:
-                created_at = datetime.fromisoformat(created_at_str)
-                # Ensure it's timezone aware for comparison if needed
-                if created_at.tzinfo is None:
-                    from django.utils.timezone import make_aware
-                    created_at = make_aware(created_at)
-                
-                if created_at < threshold:
-                    storage.delete_job(job_id)
-                    count += 1
-            
-        self.stdout.write(self.style.SUCCESS(f'Successfully deleted {count} old jobs from S3.'))
+        store = get_status_store()
+
+        self.counts = {'jobs_scanned': 0, 'jobs_deleted': 0, 'keys_deleted': 0, 'errors': 0}
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        interval = options['max_rate'] and 1.0 / options['max_rate']
+        next_request = time.monotonic()
+        last_report = self.started
+
+        keys, job_ids = [], []
+        workers = max(1, options['workers'])
+        # Bounds the batches waiting for a worker, and with it memory
+        in_flight = threading.BoundedSemaphore(workers * 2)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            def submit(batch_keys, batch_job_ids):
+                nonlocal next_request
+                if dry_run:
+                    with self.lock:
+                        self.counts['keys_deleted'] += len(batch_keys)
+                    return
+                if interval:
+                    delay = next_request - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_request = max(next_request, time.monotonic()) + interval
+                in_flight.acquire()
+                future = pool.submit(self._delete_batch, storage, store, batch_keys, batch_job_ids)
+                future.add_done_callback(lambda _: in_flight.release())
+
+            for job_id, job_keys, last_modified in iter_jobs(storage.iter_job_objects()):
+                self.counts['jobs_scanned'] += 1
+                if last_modified < threshold:
+                    with self.lock:
+                        self.counts['jobs_deleted'] += 1
+                    keys.extend(job_keys)
+                    job_ids.append(job_id)
+                    # A job's keys may be split over two batches; its status
+                    # goes with the batch holding its last key
+                    while len(keys) >= DELETE_BATCH_SIZE:
+                        batch_job_ids = job_ids if len(keys) == DELETE_BATCH_SIZE else job_ids[:-1]
+                        submit(keys[:DELETE_BATCH_SIZE], batch_job_ids)
+                        keys = keys[DELETE_BATCH_SIZE:]
+                        job_ids = job_ids[len(batch_job_ids):]
+
+                if options['progress_interval'] and time.monotonic() - last_report >= options['progress_interval']:
+                    last_report = time.monotonic()
+                    self._report_progress(dry_run)
+
+            if keys:
+                submit(keys, job_ids)
+
+        if self.counts['errors']:
+            self.stderr.write(f"{self.counts['errors']} keys could not be deleted.")
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f"Would delete {self.counts['jobs_deleted']} old jobs ({self.counts['keys_deleted']} objects) "
+                f"of {self.counts['jobs_scanned']} from S3."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Successfully deleted {self.counts['jobs_deleted']} old jobs from S3."))
+
+    def _delete_batch(self, storage, store, keys, job_ids):
+        try:
+            failed = storage.delete_keys(keys)
+            store.delete_many(job_ids)
+        except Exception as e:
+            self.stderr.write(f'Delete batch failed: {e}')
+            failed = keys
+        with self.lock:
+            self.counts['keys_deleted'] += len(keys) - len(failed)
+            self.counts['errors'] += len(failed)
+
+    def _report_progress(self, dry_run):
+        elapsed = time.monotonic() - self.started
+        with self.lock:
+            counts = dict(self.counts)
+        verb = 'to delete' if dry_run else 'deleted'
+        self.stdout.write(
+            f"[{elapsed:.0f}s] scanned {counts['jobs_scanned']} jobs, {counts['jobs_deleted']} old; "
+            f"{counts['keys_deleted']} objects {verb}, {counts['errors']} errors"
+        )
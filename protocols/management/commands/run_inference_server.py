@@ -0,0 +1,55 @@
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from protocols.core import metrics
+from protocols.core.engines.factory import create_engine
+from protocols.core.engines.server import InferenceServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads the STT model once and serves worker processes running with STT_ENGINE=remote over a Unix '
+        'socket, batching segments across their requests. Run one per node.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=getattr(settings, 'STT_SERVER_SOCKET', '/tmp/protoscript-stt.sock'))
+        parser.add_argument('--engine', default=getattr(settings, 'STT_SERVER_ENGINE', 'whisper'),
+                            help="Engine that owns the model, e.g. 'whisper' (default: STT_SERVER_ENGINE)")
+        parser.add_argument('--max-batch-size', type=int,
+                            default=getattr(settings, 'STT_SERVER_MAX_BATCH_SIZE', 8))
+        parser.add_argument('--max-wait-ms', type=float, default=getattr(settings, 'STT_SERVER_MAX_WAIT_MS', 10.0),
+                            help='How long a batch waits for more segments after the first')
+        parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this port')
+
+    def handle(self, *args, **options):
+        engine_type = options['engine'].lower()
+        if engine_type == 'remote':
+            raise CommandError('The server needs an engine that runs the model, not another remote one.')
+        model_name = getattr(settings, 'STT_MODEL', 'openai/whisper-tiny')
+        engine = create_engine(engine_type, {
+            'model_name': model_name,
+            'batch_size': options['max_batch_size'],
+            'mock_latency': getattr(settings, 'STT_MOCK_LATENCY', 0.0),
+        })
+        # Reported to clients, which cache transcripts under it, and in metrics
+        engine.cache_options = {'engine': engine_type, 'model': model_name}
+        if options['metrics_port']:
+            metrics.serve(options['metrics_port'])
+
+        server = InferenceServer(
+            engine, options['socket'],
+            max_batch_size=options['max_batch_size'],
+            max_wait=options['max_wait_ms'] / 1000
+        )
+
+        def stop(signum, frame):
+            # Leaves serve_forever, which removes the socket
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(f"Serving {engine_type} on {options['socket']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
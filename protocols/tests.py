@@ -1,20 +1,29 @@
-from django.test import SimpleTestCase, Client
+from django.test import SimpleTestCase, Client, override_settings
 from django.urls import reverse
 import json
 import os
 from unittest.mock import patch, MagicMock
 
+@override_settings(STATUS_BACKEND='memory')
 class ProtocolApiTests(SimpleTestCase):
     def setUp(self):
+        from protocols.core.status.factory import get_status_store
+        get_status_store().clear()
         self.client = Client()
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         self.meta_path = os.path.join(self.base_dir, 'tests/assets/meta.json')
         self.audio_path = os.path.join(self.base_dir, 'tests/assets/audio_protocol.flac')
 
+    def mock_upload_storage(self, mock_storage_class):
+        from protocols.core.s3_storage import S3Storage
+        mock_storage = mock_storage_class.return_value
+        mock_storage.multipart_part_size = S3Storage.multipart_part_size
+        return mock_storage
+
     @patch('protocols.api.views.S3Storage')
     @patch('protocols.api.views.get_queue_backend')
     def test_protocol_request_success(self, mock_get_queue, mock_storage_class):
-        mock_storage = mock_storage_class.return_value
+        mock_storage = self.mock_upload_storage(mock_storage_class)
         mock_queue = mock_get_queue.return_value
         url = reverse('protocol_request')
         
@@ -29,9 +38,12 @@ class ProtocolApiTests(SimpleTestCase):
         self.assertIn('id', data)
         self.assertEqual(data['status'], 'pending')
         
-        # Verify S3 calls
-        self.assertTrue(mock_storage.upload_file.called)
-        self.assertTrue(mock_storage.update_status.called)
+        # Verify S3 and status store calls
+        from protocols.core.status.factory import get_status_store
+        uploaded = {c.args[0] for c in mock_storage.upload_bytes.call_args_list}
+        self.assertEqual(uploaded, {f"jobs/{data['id']}/meta.json", f"jobs/{data['id']}/audio.flac"})
+        self.assertFalse(mock_storage.upload_file.called)
+        self.assertEqual(get_status_store().get(data['id'])['status'], 'pending')
         # Verify Queue call
         self.assertTrue(mock_queue.enqueue_protocol_job.called)
 
@@ -63,6 +75,147 @@ class ProtocolApiTests(SimpleTestCase):
         self.assertEqual(data['status'], 'completed')
         self.assertEqual(data['result_markdown'], '# Done')
 
+    @patch('protocols.api.views.S3Storage')
+    @patch('protocols.api.views.get_queue_backend')
+    def test_protocol_request_multiple_templates(self, mock_get_queue, mock_storage_class):
+        self.mock_upload_storage(mock_storage_class)
+        mock_queue = mock_get_queue.return_value
+        url = reverse('protocol_request')
+
+        with open(self.meta_path, 'rb') as meta_file, open(self.audio_path, 'rb') as audio_file:
+            response = self.client.post(url, {
+                'meta': meta_file,
+                'audio': audio_file,
+                'templates': ['discord.md.j2', 'default.md.j2']
+            })
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['template_name'], 'discord.md.j2')
+        mock_queue.enqueue_protocol_job.assert_called_once_with(
+            response.json()['id'],
+            template_name='discord.md.j2',
+            template_names=['discord.md.j2', 'default.md.j2'],
+            cost=response.json()['estimated_cost_seconds']
+        )
+
+    @patch('protocols.api.views.S3Storage')
+    def test_protocol_render_from_stored_transcript(self, mock_storage_class):
+        mock_storage = mock_storage_class.return_value
+        job_id = '550e8400-e29b-41d4-a716-446655440000'
+        with open(self.meta_path) as f:
+            mock_storage.get_meta.return_value = json.load(f)
+        mock_storage.get_transcripts.return_value = [
+            {'type': 'transcript', 'timestamp': 3.0, 'user_id': '103595873841188864',
+             'user_name': 'GiantTree', 'text': 'Stored transcript line'}
+        ]
+
+        url = reverse('protocol_render', kwargs={'job_id': job_id})
+        response = self.client.post(url, {'templates': ['default.md.j2', 'discord.md.j2']}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(set(results), {'default.md.j2', 'discord.md.j2'})
+        for markdown in results.values():
+            self.assertIn('Stored transcript line', markdown)
+        mock_storage.get_transcripts.assert_called_once_with(job_id)
+
+    @patch('protocols.api.views.S3Storage')
+    def test_protocol_render_before_transcript_exists(self, mock_storage_class):
+        mock_storage = mock_storage_class.return_value
+        mock_storage.get_transcripts.return_value = None
+        mock_storage.get_status.return_value = {'status': 'processing'}
+        job_id = '550e8400-e29b-41d4-a716-446655440000'
+
+        url = reverse('protocol_render', kwargs={'job_id': job_id})
+        response = self.client.post(url, {'templates': ['default.md.j2']}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+    @patch('protocols.api.views.S3Storage')
+    def test_protocol_render_without_meta(self, mock_storage_class):
+        mock_storage = mock_storage_class.return_value
+        mock_storage.get_transcripts.return_value = []
+        mock_storage.get_meta.return_value = None
+        job_id = '550e8400-e29b-41d4-a716-446655440000'
+
+        url = reverse('protocol_render', kwargs={'job_id': job_id})
+        response = self.client.post(url, {'templates': ['default.md.j2']}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    @patch('protocols.api.views.S3Storage')
+    def test_protocol_render_unknown_template_rejected(self, mock_storage_class):
+        job_id = '550e8400-e29b-41d4-a716-446655440000'
+        url = reverse('protocol_render', kwargs={'job_id': job_id})
+        response = self.client.post(url, {'templates': ['nonexistent.md.j2']}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('templates', response.json())
+        self.assertFalse(mock_storage_class.return_value.get_transcripts.called)
+
+    @patch('protocols.api.views.S3Storage')
+    @patch('protocols.api.views.get_queue_backend')
+    def test_protocol_request_unknown_template_rejected(self, mock_get_queue, mock_storage_class):
+        mock_storage = self.mock_upload_storage(mock_storage_class)
+        url = reverse('protocol_request')
+        with open(self.meta_path, 'rb') as meta_file, open(self.audio_path, 'rb') as audio_file:
+            response = self.client.post(url, {
+                'meta': meta_file,
+                'audio': audio_file,
+                'template': '../settings.py'
+            })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('template', response.json())
+        self.assertTrue(mock_storage.delete_job.called)
+        self.assertFalse(mock_get_queue.return_value.enqueue_protocol_job.called)
+
+    def test_protocol_job_list(self):
+        from protocols.core.status.factory import get_status_store
+        store = get_status_store()
+        for i, state in enumerate(['completed', 'failed', 'failed']):
+            store.update(f'00000000-0000-0000-0000-00000000000{i}', {
+                'status': state, 'template_name': 'default.md.j2',
+                'created_at': f'2026-01-30T20:00:0{i}+00:00', 'processing_seconds': 1.5
+            })
+        url = reverse('protocol_jobs')
+
+        response = self.client.get(url, {'status': 'failed', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([job['id'] for job in data['jobs']], ['00000000-0000-0000-0000-000000000002'])
+        self.assertEqual(data['jobs'][0]['processing_seconds'], 1.5)
+
+        data = self.client.get(url, {'status': 'failed', 'limit': 1, 'cursor': data['next_cursor']}).json()
+        self.assertEqual([job['id'] for job in data['jobs']], ['00000000-0000-0000-0000-000000000001'])
+        self.assertIsNone(data['next_cursor'])
+
+        self.assertEqual(self.client.get(url, {'cursor': 'nope'}).status_code, 400)
+
+    @patch('protocols.api.views.S3Storage')
+    @patch('protocols.api.views.get_queue_backend')
+    def test_protocol_request_rejected_when_queue_full(self, mock_get_queue, mock_storage_class):
+        from protocols.core.queue.base import QueueFull
+        mock_storage = self.mock_upload_storage(mock_storage_class)
+        mock_queue = mock_get_queue.return_value
+        url = reverse('protocol_request')
+
+        mock_queue.has_capacity.return_value = False
+        response = self.client.post(url, {})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+        # Filled up while the upload was running
+        mock_queue.has_capacity.return_value = True
+        mock_queue.enqueue_protocol_job.side_effect = QueueFull()
+        with open(self.meta_path, 'rb') as meta_file, open(self.audio_path, 'rb') as audio_file:
+            response = self.client.post(url, {'meta': meta_file, 'audio': audio_file})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(mock_storage.delete_job.called)
+
+    def test_protocol_template_list(self):
+        response = self.client.get(reverse('protocol_templates'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['templates'], ['default.md.j2', 'discord.md.j2'])
+
     def test_generate_protocol_logic(self):
         from protocols.core.utils import generate_protocol
         meta_data = {
@@ -107,3 +260,1810 @@ class EngineTests(SimpleTestCase):
             result = engine.transcribe(data, 16000, users)
             self.assertEqual(len(result), 1)
             self.assertEqual(result[0]['text'], 'This is a mock transcription.')
+            # Workers running the mock engine don't keep the audio they saw
+            self.assertEqual((engine.received_segments, engine.received_batches), ([], []))
+
+class AudioDecodeTests(SimpleTestCase):
+    def setUp(self):
+        self.audio_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests/assets/audio_protocol.flac')
+
+    def test_iter_channel_windows_matches_full_read(self):
+        import numpy as np
+        import soundfile as sf
+        from protocols.core.audio import iter_channel_windows
+
+        full, samplerate = sf.read(self.audio_path, dtype='float32')
+        windows = list(iter_channel_windows(self.audio_path, [1], window_seconds=10))
+
+        self.assertEqual([start for start, _ in windows], [0.0, 10.0, 20.0, 30.0, 40.0])
+        for _, channels in windows:
+            self.assertEqual(list(channels.keys()), [1])
+            self.assertLessEqual(len(channels[1]), 10 * samplerate)
+        streamed = np.concatenate([channels[1] for _, channels in windows])
+        np.testing.assert_array_equal(streamed, full[:, 1])
+
+    def test_transcribe_audio_offsets_window_timestamps(self):
+        from protocols.core import utils
+        from protocols.core.engines.mock import MockEngine
+
+        users = {'1': {'name': 'Alice', 'channel': 0}, '2': {'name': 'Bob', 'channel': 5}}
+        with self.settings(AUDIO_WINDOW_SECONDS=20, AUDIO_WINDOW_OVERLAP_SECONDS=0), \
+                patch.object(utils, 'get_engine', return_value=MockEngine()):
+            result = utils.transcribe_audio(self.audio_path, users)
+
+        self.assertEqual([t['timestamp'] for t in result], [1.0, 21.0, 41.0])
+        self.assertTrue(all(t['user_id'] == '1' for t in result))
+
+    def test_overlapping_windows_share_their_seams(self):
+        import numpy as np
+        import soundfile as sf
+        from protocols.core.audio import iter_channel_windows
+
+        whole = sf.read(self.audio_path, dtype='float32', always_2d=True)[0][:, 1]
+        windows = list(iter_channel_windows(self.audio_path, [1], window_seconds=10, overlap_seconds=2))
+        samplerate = sf.info(self.audio_path).samplerate
+
+        self.assertEqual([start for start, _ in windows], [0.0, 10.0, 20.0, 30.0])
+        for start, window in windows:
+            first = int(start * samplerate)
+            np.testing.assert_array_equal(window[1], whole[first:first + 12 * samplerate])
+        # The last window runs to the end instead of leaving a 0.05 s tail
+        self.assertEqual(len(windows[-1][1][1]), len(whole) - 30 * samplerate)
+
+    def test_speech_across_a_window_seam_is_transcribed_once(self):
+        import tempfile
+        import numpy as np
+        import soundfile as sf
+        from protocols.core import utils
+        from protocols.core.engines.base import STTEngine
+
+        class IslandEngine(STTEngine):
+            # "hello world" for a whole tone, only the half it heard of one
+            # cut by the window
+            def transcribe_channel(self, channel_data, samplerate):
+                voiced = np.flatnonzero(channel_data)
+                if not len(voiced):
+                    return []
+                words = []
+                if voiced[0] > 0:
+                    words.append('hello')
+                if voiced[-1] < len(channel_data) - 1:
+                    words.append('world')
+                return [{'type': 'transcript', 'timestamp': voiced[0] / samplerate, 'text': ' '.join(words)}]
+
+        samplerate = 16000
+        audio = np.zeros(12 * samplerate, dtype=np.float32)
+        audio[int(9.5 * samplerate):int(10.5 * samplerate)] = 0.5
+        users = {'1': {'name': 'Alice', 'channel': 0}}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'seam.flac')
+            sf.write(path, audio, samplerate)
+            with patch.object(utils, 'get_engine', return_value=IslandEngine()):
+                with self.settings(AUDIO_WINDOW_SECONDS=10, AUDIO_WINDOW_OVERLAP_SECONDS=0):
+                    cut = utils.transcribe_audio(path, users)
+                with self.settings(AUDIO_WINDOW_SECONDS=10, AUDIO_WINDOW_OVERLAP_SECONDS=2):
+                    whole = utils.transcribe_audio(path, users)
+
+        self.assertEqual([(t['timestamp'], t['text']) for t in cut], [(9.5, 'hello'), (10.0, 'world')])
+        self.assertEqual([(t['timestamp'], t['text']) for t in whole], [(9.5, 'hello world')])
+
+class VADTests(SimpleTestCase):
+    def _channel(self, samplerate=16000):
+        import numpy as np
+        # 1s silence, 1s tone, 2s silence, 0.5s tone, 1s silence
+        t = np.arange(samplerate) / samplerate
+        tone = (0.3 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        silence = np.zeros(samplerate, dtype=np.float32)
+        return np.concatenate([silence, tone, silence, silence, tone[:samplerate // 2], silence])
+
+    def test_energy_vad_finds_speech_islands(self):
+        from protocols.core.vad.energy import EnergyVAD
+        vad = EnergyVAD(padding_ms=0, min_speech_ms=100, min_silence_ms=200)
+        islands = vad.detect(self._channel(), 16000)
+        self.assertEqual(len(islands), 2)
+        self.assertAlmostEqual(islands[0][0] / 16000, 1.0, delta=0.03)
+        self.assertAlmostEqual(islands[0][1] / 16000, 2.0, delta=0.03)
+        self.assertAlmostEqual(islands[1][0] / 16000, 4.0, delta=0.03)
+
+    def test_engine_only_receives_speech_and_maps_timestamps(self):
+        from protocols.core.engines.factory import get_stt_engine
+        with self.settings(STT_ENGINE='mock', VAD_ENGINE='energy', VAD_PADDING_MS=0,
+                           VAD_MIN_SPEECH_MS=100, VAD_MIN_SILENCE_MS=200):
+            engine = get_stt_engine()
+        engine.record = True
+
+        import numpy as np
+        data = self._channel()[:, np.newaxis]
+        stats = {}
+        result = engine.transcribe(data, 16000, {'1': {'name': 'Alice', 'channel': 0}}, stats=stats)
+
+        self.assertEqual(len(engine.received_segments), 2)
+        self.assertAlmostEqual(len(engine.received_segments[0]) / 16000, 1.0, delta=0.06)
+        self.assertTrue(all(np.abs(s).max() > 0 for s in engine.received_segments))
+        # MockEngine reports 1.0s into each segment
+        self.assertAlmostEqual(result[0]['timestamp'], 2.0, delta=0.03)
+        self.assertAlmostEqual(result[1]['timestamp'], 5.0, delta=0.03)
+        self.assertAlmostEqual(stats['audio_seconds'], 5.5)
+        self.assertAlmostEqual(stats['skipped_seconds'], 4.0, delta=0.1)
+        self.assertAlmostEqual(stats['speech_ratio'], 1.5 / 5.5, delta=0.02)
+
+class BatchedEngineTests(SimpleTestCase):
+    def test_batches_span_channels_and_results_map_back(self):
+        import numpy as np
+        from protocols.core.engines.mock import MockEngine
+
+        class EchoEngine(MockEngine):
+            # Reports the channel's constant sample value as text
+            def transcribe_channel(self, channel_data, samplerate):
+                return [{'type': 'transcript', 'timestamp': 0.5, 'text': str(int(channel_data[0]))}]
+
+        data = np.tile(np.arange(5, dtype=np.float32), (100, 1))
+        users = {str(i): {'name': f'User{i}', 'channel': i} for i in range(5)}
+        engine = EchoEngine(batch_size=2, record=True)
+        result = engine.transcribe(data, 16000, users)
+
+        self.assertEqual(engine.received_batches, [2, 2, 1])
+        self.assertEqual([(t['user_id'], t['text']) for t in result], [(str(i), str(i)) for i in range(5)])
+        self.assertEqual([t['user_name'] for t in result], [f'User{i}' for i in range(5)])
+
+    def test_factory_passes_batch_size(self):
+        from protocols.core.engines.factory import get_stt_engine
+        with self.settings(STT_ENGINE='mock', STT_BATCH_SIZE=8):
+            engine = get_stt_engine()
+        self.assertEqual(engine.batch_size, 8)
+        # Transcripts don't depend on the batch size, so cache keys don't either
+        self.assertNotIn('batch_size', engine.cache_options)
+
+class ParallelEngineTests(SimpleTestCase):
+    def test_pool_transcribes_every_channel(self):
+        import numpy as np
+        from protocols.core.engines.factory import get_stt_engine
+        from protocols.core.engines.parallel import ParallelEngine
+
+        with self.settings(STT_ENGINE='mock', STT_WORKERS=2, STT_BATCH_SIZE=1):
+            engine = get_stt_engine()
+        self.assertIsInstance(engine, ParallelEngine)
+        self.assertEqual(engine.batch_size, 2)
+
+        data = np.zeros((1600, 3), dtype=np.float32)
+        users = {str(i): {'name': f'User{i}', 'channel': i} for i in range(3)}
+        try:
+            result = engine.transcribe(data, 16000, users)
+        finally:
+            engine.shutdown()
+
+        self.assertEqual([t['user_id'] for t in result], ['0', '1', '2'])
+        self.assertTrue(all(t['text'] == 'This is a mock transcription.' for t in result))
+
+class WorkerWarmupTests(SimpleTestCase):
+    def test_preload_and_warm_up_write_ready_file(self):
+        import tempfile
+        from protocols.core import metrics, utils
+        from protocols.worker import warmup
+
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                self.settings(STT_ENGINE='mock', WORKER_READY_FILE=os.path.join(tmpdir, 'ready')), \
+                patch.object(utils, '_engine', None), \
+                patch.dict(warmup.metrics, {'cold_start_seconds': None, 'warmup_seconds': None, 'first_job_seconds': None}):
+            warmup.preload_engine()
+            engine = utils.get_engine()
+            engine.record = True
+            self.assertFalse(os.path.exists(warmup.ready_file()))
+
+            warmup.warm_up_engine()
+            warmup.mark_ready()
+            warmup.record_job_duration(2.5)
+
+            self.assertEqual(len(engine.received_segments), 1)
+            with open(warmup.ready_file()) as f:
+                ready = json.load(f)
+            self.assertIsNotNone(ready['cold_start_seconds'])
+            self.assertIsNotNone(ready['warmup_seconds'])
+            self.assertEqual(ready['first_job_seconds'], 2.5)
+
+            # And scraped from /metrics
+            self.assertEqual(metrics.COLD_START_SECONDS.labels().value(), ready['cold_start_seconds'])
+            self.assertEqual(metrics.WARMUP_SECONDS.labels().value(), ready['warmup_seconds'])
+            self.assertEqual(metrics.FIRST_JOB_SECONDS.labels().value(), 2.5)
+            self.assertIn(f'protoscript_worker_first_job_seconds{{pid="{os.getpid()}"}} 2.5', metrics.collect())
+
+class TranscriptCacheTests(SimpleTestCase):
+    def test_second_run_is_served_from_disk_cache(self):
+        import tempfile
+        import numpy as np
+        from protocols.core.engines.factory import get_stt_engine
+
+        data = np.random.default_rng(0).random((1600, 2)).astype(np.float32)
+        users = {'1': {'name': 'Alice', 'channel': 0}, '2': {'name': 'Bob', 'channel': 1}}
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                self.settings(STT_ENGINE='mock', TRANSCRIPT_CACHE='disk', TRANSCRIPT_CACHE_DIR=tmpdir):
+            first_stats, second_stats = {}, {}
+            first = get_stt_engine().transcribe(data, 16000, users, stats=first_stats)
+            engine = get_stt_engine()
+            engine.record = True
+            second = engine.transcribe(data, 16000, users, stats=second_stats)
+
+            # Another model must not reuse these entries
+            with self.settings(STT_MODEL='other-model'):
+                other_stats = {}
+                get_stt_engine().transcribe(data, 16000, users, stats=other_stats)
+
+        self.assertEqual(first, second)
+        self.assertEqual(engine.received_segments, [])
+        self.assertEqual(first_stats['cache'], {'0': {'hits': 0, 'misses': 1}, '1': {'hits': 0, 'misses': 1}})
+        self.assertEqual(second_stats['cache'], {'0': {'hits': 1, 'misses': 0}, '1': {'hits': 1, 'misses': 0}})
+        self.assertEqual(other_stats['cache']['0'], {'hits': 0, 'misses': 1})
+
+    def test_disk_cache_evicts_least_recently_used(self):
+        import tempfile
+        import time
+        from protocols.core.cache.disk import DiskTranscriptCache
+
+        entry = [{'type': 'transcript', 'timestamp': 0.0, 'text': 'x' * 100}]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = DiskTranscriptCache(tmpdir, max_bytes=350)
+            cache.set('aa1', entry)
+            cache.set('bb2', entry)
+            os.utime(cache._path('aa1'), (time.time() - 100, time.time() - 100))
+            os.utime(cache._path('bb2'), (time.time() - 50, time.time() - 50))
+            self.assertIsNotNone(cache.get('aa1'))  # now the most recently used
+            cache.set('cc3', entry)
+            cache.set('dd4', entry)
+
+            self.assertIsNone(cache.get('bb2'))
+            self.assertIsNotNone(cache.get('dd4'))
+
+    def test_s3_cache_write_errors_are_logged(self):
+        from botocore.exceptions import ClientError, EndpointConnectionError
+        from protocols.core.cache.s3 import S3TranscriptCache
+
+        storage = MagicMock()
+        cache = S3TranscriptCache(storage=storage)
+        for error in (
+            ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Denied'}}, 'PutObject'),
+            EndpointConnectionError(endpoint_url='http://s3'),
+        ):
+            storage.upload_json.side_effect = error
+            with self.assertLogs('protocols.core.cache.s3', 'WARNING'):
+                cache.set('abc', [{'text': 'hi'}])
+
+    def test_disk_cache_overwrite_keeps_size(self):
+        import tempfile
+        from protocols.core.cache.disk import DiskTranscriptCache
+
+        entry = [{'type': 'transcript', 'timestamp': 0.0, 'text': 'x' * 100}]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = DiskTranscriptCache(tmpdir, max_bytes=350)
+            cache.set('aa1', entry)
+            cache.set('bb2', entry)
+            for _ in range(5):
+                cache.set('bb2', entry)
+
+            # Rewriting an entry doesn't count it again, so nothing is evicted
+            self.assertEqual(cache._size, sum(size for _, _, size in cache._entries()))
+            self.assertIsNotNone(cache.get('aa1'))
+
+@override_settings(STATUS_BACKEND='memory')
+class ProcessProtocolTaskTests(SimpleTestCase):
+    def setUp(self):
+        from protocols.core.status.factory import get_status_store
+        get_status_store().clear()
+        self.assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests/assets')
+
+    def _storage(self, mock_storage_class):
+        import shutil
+        files = {
+            'meta.json': os.path.join(self.assets, 'meta.json'),
+            'audio.flac': os.path.join(self.assets, 'audio_protocol.flac'),
+        }
+        mock_storage = mock_storage_class.return_value
+        mock_storage.download_file.side_effect = lambda key, path: shutil.copy(files[key.rsplit('/', 1)[1]], path)
+        return mock_storage
+
+    @patch('protocols.worker.tasks.S3Storage')
+    def test_task_persists_transcripts_and_renders_every_template(self, mock_storage_class):
+        from protocols.core import utils
+        from protocols.core.engines.mock import MockEngine
+        from protocols.worker.tasks import process_protocol_task
+
+        mock_storage = self._storage(mock_storage_class)
+        job_id = '550e8400-e29b-41d4-a716-446655440000'
+        with patch.object(utils, 'get_engine', return_value=MockEngine()):
+            process_protocol_task(job_id, template_names=['default.md.j2', 'discord.md.j2'])
+
+        transcripts = mock_storage.save_transcripts.call_args[0][1]
+        self.assertEqual(len(transcripts), 2)
+        saved = {
+            c.kwargs.get('template_name'): ''.join(c.args[1])
+            for c in mock_storage.save_result_stream.call_args_list
+        }
+        self.assertEqual(set(saved), {None, 'discord.md.j2'})
+        self.assertIn('This is a mock transcription.', saved['discord.md.j2'])
+        mock_storage.copy_result.assert_called_once_with(job_id, 'default.md.j2')
+
+        from protocols.core.status.factory import get_status_store
+        live = get_status_store().get(job_id)
+        self.assertEqual(live['status'], 'completed')
+        self.assertAlmostEqual(live['stats']['audio_seconds'], 80.047, places=3)
+        # Final snapshot for durability
+        mock_storage.save_status.assert_called_once_with(job_id, live)
+        self.assertFalse(mock_storage.update_status.called)
+
+class TemplateRegistryTests(SimpleTestCase):
+    def test_registry_reloads_changed_templates(self):
+        import tempfile
+        import time
+        import jinja2
+        from protocols.core.templates import TemplateRegistry
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'simple.md.j2')
+            with open(path, 'w') as f:
+                f.write('v1 {{ meta.guild_id }}')
+            registry = TemplateRegistry(tmpdir, bytecode_cache_dir=os.path.join(tmpdir, '.cache'))
+
+            self.assertEqual(registry.names(), ['simple.md.j2'])
+            template = registry.get('simple.md.j2')
+            self.assertIs(registry.get('simple.md.j2'), template)
+            self.assertEqual(template.render(meta={'guild_id': 1}), 'v1 1')
+
+            with open(path, 'w') as f:
+                f.write('v2 {{ meta.guild_id }}')
+            os.utime(path, (time.time() + 5, time.time() + 5))
+            self.assertEqual(registry.get('simple.md.j2').render(meta={'guild_id': 1}), 'v2 1')
+            self.assertTrue(os.listdir(os.path.join(tmpdir, '.cache')))
+
+            with self.assertRaises(jinja2.TemplateNotFound):
+                registry.get('missing.md.j2')
+
+class StreamingProtocolTests(SimpleTestCase):
+    def _session(self, n_users=3, n_items=300):
+        import random
+        rng = random.Random(1)
+        meta_data = {
+            'guild_id': 1,
+            'start_time': '2026-01-30T21:46:00.000000',
+            'end_time': '2026-01-30T22:46:00.000000',
+            'users': {str(u): {'name': f'User{u}', 'channel': u} for u in range(n_users)},
+            'events': [
+                {'timestamp': f'2026-01-30T21:{46 + i // 60:02d}:{i % 60:02d}.000000', 'message': f'Event {i}'}
+                for i in reversed(range(0, 120, 7))
+            ]
+        }
+        # Whole-second timestamps to force ties between users and events
+        transcriptions = [
+            {'type': 'transcript', 'timestamp': float(rng.randrange(0, 120)), 'user_id': str(u),
+             'user_name': f'User{u}', 'text': f'line {i}'}
+            for i in range(n_items) for u in [rng.randrange(n_users)]
+        ]
+        return meta_data, transcriptions
+
+    def _legacy_render(self, meta_data, transcriptions, template):
+        from datetime import timedelta
+        from protocols.core.utils import parse_dt
+        start_time = parse_dt(meta_data['start_time'])
+        timeline = [
+            {'type': 'event', 'timestamp': parse_dt(e['timestamp']), 'content': e['message']}
+            for e in meta_data['events']
+        ] + [
+            {'type': 'transcript', 'timestamp': start_time + timedelta(seconds=t['timestamp']),
+             'user_id': t['user_id'], 'user_name': t['user_name'], 'text': t['text']}
+            for t in transcriptions
+        ]
+        timeline.sort(key=lambda x: x['timestamp'])
+        meta = dict(meta_data, start_time=start_time, end_time=parse_dt(meta_data['end_time']))
+        for uid, uinfo in meta['users'].items():
+            uinfo['id'] = uid
+        return template.render(meta=meta, timeline=timeline)
+
+    def test_streamed_render_matches_sorted_render(self):
+        from protocols.core.templates import get_template_registry
+        from protocols.core.utils import render_protocol_stream
+        meta_data, transcriptions = self._session()
+        for name in get_template_registry().names():
+            template = get_template_registry().get(name)
+            expected = self._legacy_render(meta_data, transcriptions, template)
+            self.assertEqual(''.join(render_protocol_stream(meta_data, transcriptions, template)), expected)
+
+    def test_save_result_stream_uses_multipart_for_large_output(self):
+        from protocols.core.s3_storage import S3Storage
+        storage = S3Storage.__new__(S3Storage)
+        storage.bucket_name = 'bucket'
+        storage.multipart_part_size = 10
+        storage.s3 = MagicMock()
+        storage.s3.create_multipart_upload.return_value = {'UploadId': 'u1'}
+        storage.s3.upload_part.side_effect = lambda **kw: {'ETag': f"e{kw['PartNumber']}"}
+
+        storage.save_result_stream('job', iter(['0123456', '789abc', 'def']))
+
+        bodies = [c.kwargs['Body'] for c in storage.s3.upload_part.call_args_list]
+        self.assertEqual(bodies, [b'0123456789abc', b'def'])
+        storage.s3.complete_multipart_upload.assert_called_once_with(
+            Bucket='bucket', Key='jobs/job/result.md', UploadId='u1',
+            MultipartUpload={'Parts': [{'ETag': 'e1', 'PartNumber': 1}, {'ETag': 'e2', 'PartNumber': 2}]}
+        )
+        self.assertFalse(storage.s3.put_object.called)
+
+        storage.s3.reset_mock()
+        storage.save_result_stream('job', iter(['small']))
+        self.assertEqual(storage.s3.put_object.call_args.kwargs['Body'], b'small')
+        self.assertFalse(storage.s3.create_multipart_upload.called)
+
+class S3ClientTests(SimpleTestCase):
+    def tearDown(self):
+        from protocols.core import s3_storage
+        s3_storage.reset_s3_client()
+
+    def test_storages_share_one_client_per_process(self):
+        from protocols.core import s3_storage
+        s3_storage.reset_s3_client()
+        first = s3_storage.S3Storage()
+        second = s3_storage.S3Storage()
+        self.assertIs(first.s3, second.s3)
+
+        with patch.dict(os.environ, {'S3_MAX_POOL_CONNECTIONS': '7'}):
+            s3_storage.reset_s3_client()
+            client = s3_storage.get_s3_client()
+        self.assertEqual(client.meta.config.max_pool_connections, 7)
+        self.assertTrue(client.meta.config.tcp_keepalive)
+
+    def test_client_is_recreated_in_forked_child(self):
+        from protocols.core import s3_storage
+        parent_client = s3_storage.get_s3_client()
+        with patch('protocols.core.s3_storage.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(s3_storage.get_s3_client(), parent_client)
+
+    def test_delete_keys_sends_batches_of_1000(self):
+        from protocols.core import s3_storage
+        storage = s3_storage.S3Storage()
+        keys = [f'jobs/a/partial/{i:04d}-0.json' for i in range(2500)]
+        with patch.object(storage, 's3') as s3:
+            s3.delete_objects.side_effect = [{}, {'Errors': [{'Key': keys[1500]}]}, {}]
+            failed = storage.delete_keys(keys)
+
+        self.assertEqual(failed, [keys[1500]])
+        batches = [c.kwargs['Delete']['Objects'] for c in s3.delete_objects.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [1000, 1000, 500])
+        self.assertEqual([obj['Key'] for batch in batches for obj in batch], keys)
+
+class StatusStoreTests(SimpleTestCase):
+    def test_memory_store_merges_and_batches(self):
+        from protocols.core.status.memory import MemoryStatusStore
+        store = MemoryStatusStore()
+        store.update('a', {'status': 'pending', 'created_at': 'x'})
+        store.update('a', {'status': 'processing'})
+        store.update('b', {'status': 'failed'})
+
+        self.assertEqual(store.get('a'), {'status': 'processing', 'created_at': 'x'})
+        self.assertEqual(store.get_many(['a', 'b', 'c']), {
+            'a': {'status': 'processing', 'created_at': 'x'},
+            'b': {'status': 'failed'},
+            'c': None,
+        })
+        store.delete('a')
+        self.assertIsNone(store.get('a'))
+
+    def test_redis_store_increments_counters(self):
+        with patch('protocols.core.status.redis_store.redis.Redis.from_url') as from_url:
+            from protocols.core.status.redis_store import RedisStatusStore
+            store = RedisStatusStore('redis://example/0')
+            client = from_url.return_value
+            pipe = client.pipeline.return_value
+            pipe.execute.return_value = [b'3', b'12.5']
+
+            store.increment('a', {'parts_done': 1, 'audio_seconds_done': 2.5})
+
+        pipe.hincrbyfloat.assert_any_call('protoscript:job:a', 'parts_done', 1)
+        pipe.hincrbyfloat.assert_any_call('protoscript:job:a', 'audio_seconds_done', 2.5)
+        client.publish.assert_called_once_with(
+            'protoscript:job:a:events', '{"parts_done": 3.0, "audio_seconds_done": 12.5}'
+        )
+
+    def test_memory_store_ttl(self):
+        from protocols.core.status.memory import MemoryStatusStore
+        store = MemoryStatusStore(ttl=10)
+        with patch('protocols.core.status.memory.time.monotonic', return_value=100.0):
+            store.update('a', {'status': 'pending'})
+        with patch('protocols.core.status.memory.time.monotonic', return_value=111.0):
+            self.assertIsNone(store.get('a'))
+
+    def test_redis_store_updates_atomically(self):
+        with patch('protocols.core.status.redis_store.redis.Redis.from_url') as from_url:
+            from protocols.core.status.redis_store import RedisStatusStore
+            store = RedisStatusStore('redis://example/0', ttl=60)
+            client = from_url.return_value
+            client.hgetall.return_value = {b'status': b'"completed"', b'stats': b'{"audio_seconds": 1.5}'}
+
+            store.update('a', {'status': 'completed', 'stats': {'audio_seconds': 1.5}})
+            self.assertEqual(store.get('a'), {'status': 'completed', 'stats': {'audio_seconds': 1.5}})
+
+        client.pipeline.assert_called_once_with(transaction=True)
+        pipe = client.pipeline.return_value
+        pipe.hset.assert_called_once_with('protoscript:job:a', mapping={
+            'status': '"completed"', 'stats': '{"audio_seconds": 1.5}'
+        })
+        pipe.expire.assert_called_once_with('protoscript:job:a', 60)
+        pipe.publish.assert_called_once_with(
+            'protoscript:job:a:events', '{"status": "completed", "stats": {"audio_seconds": 1.5}}'
+        )
+        pipe.execute.assert_called_once_with()
+
+    def test_redis_store_indexes_every_filter_combination(self):
+        with patch('protocols.core.status.redis_store.redis.Redis.from_url') as from_url:
+            from protocols.core.status.redis_store import RedisStatusStore
+            store = RedisStatusStore('redis://example/0')
+            pipe = from_url.return_value.pipeline.return_value
+            pipe.hgetall.return_value = {
+                b'status': b'"pending"', b'created_at': b'"2026-01-30T20:00:00+00:00"',
+                b'template_name': b'"default.md.j2"'
+            }
+            store.update('a', {'status': 'processing', 'guild_id': '7'})
+
+        removed = {c.args[0] for c in pipe.zrem.call_args_list}
+        added = {c.args[0] for c in pipe.zadd.call_args_list}
+        self.assertEqual(removed, {
+            'protoscript:job:index:status=pending',
+            'protoscript:job:index:status=pending:template_name=default.md.j2',
+        })
+        self.assertEqual(added, {
+            'protoscript:job:index',
+            'protoscript:job:index:status=processing',
+            'protoscript:job:index:guild_id=7',
+            'protoscript:job:index:template_name=default.md.j2',
+            'protoscript:job:index:status=processing:guild_id=7',
+            'protoscript:job:index:status=processing:template_name=default.md.j2',
+            'protoscript:job:index:guild_id=7:template_name=default.md.j2',
+            'protoscript:job:index:status=processing:guild_id=7:template_name=default.md.j2',
+        })
+        self.assertEqual(pipe.zadd.call_args.args[1], {'a': 1769803200.0})
+
+    def test_memory_store_lists_pages_newest_first(self):
+        from protocols.core.status.memory import MemoryStatusStore
+        store = MemoryStatusStore()
+        for i in range(7):
+            # Pairs of jobs share a created_at to exercise ties at page edges
+            store.update(f'job-{i}', {
+                'status': 'failed' if i % 2 else 'completed',
+                'guild_id': '1' if i < 4 else '2',
+                'created_at': f'2026-01-30T20:0{i // 2}:00+00:00',
+            })
+
+        seen, cursor = [], None
+        while True:
+            jobs, cursor = store.list_jobs(limit=3, cursor=cursor)
+            seen += [job['id'] for job in jobs]
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f'job-{i}' for i in reversed(range(7))])
+
+        jobs, cursor = store.list_jobs({'status': 'failed', 'guild_id': '1'})
+        self.assertEqual([job['id'] for job in jobs], ['job-3', 'job-1'])
+        self.assertIsNone(cursor)
+
+@override_settings(STATUS_BACKEND='memory')
+class DirectUploadTests(SimpleTestCase):
+    def setUp(self):
+        from protocols.core.status.factory import get_status_store
+        get_status_store().clear()
+
+    def test_streaming_handler_uses_multipart_for_large_files(self):
+        from django.core.files.uploadhandler import StopFutureHandlers
+        from protocols.api.uploads import S3StreamingUploadHandler
+        storage = MagicMock()
+        storage.multipart_part_size = 10
+        storage.create_multipart_upload.return_value = 'u1'
+        storage.upload_part.side_effect = lambda key, upload_id, number, body: {'ETag': f'e{number}', 'PartNumber': number}
+
+        handler = S3StreamingUploadHandler(storage, 'job', concurrency=2)
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('audio', 'a.flac', 'audio/flac', None)
+        for chunk in (b'0123456', b'789abcdef', b'xyz'):
+            handler.receive_data_chunk(chunk, 0)
+        uploaded = handler.file_complete(19)
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('meta', 'meta.json', 'application/json', None)
+        handler.receive_data_chunk(b'{}', 0)
+        handler.file_complete(2)
+        handler.upload_complete()
+
+        self.assertEqual(uploaded.key, 'jobs/job/audio.flac')
+        self.assertEqual(uploaded.size, 19)
+        bodies = [c.args[3] for c in storage.upload_part.call_args_list]
+        self.assertEqual(bodies, [b'0123456789abcdef', b'xyz'])
+        storage.complete_multipart_upload.assert_called_once_with(
+            'jobs/job/audio.flac', 'u1',
+            [{'ETag': 'e1', 'PartNumber': 1}, {'ETag': 'e2', 'PartNumber': 2}]
+        )
+        storage.upload_bytes.assert_called_once_with('jobs/job/meta.json', b'{}', 'application/json')
+
+    @override_settings(PRESIGNED_PART_SIZE=100)
+    @patch('protocols.api.views.S3Storage')
+    @patch('protocols.api.views.get_queue_backend')
+    def test_presigned_upload_and_commit(self, mock_get_queue, mock_storage_class):
+        mock_storage = mock_storage_class.return_value
+        mock_storage.presigned_put_url.side_effect = lambda key, expires_in: f'https://s3/{key}'
+        mock_storage.create_multipart_upload.return_value = 'u1'
+        mock_storage.presigned_part_urls.side_effect = lambda key, upload_id, count, expires_in: [
+            {'part_number': n, 'url': f'https://s3/{key}?part={n}'} for n in range(1, count + 1)
+        ]
+        client = Client()
+
+        response = client.post(reverse('protocol_upload'), {'audio_size': 250}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        job_id = data['id']
+        self.assertEqual(data['meta']['url'], f'https://s3/jobs/{job_id}/meta.json')
+        self.assertEqual(data['audio']['upload_id'], 'u1')
+        self.assertEqual(len(data['audio']['parts']), 3)
+
+        commit_url = reverse('protocol_commit', kwargs={'job_id': job_id})
+        mock_storage.object_exists.side_effect = lambda key: not key.endswith('meta.json')
+        parts = [{'part_number': n, 'etag': f'e{n}'} for n in (2, 1, 3)]
+        response = client.post(commit_url, {'parts': parts}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['missing'], [f'jobs/{job_id}/meta.json'])
+        self.assertFalse(mock_get_queue.return_value.enqueue_protocol_job.called)
+
+        mock_storage.object_exists.side_effect = None
+        mock_storage.object_exists.return_value = True
+        response = client.post(commit_url, {'parts': parts}, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'pending')
+        mock_storage.complete_multipart_upload.assert_called_with(
+            f'jobs/{job_id}/audio.flac', 'u1',
+            [{'ETag': f'e{n}', 'PartNumber': n} for n in (1, 2, 3)]
+        )
+        mock_get_queue.return_value.enqueue_protocol_job.assert_called_once_with(
+            job_id, template_name='default.md.j2', template_names=['default.md.j2'], cost=None
+        )
+
+        response = client.post(commit_url, {}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+@override_settings(STATUS_BACKEND='memory')
+class ResultWaitTests(SimpleTestCase):
+    job_id = '550e8400-e29b-41d4-a716-446655440000'
+
+    def setUp(self):
+        from protocols.core.status.factory import get_status_store
+        self.store = get_status_store()
+        self.store.clear()
+        self.store.update(self.job_id, {'id': self.job_id, 'status': 'processing'})
+
+    @patch('protocols.api.views.S3Storage')
+    def test_conditional_get_skips_result_download(self, mock_storage_class):
+        mock_storage = mock_storage_class.return_value
+        mock_storage.get_result.return_value = '# Done'
+        self.store.update(self.job_id, {'status': 'completed'})
+        url = reverse('protocol_result', kwargs={'job_id': self.job_id})
+
+        response = self.client.get(url)
+        self.assertEqual(response.json()['result_markdown'], '# Done')
+        etag = response['ETag']
+
+        mock_storage.get_result.reset_mock()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(mock_storage.get_result.called)
+
+        # Lists and weak tags match; a prefix of the tag does not
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag[:-2] + '"')
+        self.assertEqual(response.status_code, 200)
+
+    @patch('protocols.api.views.S3Storage')
+    def test_long_poll_returns_on_status_change(self, mock_storage_class):
+        import threading
+        import time
+        url = reverse('protocol_result', kwargs={'job_id': self.job_id})
+        etag = self.client.get(url)['ETag']
+
+        # Nothing changes: 304 after the wait
+        start = time.monotonic()
+        response = self.client.get(url, {'wait': '0.2'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+        threading.Timer(0.1, self.store.update, (self.job_id, {'status': 'failed', 'error': 'x'})).start()
+        start = time.monotonic()
+        response = self.client.get(url, {'wait': '10'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'failed')
+        self.assertLess(time.monotonic() - start, 5)
+
+    async def test_event_stream_follows_transitions(self):
+        import asyncio
+        from django.test import AsyncClient
+        url = reverse('protocol_events', kwargs={'job_id': self.job_id})
+        with patch('protocols.api.views.S3Storage'):
+            response = await AsyncClient().get(url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        async def finish():
+            await asyncio.sleep(0.05)
+            self.store.update(self.job_id, {'status': 'completed'})
+        task = asyncio.ensure_future(finish())
+        events = [chunk.decode() async for chunk in response.streaming_content]
+        await task
+
+        statuses = [json.loads(e.split('data: ')[1])['status'] for e in events]
+        self.assertEqual(statuses, ['processing', 'completed'])
+
+@override_settings(STATUS_BACKEND='memory')
+class CleanupJobsTests(SimpleTestCase):
+    def setUp(self):
+        from datetime import datetime, timedelta, timezone
+        from protocols.bench.s3stub import S3Stub
+        from protocols.core import s3_storage
+        from protocols.core.status.factory import get_status_store
+        self.stub = S3Stub().start()
+        self.addCleanup(self.stub.stop)
+        self.stub.create_bucket('bucket')
+        env = patch.dict(os.environ, {
+            'S3_ENDPOINT_URL': self.stub.endpoint_url, 'S3_BUCKET_NAME': 'bucket',
+            'S3_ACCESS_KEY': 'test', 'S3_SECRET_KEY': 'test',
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        s3_storage.reset_s3_client()
+        self.addCleanup(s3_storage.reset_s3_client)
+
+        self.store = get_status_store()
+        self.store.clear()
+        old = datetime.now(timezone.utc) - timedelta(hours=2)
+        # 400 old jobs with 3 objects each span two DeleteObjects batches
+        for i in range(400):
+            for name in ('meta.json', 'audio.flac', 'status.json'):
+                self.stub.put('bucket', f'jobs/old-{i:03d}/{name}', b'x', last_modified=old)
+            self.store.update(f'old-{i:03d}', {'status': 'completed'})
+        # Old upload, but the status was written just now
+        self.stub.put('bucket', 'jobs/active/audio.flac', b'x', last_modified=old)
+        self.stub.put('bucket', 'jobs/active/status.json', b'x')
+
+    def test_deletes_old_jobs_in_batches(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('cleanup_jobs', '--minutes', '60', '--workers', '2', stdout=out)
+
+        self.assertIn('Successfully deleted 400 old jobs', out.getvalue())
+        self.assertEqual(sorted(self.stub.buckets['bucket']), ['jobs/active/audio.flac', 'jobs/active/status.json'])
+        self.assertIsNone(self.store.get('old-000'))
+        self.assertIsNone(self.store.get('old-399'))
+
+    def test_dry_run_deletes_nothing(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('cleanup_jobs', '--dry-run', stdout=out)
+
+        self.assertIn('Would delete 400 old jobs (1200 objects) of 401', out.getvalue())
+        self.assertEqual(len(self.stub.buckets['bucket']), 1202)
+        self.assertIsNotNone(self.store.get('old-000'))
+
+def touch_job(job_id, directory, template_names):
+    # Local queue task for tests: the template name carries a directory
+    import time
+    if template_names:
+        time.sleep(float(template_names[0]))
+    open(os.path.join(directory, job_id), 'w').close()
+
+class LocalQueueTests(SimpleTestCase):
+    def setUp(self):
+        import tempfile
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.journal = os.path.join(self.dir, 'queue.sqlite3')
+
+    def wait_idle(self, queue, timeout=60):
+        import time
+        deadline = time.monotonic() + timeout
+        while queue.depth() and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def journal_states(self):
+        import sqlite3
+        from contextlib import closing
+        with closing(sqlite3.connect(self.journal)) as db:
+            return dict(db.execute('SELECT job_id, state FROM jobs'))
+
+    def test_runs_jobs_and_applies_back_pressure(self):
+        from protocols.core.queue.base import QueueFull
+        from protocols.core.queue.local import LocalQueue
+        queue = LocalQueue(self.journal, workers=1, max_depth=1, task=touch_job)
+        self.addCleanup(queue.shutdown)
+
+        queue.enqueue_protocol_job('a', self.dir, ['0.5'])
+        self.assertFalse(queue.has_capacity())
+        with self.assertRaises(QueueFull):
+            queue.enqueue_protocol_job('b', self.dir)
+        self.wait_idle(queue)
+
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'a')))
+        self.assertEqual(self.journal_states(), {'a': 'done'})
+        self.assertTrue(queue.has_capacity())
+
+    def test_resumes_journaled_jobs_of_dead_processes(self):
+        import sqlite3
+        import time
+        from contextlib import closing
+        from protocols.core.queue.local import LocalQueue
+        # Journal left behind by a process that no longer exists
+        LocalQueue(self.journal, workers=1, task=touch_job).shutdown()
+        with closing(sqlite3.connect(self.journal)) as db, db:
+            db.execute("INSERT INTO jobs VALUES ('orphan', ?, NULL, 'queued', 2147483646, ?, NULL)", (self.dir, time.time()))
+
+        queue = LocalQueue(self.journal, workers=1, task=touch_job)
+        self.addCleanup(queue.shutdown)
+        self.wait_idle(queue)
+
+        self.assertTrue(os.path.exists(os.path.join(self.dir, 'orphan')))
+        self.assertEqual(self.journal_states(), {'orphan': 'done'})
+
+    def test_finished_jobs_are_purged_after_retention(self):
+        import sqlite3
+        import time
+        from contextlib import closing
+        from protocols.core.queue.local import LocalQueue
+        queue = LocalQueue(self.journal, workers=1, task=touch_job, retention_seconds=3600)
+        self.addCleanup(queue.shutdown)
+        with closing(sqlite3.connect(self.journal)) as db, db:
+            db.executemany("INSERT INTO jobs VALUES (?, ?, NULL, ?, 1, ?, ?)", [
+                ('old', self.dir, 'done', time.time() - 7300, time.time() - 7200),
+                ('recent', self.dir, 'failed', time.time() - 100, time.time() - 60),
+            ])
+
+        queue.enqueue_protocol_job('a', self.dir)
+        self.wait_idle(queue)
+
+        self.assertEqual(self.journal_states(), {'recent': 'failed', 'a': 'done'})
+
+    @override_settings(QUEUE_BACKEND='rabbit')
+    def test_unknown_backend_is_an_error(self):
+        from protocols.core.queue.factory import get_queue_backend
+        with self.assertRaises(ValueError):
+            get_queue_backend()
+
+@override_settings(STATUS_BACKEND='memory', JOB_COST_PER_AUDIO_SECOND=0.1, JOB_SIZE_CLASSES=[
+    {'name': 'short', 'max_cost_seconds': 60, 'priority': 9, 'workers': 2},
+    {'name': 'long', 'max_cost_seconds': None, 'priority': 0, 'workers': 1},
+])
+class SizeRoutingTests(SimpleTestCase):
+    def setUp(self):
+        from protocols.core.status.factory import get_status_store
+        get_status_store().clear()
+        self.audio_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests/assets/audio_protocol.flac')
+
+    def test_streaminfo_matches_soundfile(self):
+        import soundfile as sf
+        from protocols.core.flac import STREAMINFO_BYTES, read_streaminfo
+        with open(self.audio_path, 'rb') as f:
+            audio_info = read_streaminfo(f.read(STREAMINFO_BYTES))
+        info = sf.info(self.audio_path)
+        self.assertEqual((audio_info.samplerate, audio_info.channels, audio_info.frames),
+                         (info.samplerate, info.channels, info.frames))
+        self.assertIsNone(read_streaminfo(b'OggS' + bytes(40)))
+
+    def test_celery_routes_by_estimated_cost(self):
+        from protocols.core.queue.celery_queue import CeleryQueue
+        with patch('protocols.core.queue.celery_queue.process_protocol_task') as task:
+            CeleryQueue().enqueue_protocol_job('a', 'default.md.j2', cost=30.0)
+            CeleryQueue().enqueue_protocol_job('b', 'default.md.j2', cost=3600.0)
+            CeleryQueue().enqueue_protocol_job('c', 'default.md.j2')
+
+        routes = [(c.kwargs['args'][0], c.kwargs['queue'], c.kwargs['priority']) for c in task.apply_async.call_args_list]
+        self.assertEqual(routes, [('a', 'short', 9), ('b', 'long', 0), ('c', 'long', 0)])
+
+    @patch('protocols.api.views.get_queue_backend')
+    def test_status_shows_cost_and_expected_start(self, mock_get_queue):
+        from protocols.api.views import enqueue_job
+        from protocols.core.flac import StreamInfo
+        from protocols.core.status.factory import get_status_store
+        # 100 s of stereo: 20 s estimated
+        audio_info = StreamInfo(48000, 2, 16, 4800000)
+
+        first = enqueue_job('a', ['default.md.j2'], audio_info=audio_info)
+        second = enqueue_job('b', ['default.md.j2'], audio_info=audio_info)
+
+        self.assertEqual(first['size_class'], 'short')
+        self.assertAlmostEqual(first['estimated_cost_seconds'], 20.0)
+        self.assertEqual(first['expected_start_seconds'], 0.0)
+        # Two short workers share the 20 s already queued
+        self.assertAlmostEqual(second['expected_start_seconds'], 10.0)
+        self.assertEqual(
+            get_status_store().get_backlog()['short'], {'jobs': 2, 'cost_seconds': 40.0, 'audio_seconds': 400.0}
+        )
+
+@override_settings(STATUS_BACKEND='memory')
+class SegmentFanOutTests(SimpleTestCase):
+    def setUp(self):
+        from protocols.core.flac import read_streaminfo
+        from protocols.core.status.factory import get_status_store
+        get_status_store().clear()
+        self.assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests/assets')
+        self.audio_path = os.path.join(self.assets, 'audio_protocol.flac')
+        with open(self.audio_path, 'rb') as f:
+            self.data = f.read()
+        self.info = read_streaminfo(self.data)
+
+    def read(self, start, length):
+        return self.data[start:start + length]
+
+    def test_locate_sample_brackets_target(self):
+        from protocols.core import flac
+        first = flac.Frame(flac.audio_offset(self.read), 0)
+        last = flac.Frame(len(self.data), self.info.frames)
+        for sample in (0, 4607, 4608, 1000000, self.info.frames - 1):
+            before, after = flac.locate_sample(self.read, first, last, self.info, sample)
+            self.assertLessEqual(before.sample, sample)
+            self.assertLess(sample, after.sample)
+            self.assertIsNotNone(flac.parse_frame_header(self.data, before.offset, self.info))
+        # A corrupted CRC-8 is not taken for a frame header
+        corrupted = bytearray(self.data[before.offset:before.offset + 16])
+        corrupted[4] ^= 0x01
+        self.assertIsNone(flac.parse_frame_header(bytes(corrupted), 0, self.info))
+
+    def test_range_decodes_like_the_whole_file(self):
+        import numpy as np
+        import soundfile as sf
+        from protocols.core.audio import iter_flac_range_windows
+        from protocols.core.segments import plan_segments
+
+        full, _ = sf.read(self.audio_path, dtype='int16')
+        segments = plan_segments(self.read, len(self.data), self.info, segment_seconds=15, overlap_seconds=2)
+
+        self.assertEqual([s.start_seconds for s in segments], [0, 15, 30])
+        self.assertIsNone(segments[-1].end_seconds)
+        for segment in segments:
+            # Whole frames covering the owned time and the overlap
+            start = segment.first_sample / self.info.samplerate
+            end = (segment.first_sample + segment.frames) / self.info.samplerate
+            self.assertLessEqual(start, max(0, segment.start_seconds - 2))
+            self.assertGreaterEqual(end, min(self.info.duration, (segment.end_seconds or 1e9) + 2))
+
+            data = self.data[segment.offset:segment.offset + segment.length]
+            windows = list(iter_flac_range_windows(data, self.info, segment.frames, [1], 4, dtype='int16'))
+            decoded = np.concatenate([channels[1] for _, channels in windows])
+            np.testing.assert_array_equal(decoded, full[segment.first_sample:segment.first_sample + segment.frames, 1])
+
+    def test_merge_drops_seam_duplicates(self):
+        from protocols.core.segments import merge_segment_transcripts
+
+        def t(ts, text, user='1'):
+            return {'timestamp': ts, 'text': text, 'user_id': user}
+
+        segment = lambda start, end: {'start_seconds': start, 'end_seconds': end}
+        partials = [
+            {'segment': segment(10, None), 'channel': 0, 'transcripts': [
+                # Heard again in the overlap and cut differently
+                t(8.5, 'and that is all'), t(10.2, 'That is all for today.'), t(14.0, 'Bye')
+            ]},
+            {'segment': segment(0, 10), 'channel': 0, 'transcripts': [
+                t(1.0, 'Hello'), t(9.0, 'And that is all for'), t(11.0, 'for today')
+            ]},
+            {'segment': segment(0, 10), 'channel': 1, 'transcripts': [t(10.5, 'Not mine'), t(9.5, 'Hi', '2')]},
+            {'segment': segment(10, None), 'channel': 1, 'transcripts': [t(10.5, 'Different words', '2')]},
+        ]
+
+        merged = merge_segment_transcripts(partials, overlap_seconds=2)
+
+        self.assertEqual(
+            [(m['timestamp'], m['text']) for m in merged],
+            [(1.0, 'Hello'), (9.0, 'That is all for today.'), (14.0, 'Bye'), (9.5, 'Hi'), (10.5, 'Different words')]
+        )
+
+    @patch('protocols.worker.tasks.S3Storage')
+    def test_long_job_fans_out_and_merges(self, mock_storage_class):
+        import shutil
+        from ProtoScript.celery import app
+        from protocols.core import utils
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.status.factory import get_status_store
+        # Imported by the task signals; it must not bind the patched get_engine
+        from protocols.worker import warmup  # noqa: F401
+        from protocols.worker.tasks import process_protocol_task
+
+        objects = {}
+        storage = mock_storage_class.return_value
+        storage.download_file.side_effect = lambda key, path: shutil.copy(os.path.join(self.assets, 'meta.json'), path)
+        with open(os.path.join(self.assets, 'meta.json')) as f:
+            storage.get_meta.return_value = json.load(f)
+        storage.object_size.return_value = len(self.data)
+        storage.get_range.side_effect = lambda key, start, length: self.read(start, length)
+        storage.upload_json.side_effect = objects.__setitem__
+        storage.download_json.side_effect = lambda key: json.loads(json.dumps(objects[key]))
+        storage.object_exists.side_effect = objects.__contains__
+        storage.delete_keys.return_value = []
+
+        job_id = '550e8400-e29b-41d4-a716-446655440000'
+        store = get_status_store()
+        store.update(job_id, {'status': 'pending', 'audio_seconds': self.info.duration})
+        settings = {'FANOUT_MIN_SECONDS': 30, 'FANOUT_SEGMENT_SECONDS': 15, 'FANOUT_OVERLAP_SECONDS': 2,
+                    'QUEUE_BACKEND': 'celery'}
+        # Runs the chord in this process
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', False)
+        with self.settings(**settings), patch.object(utils, 'get_engine', return_value=MockEngine()):
+            process_protocol_task(job_id)
+
+        # The audio is never downloaded whole; 3 segments x 2 channels
+        self.assertFalse(any('audio.flac' in c.args[0] for c in storage.download_file.call_args_list))
+        self.assertEqual(sorted(objects), [f'jobs/{job_id}/partial/{i:04d}-{ch}.json' for i in range(3) for ch in (0, 1)])
+        storage.delete_keys.assert_called_once()
+
+        status = store.get(job_id)
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['fanout'], {'segments': 3, 'channels': 2, 'subtasks': 6})
+        self.assertEqual((status['parts_done'], status['parts_total']), (6, 6))
+        self.assertAlmostEqual(status['audio_seconds_done'], self.info.duration)
+        transcripts = storage.save_transcripts.call_args[0][1]
+        for user_id in ('103595873841188864', '245056131989241857'):
+            timestamps = [t['timestamp'] for t in transcripts if t['user_id'] == user_id]
+            self.assertEqual(timestamps, sorted(timestamps))
+            self.assertTrue(timestamps)
+        self.assertIn('This is a mock transcription.', ''.join(storage.save_result_stream.call_args[0][1]))
+
+    @patch('protocols.worker.tasks.chord')
+    def test_subtasks_go_to_the_segment_queue_at_the_job_priority(self, mock_chord):
+        from datetime import datetime, timezone
+        from ProtoScript.celery import size_class_queues
+        from protocols.core.status.factory import get_status_store
+        from protocols.worker.tasks import fan_out
+
+        storage = MagicMock()
+        storage.object_size.return_value = len(self.data)
+        storage.get_range.side_effect = lambda key, start, length: self.read(start, length)
+        meta_data = {'users': {'1': {'channel': 0}, '2': {'channel': 1}}}
+        started_at = datetime.now(timezone.utc)
+        job_id = '550e8400-e29b-41d4-a716-446655440000'
+
+        with self.settings(FANOUT_SEGMENT_SECONDS=15, FANOUT_OVERLAP_SECONDS=2, FANOUT_QUEUE='segments'):
+            self.assertTrue(fan_out(get_status_store(), storage, job_id, meta_data, [], started_at, priority=9))
+            self.assertIn('segments', [queue.name for queue in size_class_queues()])
+
+        header = mock_chord.call_args[0][0]
+        body = mock_chord.return_value.call_args[0][0]
+        self.assertEqual(len(header), 6)
+        for signature in header + [body]:
+            self.assertEqual((signature.options['queue'], signature.options['priority']), ('segments', 9))
+
+    def test_partials_left_behind_do_not_fail_the_merged_job(self):
+        from botocore.exceptions import EndpointConnectionError
+        from protocols.worker.tasks import delete_partials
+
+        storage = MagicMock()
+        storage.delete_keys.return_value = ['jobs/a/partial/0000-0.json']
+        with self.assertLogs('protocols.worker.tasks', 'WARNING') as logs:
+            delete_partials(storage, 'a', ['jobs/a/partial/0000-0.json', 'jobs/a/partial/0000-1.json'])
+        self.assertIn('Could not delete 1 partial transcripts of job a', logs.output[0])
+
+        storage.delete_keys.side_effect = EndpointConnectionError(endpoint_url='http://s3')
+        with self.assertLogs('protocols.worker.tasks', 'WARNING'):
+            delete_partials(storage, 'a', ['jobs/a/partial/0000-0.json'])
+
+@override_settings(STATUS_BACKEND='memory')
+class CheckpointResumeTests(SimpleTestCase):
+    def setUp(self):
+        from protocols.core.status.factory import get_status_store
+        get_status_store().clear()
+        self.assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests/assets')
+        with open(os.path.join(self.assets, 'audio_protocol.flac'), 'rb') as f:
+            self.data = f.read()
+
+    def _storage(self, mock_storage_class, objects):
+        import shutil
+        storage = mock_storage_class.return_value
+        files = {
+            'meta.json': os.path.join(self.assets, 'meta.json'),
+            'audio.flac': os.path.join(self.assets, 'audio_protocol.flac'),
+        }
+        storage.download_file.side_effect = lambda key, path: shutil.copy(files[key.rsplit('/', 1)[1]], path)
+        storage.upload_json.side_effect = objects.__setitem__
+        storage.download_json.side_effect = lambda key: json.loads(json.dumps(objects[key]))
+        storage.list_keys.side_effect = lambda prefix: sorted(k for k in objects if k.startswith(prefix))
+        storage.delete_keys.side_effect = lambda keys: [objects.pop(k) for k in keys] and []
+        storage.get_range.side_effect = lambda key, start, length: self.data[start:start + length]
+        storage.object_size.return_value = len(self.data)
+
+        def download_range(key, start, path):
+            with open(path, 'wb') as f:
+                f.write(self.data[start:])
+        storage.download_range.side_effect = download_range
+        return storage
+
+    def _run(self, job_id, engine):
+        from protocols.core import utils
+        from protocols.worker.tasks import process_protocol_task
+        with self.settings(AUDIO_WINDOW_SECONDS=10, FANOUT_MIN_SECONDS=0), \
+                patch.object(utils, 'get_engine', return_value=engine):
+            process_protocol_task(job_id)
+
+    @patch('protocols.worker.tasks.S3Storage')
+    def test_retry_only_transcribes_missing_windows(self, mock_storage_class):
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.status.factory import get_status_store
+
+        class CrashingEngine(MockEngine):
+            def transcribe_windows(self, windows, *args, **kwargs):
+                windows = list(windows)
+                if windows[0][0] >= 20:
+                    raise MemoryError('killed')
+                return super().transcribe_windows(windows, *args, **kwargs)
+
+        reference = {}
+        reference_storage = self._storage(mock_storage_class, reference)
+        self._run('reference', MockEngine())
+        expected = reference_storage.save_transcripts.call_args[0][1]
+
+        objects = {}
+        storage = self._storage(mock_storage_class, objects)
+        job_id = '550e8400-e29b-41d4-a716-446655440000'
+        with self.assertRaises(MemoryError):
+            self._run(job_id, CrashingEngine())
+        self.assertEqual(sorted(objects), [f'jobs/{job_id}/partial/window-{i:05d}.json' for i in range(2)])
+        status = get_status_store().get(job_id)
+        # The last 0.05 s are in the overlap of the window from 30 s
+        self.assertEqual((status['parts_done'], status['parts_total']), (4, 8))
+        self.assertEqual(status['audio_seconds_done'], 20.0)
+
+        storage.download_file.reset_mock()
+        engine = MockEngine(record=True)
+        self._run(job_id, engine)
+
+        # Only the audio from the frame before 20 s was fetched, and only
+        # the two missing windows of both channels were transcribed
+        self.assertNotIn(f'jobs/{job_id}/audio.flac', [c.args[0] for c in storage.download_file.call_args_list])
+        self.assertGreater(storage.download_range.call_args[0][1], len(self.data) // 3)
+        self.assertEqual(len(engine.received_segments), 4)
+        transcripts = storage.save_transcripts.call_args[0][1]
+        self.assertEqual(
+            [(t['user_id'], round(t['timestamp'], 6)) for t in transcripts],
+            [(t['user_id'], round(t['timestamp'], 6)) for t in expected]
+        )
+        status = get_status_store().get(job_id)
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['attempts'], 2)
+        self.assertEqual(status['parts_done'], status['parts_total'])
+        # Checkpoints are removed once the job is done
+        self.assertEqual(objects, {})
+
+    @patch('protocols.worker.tasks.S3Storage')
+    def test_redelivered_completed_job_is_skipped(self, mock_storage_class):
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.status.factory import get_status_store
+        from protocols.worker.tasks import process_protocol_task
+
+        get_status_store().update('done', {'status': 'completed'})
+        process_protocol_task('done')
+        self.assertFalse(mock_storage_class.return_value.download_file.called)
+        self.assertTrue(process_protocol_task.acks_late)
+        self.assertTrue(process_protocol_task.reject_on_worker_lost)
+
+class PipelineBenchmarkTests(SimpleTestCase):
+    def test_bench_pipeline_reports_every_stage(self):
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            report_path = os.path.join(tmpdir, 'report.json')
+            args = ['--duration', '6', '--speakers', '2', '--samplerate', '16000', '--window-seconds', '2']
+            call_command('bench_pipeline', *args, '--output', report_path, stdout=StringIO())
+            with open(report_path) as f:
+                report = json.load(f)
+
+            self.assertEqual(list(report['stages']), ['download', 'decode', 'channel_split', 'asr', 'timeline', 'render', 'upload'])
+            for stage in report['stages'].values():
+                self.assertGreaterEqual(stage['seconds'], 0.0)
+                self.assertGreater(stage['peak_rss_mb'], 0.0)
+            self.assertAlmostEqual(report['rtf'], report['total_seconds'] / 6)
+            # Three windows of two channels through the mock engine
+            self.assertEqual(report['transcripts'], 6)
+
+            # A baseline that was much faster is reported as a regression
+            for stage in report['stages'].values():
+                stage['seconds'] = 0.0
+            report['total_seconds'] = 0.0
+            with open(report_path, 'w') as f:
+                json.dump(report, f)
+            with patch('protocols.management.commands.bench_pipeline.NOISE_FLOOR_SECONDS', 0.0), \
+                    self.assertRaisesMessage(CommandError, 'Slower than the baseline'):
+                call_command('bench_pipeline', *args, '--compare', report_path, stdout=StringIO())
+
+    def test_bench_pipeline_with_opus_tracks(self):
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            report_path = os.path.join(tmpdir, 'report.json')
+            call_command(
+                'bench_pipeline', '--duration', '6', '--speakers', '2', '--samplerate', '16000',
+                '--window-seconds', '2', '--format', 'opus', '--output', report_path, stdout=StringIO()
+            )
+            with open(report_path) as f:
+                report = json.load(f)
+
+        self.assertEqual(report['config']['format'], 'opus')
+        self.assertEqual(report['transcripts'], 6)
+        self.assertGreater(report['file_mb'], 0.0)
+
+@override_settings(STATUS_BACKEND='memory')
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        from protocols.core.status.factory import get_status_store
+        get_status_store().clear()
+        self.assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests/assets')
+
+    def test_stage_timer_counts_interleaved_time_once(self):
+        import time
+        from protocols.core.metrics import StageTimer
+
+        def chunks():
+            for _ in range(2):
+                time.sleep(0.02)
+                yield 'x'
+
+        timer = StageTimer()
+        start = time.perf_counter()
+        with timer.stage('upload'):
+            for _ in timer.timed(chunks(), 'render'):
+                time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+
+        self.assertGreaterEqual(timer.seconds['render'], 0.04)
+        self.assertGreaterEqual(timer.seconds['upload'], 0.02)
+        self.assertLess(timer.seconds['upload'], timer.seconds['render'])
+        # Counting the 40 ms of render twice would be well outside this
+        self.assertAlmostEqual(sum(timer.seconds.values()), elapsed, delta=0.02)
+
+    def test_exposition_adds_up_processes(self):
+        from protocols.core import metrics
+
+        registry = []
+        jobs = metrics.Counter('test_jobs_total', 'Jobs.', ['status'], registry=registry)
+        latency = metrics.Histogram('test_latency_seconds', 'Latency.', buckets=(0.1, 1), registry=registry)
+        jobs.labels(status='completed').inc()
+        latency.observe(0.05)
+        latency.observe(5)
+        snap = metrics.snapshot(registry)
+
+        text = metrics.render(metrics.merge([snap, json.loads(json.dumps(snap))]))
+        self.assertIn('# TYPE test_jobs_total counter', text)
+        self.assertIn('test_jobs_total{status="completed"} 2.0', text)
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{le="1.0"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn('test_latency_seconds_sum 10.1', text)
+        self.assertIn('test_latency_seconds_count 4', text)
+
+    def test_gauges_are_not_added_up(self):
+        from protocols.core import metrics
+
+        registry = []
+        loaded = metrics.Gauge('test_loaded_seconds', 'Per process.', registry=registry)
+        queue = metrics.Gauge('test_queue_depth', 'Shared.', registry=registry, multiprocess_mode='max')
+        loaded.set(2.0)
+        queue.set(3)
+        first = json.loads(json.dumps(metrics.snapshot(registry)))
+        loaded.set(5.0)
+        queue.set(7)
+        second = json.loads(json.dumps(metrics.snapshot(registry)))
+        second['test_loaded_seconds']['pid'] = first['test_queue_depth']['pid'] = 1
+
+        text = metrics.render(metrics.merge([first, second]))
+        self.assertIn(f'test_loaded_seconds{{pid="{os.getpid()}"}} 2.0', text)
+        self.assertIn('test_loaded_seconds{pid="1"} 5.0', text)
+        self.assertIn('test_queue_depth 7.0', text)
+        with self.assertRaises(ValueError):
+            metrics.Gauge('test_bad', 'Bad.', registry=[], multiprocess_mode='average')
+
+    def test_exited_processes_are_counted_once(self):
+        import subprocess
+        import sys
+        import tempfile
+        from protocols.core import metrics
+
+        registry = []
+        jobs = metrics.Counter('test_exited_jobs_total', 'Jobs.', registry=registry)
+        loaded = metrics.Gauge('test_exited_loaded_seconds', 'Per process.', registry=registry)
+        jobs.inc(3)
+        loaded.set(1.5)
+        dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+        pid = int(dead.stdout)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for other in (pid, pid + 1):
+                snap = metrics.snapshot(registry)
+                snap['test_exited_loaded_seconds']['pid'] = other
+                with open(os.path.join(tmpdir, f'{other}.json'), 'w') as f:
+                    json.dump(snap, f)
+            open(os.path.join(tmpdir, f'{pid}.abc.tmp'), 'w').close()
+
+            with patch.object(metrics, '_alive', side_effect=lambda p: p != pid):
+                first = metrics.collect(tmpdir)
+                second = metrics.collect(tmpdir)
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['.lock', f'{pid + 1}.json', metrics.EXITED_FILE])
+
+            # This process retires its own snapshot on exit
+            with patch.object(metrics, 'REGISTRY', registry), patch.object(metrics, '_retired_pid', None):
+                metrics.retire_process(tmpdir)
+                metrics.write_snapshot(tmpdir)
+                with patch.object(metrics, '_alive', return_value=True), patch.object(metrics, 'REGISTRY', []):
+                    third = metrics.collect(tmpdir)
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['.lock', f'{pid + 1}.json', metrics.EXITED_FILE])
+
+        for text in (first, second):
+            self.assertIn('test_exited_jobs_total 6.0', text)
+            self.assertIn(f'test_exited_loaded_seconds{{pid="{pid + 1}"}} 1.5', text)
+            self.assertNotIn(f'pid="{pid}"', text)
+        self.assertIn('test_exited_jobs_total 9.0', third)
+
+    def test_pool_processes_drop_inherited_metrics(self):
+        from ProtoScript.celery import warm_up_stt_engine
+        from protocols.core import metrics
+
+        with self.settings(STT_PRELOAD=False, WORKER_READY_FILE='', METRICS_DIR=''), \
+                patch.object(metrics, 'reset') as reset:
+            warm_up_stt_engine()
+        reset.assert_called_once_with()
+
+    @patch('protocols.core.s3_storage.get_s3_client')
+    def test_s3_calls_record_bytes_and_latency(self, mock_get_client):
+        from io import BytesIO
+        from protocols.core import metrics
+        from protocols.core.s3_storage import S3Storage
+
+        client = mock_get_client.return_value
+        client.get_object.return_value = {'Body': BytesIO(b'abcd')}
+        received = metrics.S3_BYTES.labels(operation='get_range', direction='in')
+        requests = metrics.S3_REQUEST_SECONDS.labels(operation='get_range')
+        before_bytes, before_count = received.value(), requests.value()['count']
+
+        self.assertEqual(S3Storage().get_range('jobs/x/audio.flac', 0, 4), b'abcd')
+        self.assertEqual(received.value() - before_bytes, 4)
+        self.assertEqual(requests.value()['count'] - before_count, 1)
+
+    @patch('protocols.worker.tasks.S3Storage')
+    def test_job_status_has_timings_and_metrics_are_exposed(self, mock_storage_class):
+        import shutil
+        from protocols.core import utils
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.status.factory import get_status_store
+        from protocols.worker.tasks import process_protocol_task
+
+        files = {
+            'meta.json': os.path.join(self.assets, 'meta.json'),
+            'audio.flac': os.path.join(self.assets, 'audio_protocol.flac'),
+        }
+        storage = mock_storage_class.return_value
+        storage.download_file.side_effect = lambda key, path: shutil.copy(files[key.rsplit('/', 1)[1]], path)
+        storage.list_keys.return_value = []
+        storage.save_result_stream.side_effect = lambda job_id, chunks, template_name=None: list(chunks)
+
+        job_id = '550e8400-e29b-41d4-a716-446655440001'
+        with self.settings(AUDIO_WINDOW_SECONDS=10, FANOUT_MIN_SECONDS=0), \
+                patch.object(utils, 'get_engine', return_value=MockEngine()):
+            process_protocol_task(job_id)
+
+        status = get_status_store().get(job_id)
+        self.assertEqual(status['status'], 'completed')
+        for stage in ('download', 'decode', 'asr', 'checkpoint', 'render', 'upload'):
+            self.assertGreaterEqual(status['timings'][stage], 0.0)
+        self.assertLessEqual(sum(status['timings'].values()), status['processing_seconds'])
+
+        response = Client().get(reverse('protocol_metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode('utf-8')
+        self.assertIn('protoscript_stage_seconds_bucket{stage="asr",le="+Inf"}', body)
+        self.assertIn('protoscript_asr_rtf_count{engine="mockengine",model=""}', body)
+        self.assertIn('protoscript_jobs_total{status="completed"}', body)
+
+@override_settings(
+    STATUS_BACKEND='memory', JOB_COST_PER_AUDIO_SECOND=0.1,
+    JOB_SIZE_CLASSES=[
+        {'name': 'short', 'max_cost_seconds': 120, 'priority': 9, 'workers': 2},
+        {'name': 'long', 'priority': 0, 'workers': 1},
+    ]
+)
+class BacklogEstimateTests(SimpleTestCase):
+    def setUp(self):
+        from protocols.core.status.factory import get_status_store
+        self.store = get_status_store()
+        self.store.clear()
+
+    @patch('protocols.api.views.get_queue_backend')
+    def test_backlog_counts_audio_and_predicts_completion(self, mock_get_queue):
+        from datetime import datetime, timezone as dt_timezone
+        from protocols.api.views import enqueue_job
+        from protocols.core.flac import StreamInfo
+        from protocols.core.queue.backlog import estimate_backlog, predict_completion
+
+        # A 10 s stereo clip and a 3 h stereo session are one job each, but
+        # not the same amount of work
+        enqueue_job('clip', ['default.md.j2'], audio_info=StreamInfo(48000, 2, 16, 480000))
+        enqueue_job('session', ['default.md.j2'], audio_info=StreamInfo(48000, 2, 16, 48000 * 10800))
+        # A running 100 s stereo job, 40 s in
+        self.store.update('running', {
+            'status': 'processing', 'created_at': '2026-01-01T00:00:00+00:00', 'size_class': 'short',
+            'audio_seconds': 100.0, 'audio_seconds_done': 40.0, 'channels_total': 2,
+        })
+        # Finished jobs ran at half the configured estimate
+        self.store.record_rtf(0.05, 0.2)
+
+        estimate = estimate_backlog(self.store)
+        self.assertEqual(estimate['rtf'], 0.05)
+        short, long = estimate['size_classes']['short'], estimate['size_classes']['long']
+        self.assertEqual((short['queued_jobs'], short['running_jobs']), (1, 1))
+        self.assertAlmostEqual(short['queued_audio_seconds'], 20.0)
+        self.assertAlmostEqual(short['running_audio_seconds'], 120.0)
+        self.assertAlmostEqual(short['compute_seconds'], 7.0)
+        self.assertAlmostEqual(short['drain_seconds'], 3.5)
+        self.assertAlmostEqual(long['compute_seconds'], 21600 * 0.05)
+
+        now = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        running = predict_completion(self.store.get('running'), estimate, now)
+        self.assertAlmostEqual(running['predicted_remaining_seconds'], 6.0)
+        # Queued behind nothing else in its class: just its own audio
+        session = predict_completion(self.store.get('session'), estimate, now)
+        self.assertAlmostEqual(session['predicted_remaining_seconds'], 1080.0)
+        self.assertEqual(session['predicted_completion_at'], '2026-01-01T00:18:00+00:00')
+
+        # Starting the job takes it out of the queued backlog
+        self.store.adjust_backlog('long', -1, -2160.0, -21600.0)
+        self.assertEqual(estimate_backlog(self.store)['size_classes']['long']['compute_seconds'], 0.0)
+
+    def test_backlog_is_exposed_for_autoscalers(self):
+        self.store.adjust_backlog('long', 1, 360.0, 3600.0)
+
+        response = Client().get(reverse('protocol_backlog'))
+        self.assertEqual(response.status_code, 200)
+        self.assertAlmostEqual(response.json()['size_classes']['long']['compute_seconds'], 360.0)
+
+        body = Client().get(reverse('protocol_metrics')).content.decode('utf-8')
+        self.assertIn('protoscript_backlog_audio_seconds{size_class="long",state="queued"} 3600.0', body)
+        self.assertIn('protoscript_backlog_drain_seconds{size_class="long"} 360.0', body)
+        self.assertIn('protoscript_observed_rtf 0.1', body)
+
+    def test_redis_store_averages_rtf_atomically(self):
+        with patch('protocols.core.status.redis_store.redis.Redis.from_url') as from_url:
+            from protocols.core.status.redis_store import RECORD_RTF, RedisStatusStore
+            store = RedisStatusStore('redis://example/0')
+            client = from_url.return_value
+            client.hget.return_value = b'0.25'
+
+            store.record_rtf(0.5, 0.2)
+            self.assertEqual(store.get_rtf(), 0.25)
+
+        client.eval.assert_called_once_with(RECORD_RTF, 1, 'protoscript:job:throughput', 0.5, 0.2)
+
+class InferenceServerTests(SimpleTestCase):
+    def setUp(self):
+        import tempfile
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.socket_path = os.path.join(tmpdir.name, 'stt.sock')
+
+    def _serve(self, engine, **kwargs):
+        from protocols.core.engines.server import InferenceServer
+        server = InferenceServer(engine, self.socket_path, **kwargs)
+        server.start()
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_concurrent_jobs_share_batches(self):
+        import time
+        import numpy as np
+        from concurrent.futures import ThreadPoolExecutor
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.engines.remote import RemoteEngine
+
+        class GpuLikeEngine(MockEngine):
+            # A batch costs about as much as a single segment
+            def transcribe_batch(self, channels, samplerate):
+                time.sleep(0.05)
+                return super().transcribe_batch(channels, samplerate)
+
+        engine = GpuLikeEngine(record=True)
+        self._serve(engine, max_batch_size=16, max_wait=0.02)
+        client = RemoteEngine(self.socket_path, connect_timeout=5)
+        self.addCleanup(client.close)
+
+        def job(i):
+            # Each job sends its segments one at a time, like a worker without VAD batching
+            return [client.transcribe_channel(np.full(1600, i, dtype=np.int16), 16000) for _ in range(4)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(job, range(8)))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([len(r) for r in results], [4] * 8)
+        self.assertEqual(results[0][0][0]['text'], 'This is a mock transcription.')
+        self.assertEqual(sum(engine.received_batches), 32)
+        self.assertGreater(max(engine.received_batches), 1)
+        # One batch per segment would take 32 x 50 ms
+        self.assertLess(elapsed, 32 * 0.05 / 2)
+
+    def test_remote_engine_is_selected_and_reports_errors(self):
+        import numpy as np
+        from protocols.core.engines.factory import get_stt_engine
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.engines.remote import RemoteEngine
+
+        class FailingEngine(MockEngine):
+            def transcribe_batch(self, channels, samplerate):
+                raise ValueError('out of memory')
+
+        with self.settings(STT_ENGINE='remote', STT_SERVER_SOCKET=self.socket_path, STT_WORKERS=0):
+            client = get_stt_engine()
+        self.assertIsInstance(client, RemoteEngine)
+        self.addCleanup(client.close)
+
+        self._serve(FailingEngine())
+        with self.assertLogs('protocols.core.engines.server', 'ERROR'), \
+                self.assertRaisesMessage(RuntimeError, 'Inference server error: out of memory'):
+            client.transcribe_channel(np.zeros(160, dtype=np.float32), 16000)
+
+    def test_remote_transcripts_are_cached_under_the_servers_model(self):
+        import tempfile
+        import numpy as np
+        from protocols.core.cache.disk import DiskTranscriptCache
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.engines.remote import RemoteEngine
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        data = np.random.default_rng(0).random((1600, 1)).astype(np.float32)
+        users = {'1': {'name': 'Alice', 'channel': 0}}
+
+        def run(model):
+            engine = MockEngine(record=True)
+            engine.cache_options = {'engine': 'whisper', 'model': model}
+            server = self._serve(engine)
+            client = RemoteEngine(self.socket_path, connect_timeout=5)
+            client.cache = DiskTranscriptCache(tmpdir.name, max_bytes=1 << 20)
+            client.cache_options = {'engine': 'remote', 'model': 'ignored'}
+            try:
+                stats = {}
+                client.transcribe(data, 16000, users, stats=stats)
+                self.assertEqual(client.server_info(), {'engine': 'whisper', 'model': model})
+                return stats['cache']['0'], len(engine.received_segments)
+            finally:
+                client.close()
+                server.shutdown()
+
+        self.assertEqual(run('tiny'), ({'hits': 0, 'misses': 1}, 1))
+        self.assertEqual(run('tiny'), ({'hits': 1, 'misses': 0}, 0))
+        # A server restarted with another model does not reuse them
+        self.assertEqual(run('large'), ({'hits': 0, 'misses': 1}, 1))
+
+    def test_remote_engine_retries_on_a_new_connection_after_a_restart(self):
+        import socket
+        import numpy as np
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.engines.remote import RemoteEngine
+
+        engine = MockEngine(record=True)
+        self._serve(engine)
+        client = RemoteEngine(self.socket_path, connect_timeout=5)
+        self.addCleanup(client.close)
+        client.server_info()
+        # The connection of a server process that has since died
+        client.close()
+        client._local.sock, peer = socket.socketpair(socket.AF_UNIX)
+        peer.close()
+
+        result = client.transcribe_channel(np.zeros(160, dtype=np.float32), 16000)
+
+        self.assertEqual(result[0]['text'], 'This is a mock transcription.')
+        self.assertEqual(engine.received_batches, [1])
+
+    def test_remote_engine_does_not_resend_a_batch_that_timed_out(self):
+        import socket
+        import time
+        import numpy as np
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.engines.remote import RemoteEngine
+
+        class SlowEngine(MockEngine):
+            def transcribe_batch(self, channels, samplerate):
+                time.sleep(0.2)
+                return super().transcribe_batch(channels, samplerate)
+
+        engine = SlowEngine(record=True)
+        self._serve(engine)
+        client = RemoteEngine(self.socket_path, timeout=0.1, connect_timeout=5)
+        self.addCleanup(client.close)
+
+        with self.assertRaises(socket.timeout):
+            client.transcribe_channel(np.zeros(160, dtype=np.float32), 16000)
+        # Long enough for a second copy of the batch to have been run
+        time.sleep(0.5)
+        self.assertEqual(engine.received_batches, [1])
+
+@override_settings(STATUS_BACKEND='memory')
+class JobPrefetchTests(SimpleTestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+        from protocols.core.status.factory import get_status_store
+        get_status_store().clear()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.prefetch_dir = tmpdir.name
+        assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests/assets')
+        self.files = {
+            'meta.json': os.path.join(assets, 'meta.json'),
+            'audio.flac': os.path.join(assets, 'audio_protocol.flac'),
+        }
+        self.storage = MagicMock()
+        self.storage.download_file.side_effect = lambda key, path: shutil.copy(self.files[key.rsplit('/', 1)[1]], path)
+        self.storage.object_size.return_value = os.path.getsize(self.files['audio.flac'])
+
+    @patch('protocols.worker.tasks.S3Storage')
+    @patch('protocols.worker.prefetch.S3Storage')
+    def test_task_uses_prefetched_inputs_within_budget(self, prefetch_storage_class, task_storage_class):
+        from protocols.core import utils
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.status.factory import get_status_store
+        from protocols.worker.prefetch import Prefetcher
+        from protocols.worker.tasks import process_protocol_task
+
+        prefetch_storage_class.return_value = task_storage_class.return_value = self.storage
+        store = get_status_store()
+        for job_id in ('first', 'second'):
+            store.update(job_id, {'status': 'pending'})
+        budget = int(self.storage.object_size.return_value * 1.5)
+        prefetcher = Prefetcher(self.prefetch_dir, budget)
+        prefetcher.schedule('first').result()
+        # Both jobs' audio would not fit
+        prefetcher.schedule('second').result()
+        self.assertEqual(os.listdir(self.prefetch_dir), ['first'])
+
+        self.storage.download_file.reset_mock()
+        with self.settings(JOB_PREFETCH_DIR=self.prefetch_dir, JOB_PREFETCH_MAX_BYTES=budget), \
+                patch.object(utils, 'get_engine', return_value=MockEngine()):
+            process_protocol_task('first')
+
+        self.assertFalse(self.storage.download_file.called)
+        self.assertEqual(store.get('first')['status'], 'completed')
+        self.assertEqual(len(self.storage.save_transcripts.call_args[0][1]), 2)
+        # The claimed inputs are removed once the job is done
+        self.assertEqual(os.listdir(self.prefetch_dir), [])
+
+    @patch('protocols.worker.tasks.S3Storage')
+    def test_results_upload_in_background(self, task_storage_class):
+        import threading
+        from protocols.core import utils
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.status.factory import get_status_store
+        from protocols.worker.tasks import process_protocol_task
+        from protocols.worker.uploader import drain_uploads
+
+        task_storage_class.return_value = self.storage
+        uploading = threading.Event()
+        self.storage.save_transcripts.side_effect = lambda *args: uploading.wait(5)
+        store = get_status_store()
+        store.update('job', {'status': 'pending'})
+        with self.settings(JOB_ASYNC_UPLOAD=True), patch.object(utils, 'get_engine', return_value=MockEngine()):
+            process_protocol_task('job')
+            # The task returned while its results are still being uploaded
+            self.assertEqual(store.get('job')['status'], 'processing')
+            uploading.set()
+            drain_uploads()
+
+        status = store.get('job')
+        self.assertEqual(status['status'], 'completed')
+        self.assertIn('upload', status['timings'])
+        self.storage.save_status.assert_called_once_with('job', status)
+
+@override_settings(STATUS_BACKEND='memory')
+class AudioTrackTests(SimpleTestCase):
+    def setUp(self):
+        from protocols.core.status.factory import get_status_store
+        get_status_store().clear()
+        self.assets = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests/assets')
+        self.tracks = {
+            '103595873841188864': os.path.join(self.assets, 'GiantTree_103595873841188864.ogg'),
+            '245056131989241857': os.path.join(self.assets, 'TheMeinerLP_245056131989241857.ogg'),
+        }
+
+    def test_track_names_and_ogg_length(self):
+        import soundfile as sf
+        from protocols.core.tracks import TRACK_HEAD_BYTES, TRACK_TAIL_BYTES, read_track_info, track_name
+
+        self.assertEqual(track_name('GiantTree_103595873841188864.ogg'), '103595873841188864.ogg')
+        self.assertEqual(track_name('245056131989241857.OPUS'), '245056131989241857.opus')
+        for bad in ('talk.mp3', 'Giant Tree.ogg'):
+            with self.assertRaises(ValueError):
+                track_name(bad)
+
+        for path in self.tracks.values():
+            with open(path, 'rb') as f:
+                data = f.read()
+            info = read_track_info(data[:TRACK_HEAD_BYTES], data[-TRACK_TAIL_BYTES:])
+            self.assertEqual((info.samplerate, info.channels, info.frames), (48000, 1, sf.info(path).frames))
+        with open(os.path.join(self.assets, 'audio_protocol.flac'), 'rb') as f:
+            self.assertEqual(read_track_info(f.read(TRACK_HEAD_BYTES)).channels, 2)
+
+    @patch('protocols.api.views.S3Storage')
+    @patch('protocols.api.views.get_queue_backend')
+    def test_request_with_tracks_streams_them_to_s3(self, mock_get_queue, mock_storage_class):
+        from protocols.core.s3_storage import S3Storage
+        mock_storage = mock_storage_class.return_value
+        mock_storage.multipart_part_size = S3Storage.multipart_part_size
+        client = Client()
+
+        with open(os.path.join(self.assets, 'meta.json'), 'rb') as meta, \
+                open(self.tracks['103595873841188864'], 'rb') as first, \
+                open(self.tracks['245056131989241857'], 'rb') as second:
+            response = client.post(reverse('protocol_request'), {'meta': meta, 'tracks': [first, second]})
+
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data['audio_tracks'], ['103595873841188864.ogg', '245056131989241857.ogg'])
+        self.assertEqual(data['audio_channels'], 2)
+        self.assertAlmostEqual(data['audio_seconds'], 40.083, places=3)
+        uploaded = {c.args[0]: c.args[2] for c in mock_storage.upload_bytes.call_args_list}
+        job_id = data['id']
+        self.assertEqual(uploaded[f'jobs/{job_id}/tracks/103595873841188864.ogg'], 'audio/ogg')
+        self.assertNotIn(f'jobs/{job_id}/audio.flac', uploaded)
+
+        with open(os.path.join(self.assets, 'meta.json'), 'rb') as meta, \
+                open(os.path.join(self.assets, 'audio_protocol.flac'), 'rb') as audio, \
+                open(self.tracks['103595873841188864'], 'rb') as first:
+            response = client.post(reverse('protocol_request'), {'meta': meta, 'audio': audio, 'tracks': [first]})
+        self.assertEqual(response.status_code, 400)
+
+    @patch('protocols.worker.tasks.S3Storage')
+    def test_worker_decodes_tracks_in_parallel_and_resumes(self, mock_storage_class):
+        import shutil
+        from protocols.core import utils
+        from protocols.core.engines.mock import MockEngine
+        from protocols.core.status.factory import get_status_store
+        from protocols.worker.tasks import process_protocol_task
+
+        objects = {}
+        storage = mock_storage_class.return_value
+        files = {f'tracks/{user_id}.ogg': path for user_id, path in self.tracks.items()}
+        files['meta.json'] = os.path.join(self.assets, 'meta.json')
+        storage.download_file.side_effect = lambda key, path: shutil.copy(files[key.split('/', 2)[2]], path)
+        storage.upload_json.side_effect = objects.__setitem__
+        storage.download_json.side_effect = lambda key: json.loads(json.dumps(objects[key]))
+        storage.list_keys.side_effect = lambda prefix: sorted(k for k in objects if k.startswith(prefix))
+        storage.delete_keys.side_effect = lambda keys: [objects.pop(k) for k in keys] and []
+
+        class CrashingEngine(MockEngine):
+            def transcribe_windows(self, windows, *args, **kwargs):
+                windows = list(windows)
+                if windows[0][0] >= 20:
+                    raise MemoryError('killed')
+                return super().transcribe_windows(windows, *args, **kwargs)
+
+        store = get_status_store()
+        store.update('job', {'status': 'pending', 'audio_tracks': sorted(f'{u}.ogg' for u in self.tracks)})
+        with self.settings(AUDIO_WINDOW_SECONDS=10):
+            with patch.object(utils, 'get_engine', return_value=CrashingEngine()), self.assertRaises(MemoryError):
+                process_protocol_task('job')
+            engine = MockEngine(record=True)
+            with patch.object(utils, 'get_engine', return_value=engine):
+                process_protocol_task('job')
+
+        status = store.get('job')
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['parts_done'], status['parts_total'])
+        # Only the windows from 20 s on were transcribed again, per track
+        self.assertEqual(len(engine.received_segments), 4)
+        transcripts = storage.save_transcripts.call_args[0][1]
+        self.assertEqual(
+            sorted((t['user_name'], t['timestamp']) for t in transcripts),
+            sorted((name, start + 1.0) for name in ('GiantTree', 'TheMeinerLP') for start in range(0, 40, 10))
+        )
+        keys = [c.args[0] for c in storage.download_file.call_args_list]
+        self.assertNotIn('jobs/job/audio.flac', keys)
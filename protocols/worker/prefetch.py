@@ -0,0 +1,188 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from protocols.core.s3_storage import S3Storage
+from protocols.core.status.factory import get_status_store
+
+logger = logging.getLogger(__name__)
+
+# <job_id>.part is being downloaded, <job_id> is ready, <job_id>.claimed is
+# in use by the job's task; the renames between them are atomic
+PARTIAL_SUFFIX = '.part'
+CLAIMED_SUFFIX = '.claimed'
+STALE_SUFFIX = '.stale'
+# A task waiting for its prefetch claims it right away; ready files left
+# longer than this belong to jobs that started without them
+UNCLAIMED_GRACE_SECONDS = 60
+
+
+def prefetch_dir():
+    return getattr(settings, 'JOB_PREFETCH_DIR', '/tmp/protoscript-prefetch')
+
+
+def prefetch_enabled():
+    return getattr(settings, 'JOB_PREFETCH_MAX_BYTES', 0) > 0
+
+
+def input_files(status_data):
+    """
+    The inputs of a job, below jobs/<id>/ in S3 and the job's prefetch
+    directory: meta.json and audio.flac, or the job's per-user tracks.
+    """
+    tracks = status_data.get('audio_tracks')
+    return ['meta.json'] + ([f"tracks/{name}" for name in tracks] if tracks else ['audio.flac'])
+
+
+def _tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class Prefetcher:
+    """
+    Downloads the inputs of jobs the worker has reserved but not started
+    into ``<directory>/<job_id>/``, so the task finds them on disk instead
+    of waiting for S3 while the previous job was busy with ASR. Files go to
+    ``<job_id>.part`` first and are renamed once complete. Jobs that would
+    take the directory over ``max_bytes`` are left to download themselves,
+    as are jobs that already started.
+    """
+
+    def __init__(self, directory, max_bytes, workers=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        # Bytes promised to downloads in progress
+        self._reserved = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def clear(self):
+        """
+        Removes what is left from an earlier run; its jobs are redelivered
+        and prefetched again.
+        """
+        for name in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def schedule(self, job_id):
+        return self._executor.submit(self._fetch, job_id)
+
+    def _used_bytes(self):
+        complete = sum(
+            _tree_size(os.path.join(self.directory, name))
+            for name in os.listdir(self.directory) if not name.endswith(PARTIAL_SUFFIX)
+        )
+        return complete + sum(self._reserved.values())
+
+    def _pending(self, job_id, status_data=None):
+        if status_data is None:
+            status_data = get_status_store().get(job_id) or {}
+        return status_data.get('status') == 'pending'
+
+    def _fetch(self, job_id):
+        target = os.path.join(self.directory, job_id)
+        partial = target + PARTIAL_SUFFIX
+        if any(os.path.exists(target + suffix) for suffix in ('', PARTIAL_SUFFIX, CLAIMED_SUFFIX)):
+            return
+        status_data = get_status_store().get(job_id) or {}
+        if not self._pending(job_id, status_data):
+            return
+        files = input_files(status_data)
+        storage = S3Storage()
+        try:
+            size = sum(storage.object_size(f"jobs/{job_id}/{name}") for name in files[1:])
+        except Exception as e:
+            logger.warning("Not prefetching job %s: %s", job_id, e)
+            return
+        with self._lock:
+            self._prune()
+            if self._used_bytes() + size > self.max_bytes:
+                logger.info("Not prefetching job %s: %d bytes would exceed the budget", job_id, size)
+                return
+            self._reserved[job_id] = size
+            os.makedirs(partial)
+        try:
+            for name in files:
+                path = os.path.join(partial, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                storage.download_file(f"jobs/{job_id}/{name}", path)
+            os.rename(partial, target)
+        except Exception as e:
+            logger.warning("Prefetching job %s failed: %s", job_id, e)
+            shutil.rmtree(partial, ignore_errors=True)
+        finally:
+            with self._lock:
+                self._reserved.pop(job_id, None)
+
+    def _prune(self):
+        # Ready inputs of jobs that are no longer waiting for them
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if '.' in name or not os.path.isdir(path):
+                continue
+            try:
+                age = time.time() - os.path.getmtime(path)
+            except OSError:
+                continue
+            if age > UNCLAIMED_GRACE_SECONDS and not self._pending(name):
+                self._discard(path)
+
+    @staticmethod
+    def _discard(target):
+        # Renamed first, so a task claiming it at the same time keeps it
+        try:
+            os.rename(target, target + STALE_SUFFIX)
+        except OSError:
+            return
+        shutil.rmtree(target + STALE_SUFFIX, ignore_errors=True)
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher(prefetch_dir(), getattr(settings, 'JOB_PREFETCH_MAX_BYTES', 0))
+        return _prefetcher
+
+
+def claim(job_id, timeout=None):
+    """
+    Takes the job's prefetched inputs, first waiting for a download that
+    is still running (in any process sharing the directory).
+
+    :return: The directory holding the job's inputs, or None if they were
+             not prefetched; ``release`` it once done.
+    """
+    if not prefetch_enabled():
+        return None
+    if timeout is None:
+        timeout = getattr(settings, 'JOB_PREFETCH_WAIT_SECONDS', 600.0)
+    target = os.path.join(prefetch_dir(), job_id)
+    partial = target + PARTIAL_SUFFIX
+    deadline = time.monotonic() + timeout
+    while os.path.exists(partial) and time.monotonic() < deadline:
+        time.sleep(0.2)
+    try:
+        os.rename(target, target + CLAIMED_SUFFIX)
+    except OSError:
+        return None
+    return target + CLAIMED_SUFFIX
+
+
+def release(job_id):
+    shutil.rmtree(os.path.join(prefetch_dir(), job_id + CLAIMED_SUFFIX), ignore_errors=True)
@@ -1,56 +1,500 @@
+import contextlib
+import json
+import logging
+import math
+import mmap
 import os
 import tempfile
-import json
-from celery import shared_task
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import soundfile as sf
+from botocore.exceptions import BotoCoreError, ClientError
+from celery import chord, shared_task
+from django.conf import settings
 from django.utils import timezone
+from protocols.core import metrics
+from protocols.core.audio import iter_channel_windows, iter_flac_range_windows, iter_track_windows, mapped_channels
+from protocols.core.checkpoints import WindowCheckpoints
+from protocols.core.flac import STREAMINFO_BYTES, Frame, StreamInfo, audio_offset, locate_sample, read_streaminfo
+from protocols.core.queue.routing import classify, estimate_cost
 from protocols.core.s3_storage import S3Storage
-from protocols.core.utils import transcribe_audio, generate_protocol
+from protocols.core.segments import AudioSegment, merge_segment_transcripts, merge_window_transcripts, plan_segments
+from protocols.core.status.factory import get_status_store
+from protocols.core.templates import get_template_registry
+from protocols.core.tracks import map_tracks, track_key
+from protocols.core.utils import (
+    transcribe_each_window, transcribe_flac_range, render_protocol_stream, window_overlap_seconds
+)
+from protocols.worker import prefetch
+from protocols.worker.uploader import async_upload_enabled, get_uploader
 
-@shared_task
-def process_protocol_task(job_id, template_name='default.md.j2'):
+logger = logging.getLogger(__name__)
+
+# Per-user tracks fetched at once
+TRACK_DOWNLOAD_CONCURRENCY = 8
+
+def finish_job(store, storage, job_id, status_data):
+    store.update(job_id, status_data)
+    if not store.durable:
+        # The live store may expire; keep the final state in S3
+        storage.save_status(job_id, store.get(job_id) or status_data)
+
+def save_results(storage, job_id, meta_data, transcriptions, template_names, timer=None):
+    timer = timer or metrics.StageTimer()
+    registry = get_template_registry()
+    for i, name in enumerate(template_names):
+        # Templates are kept locally in the monolith, as they are part of the "Prod Code"
+        protocol = timer.timed(render_protocol_stream(meta_data, transcriptions, registry.get(name)), 'render')
+
+        # Stream the rendered protocol to S3; rendering happens as the
+        # upload pulls the chunks and is counted on its own
+        with timer.stage('upload'):
+            if i == 0:
+                storage.save_result_stream(job_id, protocol)
+                if len(template_names) > 1:
+                    storage.copy_result(job_id, name)
+            else:
+                storage.save_result_stream(job_id, protocol, template_name=name)
+
+def add_timings(*timings):
+    # Seconds per stage, summed; a fanned-out job's are over all its subtasks
+    total = {}
+    for seconds in timings:
+        for stage, value in (seconds or {}).items():
+            total[stage] = total.get(stage, 0.0) + value
+    return total
+
+def complete_job(store, storage, job_id, started_at, stats, timings=None):
+    completed_at = timezone.now()
+    processing_seconds = (completed_at - started_at).total_seconds()
+    finish_job(store, storage, job_id, {
+        'status': 'completed',
+        'completed_at': completed_at.isoformat(),
+        'audio_seconds': stats.get('audio_seconds'),
+        'processing_seconds': processing_seconds,
+        'timings': timings or {},
+        'stats': stats
+    })
+    metrics.JOBS.labels(status='completed').inc()
+    metrics.JOB_SECONDS.labels(status='completed').observe(processing_seconds)
+    compute_seconds = sum((timings or {}).values())
+    if compute_seconds and stats.get('audio_seconds'):
+        # Worker seconds (over all subtasks) per second of one channel, for
+        # the backlog estimate
+        store.record_rtf(compute_seconds / stats['audio_seconds'], getattr(settings, 'BACKLOG_RTF_SMOOTHING', 0.2))
+
+def fail_job(store, storage, job_id, started_at, error, timings=None):
+    processing_seconds = (timezone.now() - started_at).total_seconds()
+    status_data = {
+        'status': 'failed',
+        'error_message': str(error),
+        'processing_seconds': processing_seconds
+    }
+    if timings:
+        status_data['timings'] = timings
+    finish_job(store, storage, job_id, status_data)
+    metrics.JOBS.labels(status='failed').inc()
+    metrics.JOB_SECONDS.labels(status='failed').observe(processing_seconds)
+
+# Acknowledged only once finished, and put back on the queue if the worker
+# process dies (OOM kill, eviction), so a crash means a retry; the tasks
+# pick up their checkpoints instead of starting over.
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def process_protocol_task(job_id, template_name='default.md.j2', template_names=None):
+    # template_names renders several templates from one transcription pass;
+    # the first one is also stored as the job's primary result.md
+    template_names = template_names or [template_name]
     storage = S3Storage()
-    storage.update_status(job_id, {'status': 'processing', 'started_at': timezone.now().isoformat()})
+    store = get_status_store()
+    queued = store.get(job_id) or {}
+    if queued.get('status') == 'completed':
+        # Delivered again after it finished
+        return
+    if queued.get('status') == 'processing' and queued.get('fanout'):
+        # Redelivered after the chord was started; its tasks finish the job
+        return
+    if queued.get('size_class') and queued.get('status') == 'pending':
+        # No longer waiting; drop it from its class's backlog
+        store.adjust_backlog(
+            queued['size_class'], -1, -(queued.get('estimated_cost_seconds') or 0.0),
+            -(queued.get('audio_seconds') or 0.0) * (queued.get('audio_channels') or 1)
+        )
+    if queued.get('status') == 'processing' and queued.get('started_at'):
+        # A retry after a crash; the job has been running since then
+        started_at = datetime.fromisoformat(queued['started_at'])
+    else:
+        started_at = timezone.now()
+    store.update(job_id, {'status': 'processing', 'started_at': started_at.isoformat()})
+    store.increment(job_id, {'attempts': 1})
+    timer = metrics.StageTimer()
+    inputs = None
+    in_background = False
 
     try:
         # Create temporary directory for processing
         with tempfile.TemporaryDirectory() as tmpdir:
-            # Download meta and audio from S3
-            meta_path = os.path.join(tmpdir, 'meta.json')
-            audio_path = os.path.join(tmpdir, 'audio.flac')
-            
-            storage.download_file(f"jobs/{job_id}/meta.json", meta_path)
-            storage.download_file(f"jobs/{job_id}/audio.flac", audio_path)
-            
+            # Inputs the worker prefetched while the previous job ran, else
+            # download meta from S3
+            with timer.stage('download'):
+                inputs = prefetch.claim(job_id)
+                meta_path = os.path.join(inputs or tmpdir, 'meta.json')
+                if inputs is None:
+                    storage.download_file(f"jobs/{job_id}/meta.json", meta_path)
             with open(meta_path, 'r') as f:
                 meta_data = json.load(f)
+            if meta_data.get('guild_id') is not None:
+                # Indexed for the job listing; a string as snowflakes exceed JS integers
+                store.update(job_id, {'guild_id': str(meta_data['guild_id'])})
+
+            if should_fan_out(queued) and fan_out(
+                    store, storage, job_id, meta_data, template_names, started_at, timer, queued.get('priority')
+            ):
+                # The merge task finishes the job
+                return
 
             # Transcribe
-            transcriptions = transcribe_audio(audio_path, meta_data.get('users', {}))
-
-            # Load template (we still keep templates locally in the monolith for now, 
-            # as they are part of the "Prod Code")
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            template_path = os.path.join(base_dir, 'templates', 'protocols', os.path.basename(template_name))
-            
-            if not os.path.exists(template_path):
-                 template_path = os.path.join(base_dir, 'templates', 'protocols', 'default.md.j2')
-            
-            with open(template_path, 'r') as f:
-                template_content = f.read()
-
-            # Generate protocol
-            protocol = generate_protocol(meta_data, transcriptions, template_content)
-
-            # Save result to S3
-            storage.save_result(job_id, protocol)
-            storage.update_status(job_id, {
-                'status': 'completed', 
-                'completed_at': timezone.now().isoformat()
-            })
+            checkpoints = WindowCheckpoints(storage, job_id, getattr(settings, 'AUDIO_WINDOW_SECONDS', 120.0))
+            done = transcribe_resumable(
+                store, storage, job_id, meta_data.get('users', {}), checkpoints, tmpdir, timer=timer,
+                local_inputs=inputs, tracks=queued.get('audio_tracks')
+            )
+            transcriptions = merge_window_transcripts(
+                [(checkpoint['start_seconds'], checkpoint['transcripts']) for checkpoint in done],
+                window_overlap_seconds()
+            )
+
+            results = (store, storage, job_id, meta_data, transcriptions, template_names, started_at, done, checkpoints, timer)
+            if async_upload_enabled():
+                # The task returns (and is acknowledged) while the results
+                # upload, so this process can start the next job
+                get_uploader().submit(upload_results_in_background, *results)
+                in_background = True
+            else:
+                upload_results(*results)
 
     except Exception as e:
-        storage.update_status(job_id, {
-            'status': 'failed',
-            'error_message': str(e)
+        fail_job(store, storage, job_id, started_at, e, timer.seconds)
+        raise e
+    finally:
+        if inputs:
+            prefetch.release(job_id)
+        if not in_background:
+            timer.observe()
+
+def upload_results(store, storage, job_id, meta_data, transcriptions, template_names, started_at, done, checkpoints, timer):
+    # Keep the transcript so other templates can be rendered later
+    # without running ASR again
+    with timer.stage('upload'):
+        storage.save_transcripts(job_id, transcriptions)
+    save_results(storage, job_id, meta_data, transcriptions, template_names, timer=timer)
+    complete_job(store, storage, job_id, started_at, combine_stats(c['stats'] for c in done), timer.seconds)
+    checkpoints.delete(len(done))
+
+def upload_results_in_background(store, storage, job_id, meta_data, transcriptions, template_names, started_at,
+                                 done, checkpoints, timer):
+    try:
+        upload_results(store, storage, job_id, meta_data, transcriptions, template_names, started_at, done,
+                       checkpoints, timer)
+    except Exception as e:
+        fail_job(store, storage, job_id, started_at, e, timer.seconds)
+        raise
+    finally:
+        timer.observe()
+
+def fetch_tracks(storage, job_id, channel_tracks, directory, download=True):
+    """
+    Downloads the tracks of ``{channel_idx: track name}`` into
+    ``directory/tracks/`` in parallel; with ``download=False`` they are
+    already there.
+
+    :return: ``{channel_idx: path}``
+    """
+    paths = {
+        channel_idx: os.path.join(directory, 'tracks', name)
+        for channel_idx, name in channel_tracks.items()
+    }
+    if download and paths:
+        os.makedirs(os.path.join(directory, 'tracks'), exist_ok=True)
+        with ThreadPoolExecutor(max_workers=min(len(paths), TRACK_DOWNLOAD_CONCURRENCY)) as pool:
+            list(pool.map(
+                lambda channel_idx: storage.download_file(
+                    track_key(job_id, channel_tracks[channel_idx]), paths[channel_idx]
+                ),
+                paths
+            ))
+    return paths
+
+def transcribe_resumable(store, storage, job_id, users, checkpoints, tmpdir, timer=None, local_inputs=None,
+                         tracks=None):
+    """
+    Transcribes the job's audio window by window, checkpointing every
+    window. Windows overlap by ``window_overlap_seconds()``; the
+    checkpoints keep each window's own transcripts, which
+    ``merge_window_transcripts`` joins. With checkpoints from an earlier attempt only the rest of the
+    audio is downloaded, from the frame before the first missing window.
+    ``local_inputs`` is a directory that already holds the job's inputs
+    (see ``protocols.worker.prefetch``). With ``tracks``, the job's audio
+    is one file per user instead of audio.flac; they are fetched whole and
+    decoded side by side.
+
+    :return: The checkpoint of every window, in order.
+    """
+    timer = timer or metrics.StageTimer()
+    audio_key = f"jobs/{job_id}/audio.flac"
+    audio_path = os.path.join(tmpdir, 'audio.flac')
+    window_seconds = checkpoints.window_seconds
+    overlap_seconds = window_overlap_seconds()
+    dtype = getattr(settings, 'AUDIO_DECODE_DTYPE', 'float32')
+    with timer.stage('download'):
+        done = checkpoints.load()
+
+    info = None
+    if done and not tracks:
+        read = lambda start, length: storage.get_range(audio_key, start, length)
+        with timer.stage('download'):
+            info = read_streaminfo(read(0, STREAMINFO_BYTES))
+        if info is None or not info.frames:
+            # Can't seek without the sample count; start over
+            done = []
+
+    with contextlib.ExitStack() as stack:
+        if tracks:
+            users, channel_tracks = map_tracks(users, tracks)
+            if not channel_tracks:
+                raise ValueError('None of the audio tracks belongs to a user in meta.json')
+            with timer.stage('download'):
+                paths = fetch_tracks(
+                    storage, job_id, channel_tracks, local_inputs or tmpdir, download=local_inputs is None
+                )
+            infos = [sf.info(path) for path in paths.values()]
+            samplerate, frames = infos[0].samplerate, max(track_info.frames for track_info in infos)
+            channels = sorted(paths)
+            resume_sample = len(done) * max(1, int(window_seconds * samplerate))
+            resume_seconds = resume_sample / samplerate
+            windows = (
+                (resume_seconds + start, window)
+                for start, window in stack.enter_context(contextlib.closing(iter_track_windows(
+                    paths, window_seconds, dtype=dtype, skip_frames=resume_sample, overlap_seconds=overlap_seconds
+                )))
+            )
+        elif not done:
+            if local_inputs:
+                audio_path = os.path.join(local_inputs, 'audio.flac')
+            else:
+                with timer.stage('download'):
+                    storage.download_file(audio_key, audio_path)
+            sf_info = sf.info(audio_path)
+            samplerate, channel_count, frames = sf_info.samplerate, sf_info.channels, sf_info.frames
+            channels = mapped_channels(users, channel_count)
+            windows = iter_channel_windows(
+                audio_path, channels, window_seconds, dtype=dtype, overlap_seconds=overlap_seconds
+            )
+        else:
+            samplerate, channel_count, frames = info.samplerate, info.channels, info.frames
+            channels = mapped_channels(users, channel_count)
+            resume_sample = len(done) * max(1, int(window_seconds * samplerate))
+            windows = iter(())
+            if resume_sample < frames:
+                with timer.stage('download'):
+                    first = Frame(audio_offset(read), 0)
+                    before, _ = locate_sample(
+                        read, first, Frame(storage.object_size(audio_key), frames), info, resume_sample
+                    )
+                    storage.download_range(audio_key, before.offset, audio_path)
+                f = stack.enter_context(open(audio_path, 'rb'))
+                data = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                resume_seconds = resume_sample / samplerate
+                windows = (
+                    (resume_seconds + start, window)
+                    for start, window in stack.enter_context(contextlib.closing(iter_flac_range_windows(
+                        data, info, frames - before.sample, channels, window_seconds,
+                        dtype=dtype, skip_frames=resume_sample - before.sample, overlap_seconds=overlap_seconds
+                    )))
+                )
+
+        # Progress in windows x mapped channels; the window before a tail no
+        # longer than the overlap has already heard it
+        window_frames = max(1, int(window_seconds * samplerate))
+        overlap_frames = int(overlap_seconds * samplerate)
+        windows_total = max(1, math.ceil((frames - overlap_frames) / window_frames))
+        store.update(job_id, {
+            'channels_total': len(channels),
+            'parts_total': windows_total * len(channels),
+            'parts_done': len(done) * len(channels),
+            'audio_seconds_done': min(frames / samplerate, len(done) * window_seconds),
+        })
+        for (start, window), transcripts, stats in transcribe_each_window(windows, samplerate, users, timer=timer):
+            with timer.stage('checkpoint'):
+                done.append(checkpoints.save(len(done), start, transcripts, stats))
+            # The overlap is counted by the next window, if there is one
+            heard = max((len(samples) for samples in window.values()), default=0)
+            if heard == window_frames + overlap_frames:
+                heard = window_frames
+            store.increment(job_id, {'parts_done': len(channels), 'audio_seconds_done': heard / samplerate})
+    return done
+
+def should_fan_out(status_data):
+    # A chord needs a broker and result backend, so only with Celery. Jobs
+    # uploaded as tracks have no FLAC frames to split on; their tracks are
+    # decoded in parallel instead.
+    min_seconds = getattr(settings, 'FANOUT_MIN_SECONDS', 0)
+    return (
+        bool(min_seconds)
+        and getattr(settings, 'QUEUE_BACKEND', 'celery') == 'celery'
+        and not status_data.get('audio_tracks')
+        and (status_data.get('audio_seconds') or 0) >= min_seconds
+    )
+
+def fan_out(store, storage, job_id, meta_data, template_names, started_at, timer=None, priority=None):
+    """
+    Splits the recording into overlapping time segments and starts one
+    ``transcribe_segment_task`` per segment and mapped channel, with
+    ``merge_segments_task`` as the chord body. Each subtask fetches only
+    its segment's byte range of the audio. All of them go to the
+    ``FANOUT_QUEUE``, which every worker pool consumes, at the job's
+    ``priority`` (by default that of its size class).
+
+    :return: False if the job is better processed in one piece.
+    """
+    timer = timer or metrics.StageTimer()
+    audio_key = f"jobs/{job_id}/audio.flac"
+    read = lambda start, length: storage.get_range(audio_key, start, length)
+    with timer.stage('plan'):
+        info = read_streaminfo(read(0, STREAMINFO_BYTES))
+        if info is None or not info.frames:
+            return False
+        channels = mapped_channels(meta_data.get('users', {}), info.channels)
+        segments = plan_segments(
+            read, storage.object_size(audio_key), info,
+            segment_seconds=getattr(settings, 'FANOUT_SEGMENT_SECONDS', 300.0),
+            overlap_seconds=getattr(settings, 'FANOUT_OVERLAP_SECONDS', 5.0)
+        )
+    if len(segments) < 2 or not channels:
+        return False
+
+    # Subtasks and the merge are small, whatever the length of the recording,
+    # so any free worker takes them, but they keep the place of their job
+    if priority is None:
+        priority = classify(estimate_cost(info)).priority
+    route = {'queue': getattr(settings, 'FANOUT_QUEUE', 'segments'), 'priority': priority}
+    header = [
+        transcribe_segment_task.si(job_id, segment._asdict(), channel, info._asdict()).set(**route)
+        for segment in segments
+        for channel in channels
+    ]
+    body = merge_segments_task.s(job_id, template_names, started_at.isoformat()).set(**route)
+    # Progress first, as the subtasks add to it; the fanout marker only once
+    # the chord is on its way, as a redelivered task skips jobs that have it.
+    # The merge adds this task's timings to those of the subtasks.
+    store.update(job_id, {
+        'channels_total': len(channels),
+        'parts_total': len(header),
+        'parts_done': 0,
+        'audio_seconds_done': 0.0,
+        'timings': timer.seconds,
+    })
+    chord(header)(body.on_error(fail_segments_task.s(job_id, started_at.isoformat())))
+    store.update(job_id, {'fanout': {'segments': len(segments), 'channels': len(channels), 'subtasks': len(header)}})
+    return True
+
+def partial_key(job_id, segment_index, channel):
+    return f"jobs/{job_id}/partial/{segment_index:04d}-{channel}.json"
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def transcribe_segment_task(job_id, segment, channel, audio_info):
+    """
+    Transcribes one channel of one segment of a fanned-out job. A retry
+    of a part that was already saved does nothing.
+
+    :return: S3 key of the partial transcripts.
+    """
+    storage = S3Storage()
+    segment = AudioSegment(**segment)
+    info = StreamInfo(**audio_info)
+    key = partial_key(job_id, segment.index, channel)
+    if storage.object_exists(key):
+        return key
+    timer = metrics.StageTimer()
+    with timer.stage('download'):
+        meta_data = storage.get_meta(job_id) or {}
+        data = storage.get_range(f"jobs/{job_id}/audio.flac", segment.offset, segment.length)
+    users = {
+        user_id: user_info for user_id, user_info in meta_data.get('users', {}).items()
+        if user_info.get('channel') == channel
+    }
+
+    stats = {}
+    transcriptions = transcribe_flac_range(
+        data, info, segment.first_sample, segment.frames, users, stats=stats, timer=timer
+    )
+    with timer.stage('upload'):
+        storage.upload_json(key, {
+            'segment': segment._asdict(),
+            'channel': channel,
+            'transcripts': transcriptions,
+            'stats': stats,
+            'timings': timer.seconds
         })
+    timer.observe()
+    # Each part advances the recording by its own time over the channels
+    owned_seconds = (segment.end_seconds or info.duration) - segment.start_seconds
+    channels = len(mapped_channels(meta_data.get('users', {}), info.channels)) or 1
+    get_status_store().increment(job_id, {'parts_done': 1, 'audio_seconds_done': owned_seconds / channels})
+    return key
+
+def combine_stats(stats_list):
+    stats = {'audio_seconds': 0.0, 'speech_seconds': 0.0}
+    for partial in stats_list:
+        stats['audio_seconds'] += partial.get('audio_seconds', 0.0)
+        stats['speech_seconds'] += partial.get('speech_seconds', 0.0)
+        for channel, counts in partial.get('cache', {}).items():
+            combined = stats.setdefault('cache', {}).setdefault(channel, {'hits': 0, 'misses': 0})
+            combined['hits'] += counts['hits']
+            combined['misses'] += counts['misses']
+    stats['skipped_seconds'] = stats['audio_seconds'] - stats['speech_seconds']
+    stats['speech_ratio'] = stats['speech_seconds'] / stats['audio_seconds'] if stats['audio_seconds'] else 0.0
+    return stats
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def merge_segments_task(partial_keys, job_id, template_names, started_at):
+    storage = S3Storage()
+    store = get_status_store()
+    started_at = datetime.fromisoformat(started_at)
+    timer = metrics.StageTimer()
+    try:
+        with timer.stage('download'):
+            partials = [storage.download_json(key) for key in partial_keys]
+            meta_data = storage.get_meta(job_id) or {}
+        with timer.stage('merge'):
+            transcriptions = merge_segment_transcripts(
+                partials, overlap_seconds=getattr(settings, 'FANOUT_OVERLAP_SECONDS', 5.0)
+            )
+        with timer.stage('upload'):
+            storage.save_transcripts(job_id, transcriptions)
+        save_results(storage, job_id, meta_data, transcriptions, template_names, timer=timer)
+        timings = add_timings(
+            (store.get(job_id) or {}).get('timings'), *(p.get('timings') for p in partials), timer.seconds
+        )
+        complete_job(store, storage, job_id, started_at, combine_stats(p['stats'] for p in partials), timings)
+    except Exception as e:
+        fail_job(store, storage, job_id, started_at, e)
         raise e
+    finally:
+        timer.observe()
+    delete_partials(storage, job_id, partial_keys)
+
+def delete_partials(storage, job_id, keys):
+    # The job is complete; partials left behind are removed with the job
+    # by cleanup_jobs, so a failed delete must not fail the task
+    try:
+        failed = storage.delete_keys(keys)
+    except (BotoCoreError, ClientError) as e:
+        logger.warning("Could not delete the partial transcripts of job %s: %s", job_id, e)
+        return
+    if failed:
+        logger.warning("Could not delete %d partial transcripts of job %s", len(failed), job_id)
+
+@shared_task
+def fail_segments_task(request, exc, traceback, job_id, started_at):
+    # Errback of the chord: a subtask failed, so the merge never runs
+    fail_job(get_status_store(), S3Storage(), job_id, datetime.fromisoformat(started_at), exc)
@@ -0,0 +1,70 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def async_upload_enabled():
+    return getattr(settings, 'JOB_ASYNC_UPLOAD', False)
+
+
+class ResultUploader:
+    """
+    Runs the final step of jobs (render, upload, completion) on a
+    background thread, so the worker process can start the next job's
+    inference meanwhile. Once ``max_pending`` uploads are waiting,
+    ``submit`` blocks, which bounds the transcripts held in memory.
+    """
+
+    def __init__(self, max_pending=1):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='result-upload')
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._futures = set()
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        future = self._executor.submit(fn, *args, **kwargs)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._futures.discard(future)
+        self._slots.release()
+        if future.exception() is not None:
+            logger.error("Background upload failed: %s", future.exception())
+
+    def drain(self, timeout=None):
+        """
+        Waits for the uploads that were submitted; called before the
+        process exits.
+        """
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures, timeout=timeout)
+
+
+_uploader = None
+_uploader_pid = None
+_uploader_lock = threading.Lock()
+
+
+def get_uploader():
+    global _uploader, _uploader_pid
+    with _uploader_lock:
+        # The thread of a forked parent does not exist in the child
+        if _uploader is None or _uploader_pid != os.getpid():
+            _uploader = ResultUploader(getattr(settings, 'JOB_ASYNC_UPLOAD_MAX_PENDING', 1))
+            _uploader_pid = os.getpid()
+        return _uploader
+
+
+def drain_uploads(timeout=None):
+    if _uploader is not None and _uploader_pid == os.getpid():
+        _uploader.drain(timeout)
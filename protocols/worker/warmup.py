@@ -0,0 +1,82 @@
+import json
+import logging
+import os
+import time
+import numpy as np
+from django.conf import settings
+from protocols.core.metrics import COLD_START_SECONDS, FIRST_JOB_SECONDS, WARMUP_SECONDS
+from protocols.core.utils import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Start-up timings of this process, in seconds; also exported as gauges
+metrics = {
+    'cold_start_seconds': None,
+    'warmup_seconds': None,
+    'first_job_seconds': None,
+}
+
+_warm = False
+
+
+def preload_engine():
+    """
+    Builds the configured engine and loads its weights. Called in the
+    worker's main process before the pool forks, so prefork children share
+    the weights copy-on-write instead of each loading their own copy.
+    """
+    start = time.perf_counter()
+    get_engine()
+    metrics['cold_start_seconds'] = time.perf_counter() - start
+    COLD_START_SECONDS.set(metrics['cold_start_seconds'])
+    logger.info("Preloaded STT engine in %.2fs", metrics['cold_start_seconds'])
+
+
+def warm_up_engine():
+    """
+    Runs one dummy inference so lazy initialisation (kernels, thread pools,
+    caches) happens before the first real job.
+    """
+    global _warm
+    start = time.perf_counter()
+    samplerate = 16000
+    get_engine().transcribe_channel(np.zeros(samplerate, dtype=np.float32), samplerate)
+    metrics['warmup_seconds'] = time.perf_counter() - start
+    WARMUP_SECONDS.set(metrics['warmup_seconds'])
+    _warm = True
+    logger.info("Warmed up STT engine in %.2fs", metrics['warmup_seconds'])
+
+
+def is_warm():
+    return _warm
+
+
+def record_job_duration(seconds):
+    if metrics['first_job_seconds'] is None:
+        metrics['first_job_seconds'] = seconds
+        FIRST_JOB_SECONDS.set(seconds)
+        logger.info("First job on this worker took %.2fs", seconds)
+        if is_warm():
+            mark_ready()
+
+
+def ready_file():
+    return getattr(settings, 'WORKER_READY_FILE', None)
+
+
+def clear_ready():
+    path = ready_file()
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def mark_ready():
+    """
+    Writes the readiness file (checked by the k8s readiness probe) together
+    with the start-up timings.
+    """
+    path = ready_file()
+    if not path:
+        return
+    with open(path, 'w') as f:
+        json.dump(dict(metrics, pid=os.getpid()), f)